@@ -1,22 +1,2623 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from tkinter.scrolledtext import ScrolledText
+import tkinter.font as tkfont
+import base64
+import codecs
+import concurrent.futures
+import hashlib
 import json
+import locale
+import logging
 import re
 import sys
+import mmap
+import queue
+import shutil
+import signal
 import subprocess
+import tempfile
 import threading
-from typing import Dict, List
+import xml.parsers.expat
+from time import perf_counter
 import os
-from ctypes import windll, byref, sizeof, c_int
-from pygments import highlight
-from pygments.lexers import get_lexer_for_filename
-from pygments.formatters import get_formatter_by_name
-from pygments.formatters import HtmlFormatter
-from html.parser import HTMLParser
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from pygments.formatter import Formatter
+from pygments.token import _TokenType, Name, Punctuation, Text, Token
+try:
+    from re import _parser as sre_parse, _compiler as sre_compile, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse, sre_compile, sre_constants
 
 WindowName = "FiveM Data Files Editor v2.8.2"
 
+# Logging: one logger per category, set up by configure_logging() from FDFE_LOG or --log
+LOG_CATEGORIES = ('highlight', 'scroll', 'io', 'run', 'search')
+highlight_log = logging.getLogger('fdfe.highlight')
+scroll_log = logging.getLogger('fdfe.scroll')
+io_log = logging.getLogger('fdfe.io')
+run_log = logging.getLogger('fdfe.run')
+search_log = logging.getLogger('fdfe.search')
+
+
+class Trace:
+    """Which categories log at debug level, as plain class attributes
+
+    Hot paths test `if Trace.scroll:` before building a debug message, so a disabled
+    category costs one attribute lookup.
+    """
+    highlight = scroll = io = run = search = False
+
+
+def configure_logging(spec=None, log_file=None):
+    """Set log levels from a spec such as "info", "debug" or "highlight:debug,io:info"
+
+    A bare level applies to every category; warnings and errors are always shown.
+    With log_file, records also go to a rotating file (1 MB, 3 backups).
+    """
+    levels = dict.fromkeys(LOG_CATEGORIES, logging.WARNING)
+    for item in filter(None, (spec or '').replace(' ', '').split(',')):
+        category, _, level = item.rpartition(':')
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            continue
+        for name in ([category] if category else LOG_CATEGORIES):
+            if name in levels:
+                levels[name] = level
+
+    root_log = logging.getLogger('fdfe')
+    root_log.handlers.clear()
+    root_log.propagate = False
+    formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        from logging.handlers import RotatingFileHandler
+        handlers.append(RotatingFileHandler(
+            log_file, maxBytes=1024 * 1024, backupCount=3, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        root_log.addHandler(handler)
+    root_log.setLevel(min(levels.values()))
+    for name, level in levels.items():
+        logging.getLogger(f'fdfe.{name}').setLevel(level)
+        setattr(Trace, name, level <= logging.DEBUG)
+
+
+class PerfStats:
+    """Timing spans for the editor's hot paths, the latest SIZE kept per stage
+
+    Stages are recorded with `with perf.span("stage"):` or record(); a sample can
+    carry an item count (e.g. tokens) so summary() can report a rate.
+    """
+
+    SIZE = 256
+
+    def __init__(self):
+        self.samples = {}  # stage -> deque of (seconds, items)
+
+    def record(self, stage, seconds, items=0):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = deque(maxlen=self.SIZE)
+        samples.append((seconds, items))
+
+    @contextmanager
+    def span(self, stage):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, perf_counter() - started)
+
+    def summary(self):
+        """Per stage: sample count, last/p50/p95/max in milliseconds and items per second"""
+        summary = {}
+        for stage, samples in list(self.samples.items()):
+            samples = list(samples)
+            times = sorted(seconds for seconds, _ in samples)
+            if not times:
+                continue
+            rank = lambda q: times[min(len(times) - 1, int(round(q * (len(times) - 1))))]
+            total = sum(times)
+            items = sum(count for _, count in samples)
+            summary[stage] = {
+                'count': len(times),
+                'last_ms': round(samples[-1][0] * 1000, 3),
+                'p50_ms': round(rank(0.5) * 1000, 3),
+                'p95_ms': round(rank(0.95) * 1000, 3),
+                'max_ms': round(times[-1] * 1000, 3),
+                'items_per_s': round(items / total) if items and total else None,
+            }
+        return summary
+
+
+perf = PerfStats()
+
+# Every tag the highlighters may apply and how it looks in the editor
+HIGHLIGHT_TAG_STYLES = {
+    'keyword': {'foreground': '#569CD6'},                  # Blue
+    'string': {'foreground': '#CE9178'},                   # Orange-red
+    'comment': {'foreground': '#6A9955'},                  # Green
+    'function': {'foreground': '#DCDCAA'},                 # Yellow
+    'function2': {'foreground': '#FFDD0D'},                # Bright Yellow
+    'number': {'foreground': '#B5CEA8'},                   # Light green
+    'category': {'foreground': '#C586C0'},                 # Purple (Liberty BASIC labels)
+    'handle': {'foreground': '#FF8C00'},                   # Orange (#handles)
+    'variable': {'foreground': '#00FFFF'},                 # Cyan (string variables)
+    'token_keyword_namespace': {'foreground': '#569CD6'},  # Blue
+    'token_name_namespace': {'foreground': '#4EC9B0'},     # Teal
+    'token_string': {'foreground': '#CE9178'},             # Orange
+    'token_comment': {'foreground': '#6A9955'},            # Green
+    'token_name': {'foreground': '#D4D4D4'},               # Light gray
+}
+# So a pass can clear them without touching "sel" or marks
+HIGHLIGHT_TAGS = tuple(HIGHLIGHT_TAG_STYLES)
+
+# Large files are highlighted in idle-time slices: each lexes for at most this many
+# milliseconds, over a window of at most this many lines, so scrolling stays responsive
+HIGHLIGHT_SLICE_MS = 15
+HIGHLIGHT_WINDOW_LINES = 2000
+# Passes on the lexing thread hand their tags back about this often
+HIGHLIGHT_THREAD_MS = 100
+
+# Tk's "tag add" takes any number of index pairs; this many are sent per call
+TAG_BATCH_PAIRS = 1000
+
+# Quiet time after the last key, click or edit before the editor refreshes
+CHANGE_DEBOUNCE_MS = 30
+# ...but never longer than this after the first one, so a held key still refreshes
+CHANGE_MAX_WAIT_MS = 4 * CHANGE_DEBOUNCE_MS
+
+# Optional start-up work runs this long after the window is created, once it is drawn
+STARTUP_DEFER_MS = 50
+
+# Files are read, decoded and inserted this many bytes at a time
+LOAD_CHUNK_BYTES = 256 * 1024
+
+# Byte order marks: (bom, codec to decode the rest, codec to save with); UTF-32 LE first
+# because its BOM starts with UTF-16 LE's
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le', 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be', 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8', 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le', 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be', 'utf-16'),
+)
+
+
+# Liberty BASIC rules, in precedence order: where several could start at the same place
+# the first one wins, so a keyword, label or number inside a string or comment stays
+# part of it. LIBERTY_BASIC_PATTERN joins them into one case-insensitive regex with a
+# named group per rule, so LibertyBasicLexer scans each line in a single pass.
+LIBERTY_BASIC_KEYWORDS = (
+    'bmpbutton', 'menu', 'textbox', 'calldll', 'loadbmp', 'windowwidth', 'windowheight',
+    'upperleftx', 'upperlefty', 'timer', 'wait', 'print', 'input', 'if', 'then', 'else',
+    'end', 'for', 'to', 'next', 'goto', 'gosub', 'return', 'dim', 'let', 'rem', 'open',
+    'close', 'read', 'data', 'restore', 'cls', 'locate', 'color', 'as',
+)
+LIBERTY_BASIC_RULES = (
+    ('comment', r"'.*$"),
+    ('string', r'".*?"'),
+    ('category', r'\[.*?\]'),
+    ('handle', r'#\w+'),
+    ('variable', r'[a-z]+\$'),
+    ('keyword', r'\b(?:%s)\b' % '|'.join(LIBERTY_BASIC_KEYWORDS)),
+    ('function', r'[a-z_][a-z0-9_]*(?=\s*\()'),
+    ('number', r'\b\d+\.?\d*\b'),
+)
+# Anything else is consumed a whole identifier, number or run of blanks and punctuation
+# (stopping where a rule could start) at a time, to keep the token count down
+LIBERTY_BASIC_PATTERN = '|'.join(f'(?P<{name}>{rule})' for name, rule in LIBERTY_BASIC_RULES) + \
+    r'|[a-z_]\w*|\d+|[^\w"\'\[#\n]+|\n|.'
+LIBERTY_BASIC_TOKENS = {name: getattr(Token.LibertyBasic, name.capitalize()) for name, rule in LIBERTY_BASIC_RULES}
+LIBERTY_BASIC_TAGS = {ttype: name for name, ttype in LIBERTY_BASIC_TOKENS.items()}
+
+
+def _liberty_basic_token(lexer, match):
+    yield match.start(), LIBERTY_BASIC_TOKENS.get(match.lastgroup, Text), match.group()
+
+
+_lexers = {}  # '.ext' (or a lower-cased file name Pygments matches whole) -> shared lexer or None
+
+# FiveM / GTA V file types Pygments does not know, with the Pygments lexer alias to use
+FIVEM_LEXER_ALIASES = {
+    '.meta': 'xml',  # handling, vehicles, carvariations, weapons... data files
+    '.ymt': 'xml',   # metadata exported to XML (CodeWalker / OpenIV)
+}
+
+
+def liberty_basic_lexer():
+    """Liberty BASIC as a one-rule RegexLexer, so .bas files use the incremental highlighter
+
+    The class is built on first use, so pygments.lexer is only imported once a
+    file needs highlighting.
+    """
+    lexer = _lexers.get('.bas')
+    if lexer is None:
+        from pygments.lexer import RegexLexer
+
+        class LibertyBasicLexer(RegexLexer):
+            name = 'Liberty BASIC'
+            aliases = ['libertybasic']
+            filenames = ['*.bas']
+            flags = re.IGNORECASE | re.MULTILINE
+            tokens = {'root': [(LIBERTY_BASIC_PATTERN, _liberty_basic_token)]}
+
+        lexer = _lexers['.bas'] = LibertyBasicLexer()
+    return lexer
+
+
+def lexer_for_filename(filename):
+    """The lexer the editor highlights a file with (None if there is none), cached by extension
+
+    Lexers only carry their options, so one instance per extension is shared by every
+    file and thread. Pygments' lexer registry is imported here, the first time one is needed.
+    """
+    name = os.path.basename(filename).lower()
+    extension = os.path.splitext(name)[1]
+    if extension == '.bas':
+        return liberty_basic_lexer()  # Pygments would pick QBasic or VB.NET
+    if name in _lexers:
+        return _lexers[name]
+    if extension and extension in _lexers:
+        return _lexers[extension]
+    if extension in FIVEM_LEXER_ALIASES:
+        from pygments.lexers import get_lexer_by_name
+        lexer = _lexers[extension] = get_lexer_by_name(FIVEM_LEXER_ALIASES[extension])
+        return lexer
+    from pygments.lexers import get_lexer_for_filename
+    from pygments.util import ClassNotFound
+    try:
+        lexer = get_lexer_for_filename(filename)
+    except ClassNotFound:
+        lexer = None
+    # Share it across the extension only if Pygments matched the extension, not the whole
+    # name (CMakeLists.txt is not every .txt file)
+    patterns = [pattern.lower() for pattern in lexer.filenames] if lexer else ()
+    key = extension if extension and (lexer is None or '*' + extension in patterns) else name
+    _lexers[key] = lexer
+    if Trace.highlight:
+        highlight_log.debug("Lexer for %s: %s", key, lexer.name if lexer else None)
+    return lexer
+
+
+def preload_lexers(extensions=('.lua', '.meta', '.xml', '.json', '.py', '.bas')):
+    """Import the Pygments lexers and build them (and their rule tables) for the common file types
+
+    Run on a background thread once the window is up, so opening the first file
+    does not stall on it.
+    """
+    for extension in extensions:
+        filename = 'preload' + extension
+        lexer = lexer_for_filename(filename)
+        if lexer is not None:
+            IncrementalHighlighter().reset(filename, lexer)  # fills lexer_rule_info()'s cache
+
+
+def _regex_lexer_types():
+    """(RegexLexer, LuaLexer), imported on first use"""
+    from pygments.lexer import RegexLexer
+    from pygments.lexers.scripting import LuaLexer
+    return RegexLexer, LuaLexer
+
+
+def split_lua_builtins(lexer, tokens):
+    """What LuaLexer.get_tokens_unprocessed() does to tokens from its rules, for callers that
+    run the rules themselves: builtins it does not know become names (split at a dot)"""
+    functions = lexer._functions
+    for index, ttype, value in tokens:
+        if ttype is Name.Builtin and value not in functions:
+            if '.' in value:
+                a, b = value.split('.')
+                yield index, Name, a
+                yield index + len(a), Punctuation, '.'
+                yield index + len(a) + 1, Name, b
+            else:
+                yield index, Name, value
+            continue
+        yield index, ttype, value
+
+
+# Token types the editor colours. A token takes the tag of its nearest ancestor in here,
+# so Comment.Single and Comment.Multiline are both 'token_comment'.
+TOKEN_TAG_BASES = {
+    Token.Keyword: 'token_keyword_namespace',  # Blue
+    Name.Namespace: 'token_name_namespace',    # Cyan
+    Name.Function: 'function',                 # Yellow
+    Name.Builtin: 'token_keyword_namespace',   # Blue (for built-in functions)
+    Token.Literal.String: 'token_string',      # Orange
+    Token.Comment: 'token_comment',            # Green
+    Token.Literal.Number: 'number',            # Light green
+    **LIBERTY_BASIC_TAGS,
+}
+PARENTHESES = object()  # tag of plain Punctuation, which depends on the token's text
+
+
+class TokenTags(dict):
+    """Token type -> tag (or None), worked out from TOKEN_TAG_BASES the first time a type is seen
+
+    After that a token costs one dict lookup; only plain Punctuation maps to
+    PARENTHESES and needs its text looked at (see token_tag).
+    """
+
+    def __missing__(self, ttype):
+        tag = None
+        if ttype is Punctuation:
+            tag = PARENTHESES
+        else:
+            node = ttype
+            while node is not None and tag is None:
+                tag = TOKEN_TAG_BASES.get(node)
+                node = node.parent
+        self[ttype] = tag
+        return tag
+
+
+TOKEN_TAGS = TokenTags()
+
+
+def token_tag(ttype, value):
+    """Map a Pygments token to the editor tag that colours it (None for plain text)"""
+    tag = TOKEN_TAGS[ttype]
+    if tag is PARENTHESES:
+        return 'function2' if value in '()' else 'token_name'  # Yellow parentheses, gray colons etc.
+    return tag
+
+
+class TkRangeFormatter(Formatter):
+    """Collects the editor's tag ranges from a Pygments token stream instead of writing markup
+
+    `ranges` maps each tag to flat [start, end, start, end, ...] character offsets, in
+    order, with touching ranges of a tag merged, ready for apply_tag_ranges(). It never
+    touches Tk, so passes on the lexing thread use it (one instance per pass) and it can
+    be checked without a display. With Pygments' own API:
+
+        formatter = TkRangeFormatter()
+        highlight(code, lexer, formatter)
+        formatter.ranges
+    """
+    name = 'Tk tag ranges'
+    aliases = ['tkranges']
+    filenames = []
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.ranges = {}
+
+    def get_style_defs(self, arg=''):
+        """Tcl commands configuring every tag the ranges can hold; `arg` is the text widget's path"""
+        return '\n'.join(f"{arg} tag configure {tag} "
+                         + ' '.join(f"-{option} {value}" for option, value in style.items())
+                         for tag, style in HIGHLIGHT_TAG_STYLES.items())
+
+    def format(self, tokensource, outfile):
+        """Pygments' entry point: (ttype, value) pairs, offsets counted from the first"""
+        def indexed(offset=0):
+            for ttype, value in tokensource:
+                yield offset, ttype, value
+                offset += len(value)
+        self.format_unprocessed(indexed())
+
+    def format_unprocessed(self, tokens):
+        """Collect ranges afresh from (index, ttype, value) tokens, as get_tokens_unprocessed() gives"""
+        self.ranges = {}
+        add_token = self.add_token
+        for index, ttype, value in tokens:
+            add_token(index, ttype, value)
+        return self.ranges
+
+    def add_token(self, index, ttype, value):
+        """Add one token's range; returns its tag (None for untagged text)"""
+        tag = TOKEN_TAGS[ttype]
+        if tag is PARENTHESES:
+            tag = token_tag(ttype, value)
+        if tag:
+            self.add(tag, index, index + len(value))
+        return tag
+
+    def add(self, tag, first, last):
+        """Add one range; ranges of a tag must come in order"""
+        offsets = self.ranges.get(tag)
+        if offsets is None:
+            self.ranges[tag] = [first, last]
+        elif offsets[-1] == first:
+            offsets[-1] = last
+        else:
+            offsets += (first, last)
+
+    def truncate(self, end):
+        """Drop everything from offset `end` on"""
+        for tag, offsets in list(self.ranges.items()):
+            while offsets and offsets[-2] >= end:
+                del offsets[-2:]
+            if not offsets:
+                del self.ranges[tag]
+            elif offsets[-1] > end:
+                offsets[-1] = end
+
+
+def _can_match_newline(items, dotall):
+    """Whether a parsed regex sequence can consume a newline"""
+    c = sre_constants
+    for op, av in items:
+        if op is c.LITERAL:
+            if av == 10:
+                return True
+        elif op is c.NOT_LITERAL:
+            if av != 10:
+                return True
+        elif op is c.ANY:
+            if dotall:
+                return True
+        elif op is c.IN:
+            negate = bool(av) and av[0][0] is c.NEGATE
+            matches = False
+            for set_op, set_av in av:
+                if set_op is c.LITERAL:
+                    matches = matches or set_av == 10
+                elif set_op is c.RANGE:
+                    matches = matches or set_av[0] <= 10 <= set_av[1]
+                elif set_op is c.CATEGORY:
+                    matches = matches or set_av in (c.CATEGORY_SPACE, c.CATEGORY_NOT_WORD,
+                                                    c.CATEGORY_NOT_DIGIT, c.CATEGORY_LINEBREAK)
+            if matches != negate:
+                return True
+        elif op in (c.MAX_REPEAT, c.MIN_REPEAT):
+            if _can_match_newline(av[2], dotall):
+                return True
+        elif op is c.SUBPATTERN:
+            if _can_match_newline(av[3], dotall or bool(av[1] & c.SRE_FLAG_DOTALL)):
+                return True
+        elif op is c.BRANCH:
+            if any(_can_match_newline(branch, dotall) for branch in av[1]):
+                return True
+        elif op in (c.GROUPREF, c.GROUPREF_EXISTS):
+            return True
+    return False
+
+
+def _nested_sequences(op, av):
+    """The sub-sequences of a parsed regex item"""
+    c = sre_constants
+    if op is c.SUBPATTERN:
+        return [av[3]]
+    if op is c.BRANCH:
+        return av[1]
+    if op in (c.MAX_REPEAT, c.MIN_REPEAT):
+        return [av[2]]
+    if op in (c.ASSERT, c.ASSERT_NOT):
+        return [av[1]]
+    return []
+
+
+def _block_opener_path(items, dotall):
+    """Return the regex items a match must get through to reach an `<anything, across lines>*`
+
+    That repeat is what lets a rule like `<!--.*?-->` or Lua's `--[[...]]` swallow a
+    whole multi-line block, so whether it matches depends on text far below. The
+    search descends into groups, alternatives and lookaheads, so for Lua's
+    `name(?=(--[[...]]|\s)*\()` the path is `name(?:(--[[...]]|\s))*?--[[`.
+    """
+    c = sre_constants
+    items = list(items)
+    for i, (op, av) in enumerate(items):
+        if op in (c.MAX_REPEAT, c.MIN_REPEAT) and av[1] is c.MAXREPEAT and _can_match_newline(av[2], dotall):
+            # Only a body that also eats ordinary text (not just `\s*`) can run on to a far closer
+            body = sre_compile.compile(av[2], c.SRE_FLAG_DOTALL if dotall else 0)
+            if any(body.fullmatch(char) for char in 'x-"<>[]'):
+                return items[:i]
+        for sequence in _nested_sequences(op, av):
+            inner_dotall = dotall or (op is c.SUBPATTERN and bool(av[1] & c.SRE_FLAG_DOTALL))
+            path = _block_opener_path(sequence, inner_dotall)
+            if path is not None:
+                if op in (c.MAX_REPEAT, c.MIN_REPEAT):
+                    # Earlier iterations may come first
+                    path = [(c.MIN_REPEAT, (0, c.MAXREPEAT, sequence))] + path
+                return items[:i] + path
+    return None
+
+
+def _has_far_lookahead(items, dotall):
+    """Whether a parsed regex has a lookahead that can scan on past the end of the line"""
+    c = sre_constants
+    for op, av in items:
+        if op in (c.ASSERT, c.ASSERT_NOT) and av[0] >= 0:
+            for inner_op, inner_av in av[1]:
+                if (inner_op in (c.MAX_REPEAT, c.MIN_REPEAT) and inner_av[1] is c.MAXREPEAT
+                        and _can_match_newline(inner_av[2], dotall)):
+                    return True
+        if any(_has_far_lookahead(sequence, dotall) for sequence in _nested_sequences(op, av)):
+            return True
+    return False
+
+
+_lexer_rule_cache = {}
+
+
+def lexer_rule_info(lexer):
+    """Find the rules of a RegexLexer whose outcome can depend on text below the current line
+
+    Returns {state: (openers, first_peek)}: openers lists (rule_index, opener_match)
+    for rules that can lex a whole multi-line block (`<!--.*?-->`, Lua `--[[...]]`), and
+    first_peek is the index of the first rule with a far-reaching lookahead (Lua's
+    `name (` call detection), or None.
+    """
+    cls = type(lexer)
+    if cls not in _lexer_rule_cache:
+        info = {}
+        for state, rules in lexer._tokens.items():
+            openers = []
+            first_peek = None
+            for index, (rexmatch, action, new_state) in enumerate(rules):
+                pattern = rexmatch.__self__
+                dotall = bool(pattern.flags & sre_constants.SRE_FLAG_DOTALL)
+                parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+                path = _block_opener_path(parsed, dotall)
+                # The opener must contain literal text, or every position would look unclosed
+                if path and any(op is sre_constants.LITERAL for op, av in path):
+                    opener = sre_compile.compile(sre_parse.SubPattern(parsed.state, path), pattern.flags)
+                    openers.append((index, opener.match))
+                if first_peek is None and _has_far_lookahead(parsed, dotall):
+                    first_peek = index
+            if openers or first_peek is not None:
+                info[state] = (openers, first_peek)
+        _lexer_rule_cache[cls] = info
+    return _lexer_rule_cache[cls]
+
+
+class ChunkedTextReader:
+    """Read a text file LOAD_CHUNK_BYTES at a time, memory-mapped where possible
+
+    The encoding comes from a byte order mark, else UTF-8 if the first chunk decodes
+    as UTF-8, else the locale's encoding. Decoding is strict: bytes further on that
+    do not fit start the read over in the fallback encoding (see `restarted`) rather
+    than being replaced, which a save would write back. Line endings are turned
+    into "\n" on the fly, including a "\r\n" split across two chunks.
+    """
+
+    def __init__(self, filename, chunk_size=LOAD_CHUNK_BYTES):
+        self.chunk_size = chunk_size
+        self.file = open(filename, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            self.data = None  # empty files (and some file systems) cannot be mapped
+        self.position = 0
+        self.done = False
+        self.newline = None  # first line ending seen in the file
+        self.restarted = False  # set when reading started over in another encoding
+        self._pending_cr = ''
+
+        head = self._read(4)
+        self.position = 0
+        for bom, encoding, save_encoding in BYTE_ORDER_MARKS:
+            if head.startswith(bom):
+                self.position = len(bom)
+                break
+        else:
+            encoding = save_encoding = self._sniff_encoding()
+        self.encoding = encoding
+        self.save_encoding = save_encoding
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+
+    def _read(self, size):
+        if self.data is not None:
+            raw = self.data[self.position:self.position + size]
+        else:
+            self.file.seek(self.position)
+            raw = self.file.read(size)
+        self.position += len(raw)
+        return raw
+
+    def _sniff_encoding(self):
+        sample = self._read(self.chunk_size)
+        self.position = 0
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(sample, False)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            return self._fallback_encoding()
+
+    @staticmethod
+    def _fallback_encoding(failed='utf-8'):
+        """The locale's encoding, or Latin-1 (which decodes any bytes) if that is what failed"""
+        fallback = locale.getpreferredencoding(False)
+        return 'latin-1' if codecs.lookup(fallback).name == codecs.lookup(failed).name else fallback
+
+    def _restart(self, error):
+        """Read from the start again in the fallback encoding after `error`"""
+        encoding = self._fallback_encoding(self.encoding)
+        io_log.warning("Not %s at byte %d (%s); reading again as %s",
+                       self.encoding, self.position - len(error.object) + error.start,
+                       error.reason, encoding)
+        self.encoding = self.save_encoding = encoding
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.position = 0
+        self.newline = None
+        self._pending_cr = ''
+        self.restarted = True
+
+    @property
+    def progress(self):
+        """Fraction of the file read so far"""
+        return self.position / self.size if self.size else 1.0
+
+    def read_chunk(self):
+        """Return the next piece of text ("" once the end is reached)"""
+        with perf.span('open read'):
+            raw = self._read(self.chunk_size)
+        final = self.position >= self.size
+        with perf.span('open decode'):
+            try:
+                text = self._pending_cr + self.decoder.decode(raw, final)
+            except UnicodeDecodeError as e:
+                self._restart(e)
+                return self.read_chunk()
+            self._pending_cr = ''
+            if not final and text.endswith('\r'):
+                text, self._pending_cr = text[:-1], '\r'
+            if self.newline is None:
+                match = re.search('\r\n|\r|\n', text)
+                if match:
+                    self.newline = match.group()
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        self.done = final
+        return text
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Read once at import: os.umask() can only be read by setting it, which is not thread-safe
+FILE_UMASK = _current_umask()
+
+
+def write_file_atomically(filename, text, encoding=None, newline=None):
+    """Write text through a temporary file in the same folder, fsync it and rename it over filename
+
+    If the process dies mid-write the old file is left intact (at worst next to a stray
+    temporary file) instead of truncated. A symlink is followed, so its target gets the
+    new text and the link stays a link. `encoding` and `newline` are as for open().
+    """
+    filename = os.path.realpath(filename)
+    folder = os.path.dirname(filename)
+    fd, temp_name = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(filename)}.", suffix='.tmp')
+    try:
+        with open(fd, 'w', encoding=encoding, newline=newline) as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            shutil.copymode(filename, temp_name)  # mkstemp creates the file private
+        except OSError:
+            os.chmod(temp_name, 0o666 & ~FILE_UMASK)  # a new file: what open() would give it
+        os.replace(temp_name, filename)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable
+        folder_fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(folder_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(folder_fd)
+
+
+class LineIndex:
+    """Start offsets of the text widget's lines, kept in step with its edits
+
+    Turns character offsets (as found by a lexer or regex) into Tk "line.col" indices
+    in pure Python, so highlighting makes no index() round-trips. Line lengths are
+    stored (newline included); the running start offsets are refreshed lazily from
+    the first line an edit touched.
+    """
+
+    def __init__(self, text='\n'):
+        self.reset(text)
+
+    def reset(self, text):
+        """Rebuild the table from a snapshot of the whole buffer"""
+        lines = text.split('\n')
+        self.lengths = array('q', [len(line) + 1 for line in lines[:-1]])
+        if lines[-1]:
+            self.lengths.append(len(lines[-1]))
+        self.starts = array('q', [0])
+        self._valid = 1  # starts[:_valid] are up to date
+
+    def line_count(self):
+        return len(self.lengths)
+
+    def _refresh(self):
+        valid = self._valid
+        if valid > len(self.lengths):
+            return
+        starts = self.starts
+        base = starts[valid - 1]
+        del starts[valid - 1:]
+        starts.extend(accumulate(self.lengths[valid - 1:], initial=base))
+        self._valid = len(self.lengths) + 1
+
+    def offset(self, line):
+        """Character offset of the start of a line"""
+        self._refresh()
+        return self.starts[line - 1]
+
+    def index(self, offset):
+        """Tk index of a character offset"""
+        self._refresh()
+        line = bisect_right(self.starts, offset) - 1
+        return f"{line + 1}.{offset - self.starts[line]}"
+
+    def note_insert(self, line, col, text):
+        """Record that text was inserted at line.col"""
+        parts = text.split('\n')
+        lengths = self.lengths
+        if len(parts) == 1:
+            lengths[line - 1] += len(text)
+        else:
+            tail = lengths[line - 1] - col
+            lengths[line - 1:line] = array('q', [col + len(parts[0]) + 1]
+                                           + [len(part) + 1 for part in parts[1:-1]]
+                                           + [tail + len(parts[-1])])
+        self._valid = min(self._valid, line)
+
+    def note_delete(self, first, last):
+        """Record that the text between two (line, col) positions was deleted"""
+        (line1, col1), (line2, col2) = first, last
+        lengths = self.lengths
+        lengths[line1 - 1:line2] = array('q', [col1 + lengths[line2 - 1] - col2])
+        self._valid = min(self._valid, line1)
+
+
+class FindIndex:
+    """Every match of a find pattern, kept per line so an edit rescans only the lines it touched
+
+    The pattern runs once over a snapshot of the buffer; matches are stored as (col, end)
+    pairs per line, with running match counts for "n of N" and bisection. Matches never
+    span lines and empty matches are skipped.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.key = None  # (needle, regex, match case) the matches were found for
+        self.pattern = None
+        self.lines = []  # per line: flat [col, end, col, end, ...]
+        self.dirty = None  # (first, last) lines still to rescan
+        self._counts = None  # matches before each line, rebuilt lazily
+
+    @staticmethod
+    def compile(needle, regex=False, match_case=False):
+        """Compile the dialog's search text; raises re.error on a bad expression"""
+        flags = re.MULTILINE if match_case else re.MULTILINE | re.IGNORECASE
+        return re.compile(needle if regex else re.escape(needle), flags)
+
+    def _matches(self, text):
+        """(line, line start, match) for each match in text, lines counted from 0"""
+        starts = [0]
+        starts += [m.end() for m in re.finditer('\n', text)]
+        pattern = self.pattern
+        pos = 0
+        while pos <= len(text):
+            match = pattern.search(text, pos)
+            if match is None:
+                return
+            first, last = match.span()
+            line = bisect_right(starts, first) - 1
+            base = starts[line]
+            if line + 1 < len(starts) and last >= starts[line + 1]:
+                # Ran into the next line: search the rest of this one as if it ended there
+                pos = starts[line + 1]
+                for match in pattern.finditer(text, first, pos - 1):
+                    if match.end() > match.start():
+                        yield line, base, match
+                continue
+            if last > first:
+                yield line, base, match
+            pos = last if last > first else last + 1
+
+    def _scan(self, text):
+        """Matches in each line of text, as flat (col, end) lists"""
+        lines = [[] for _ in range(text.count('\n') + 1)]
+        for line, base, match in self._matches(text):
+            first, last = match.span()
+            lines[line] += (first - base, last - base)
+        return lines
+
+    def replacement(self, text, template, regex=False):
+        """Replace every match in a snapshot of the buffer
+
+        Returns the number of matches and the first and last line they were on, with
+        the new text of those lines. With `regex` the template may use backreferences.
+        """
+        count = 0
+        pieces = []
+        pos = first_line = last_line = None
+        for line, base, match in self._matches(text):
+            if pos is None:
+                pos, first_line = base, line + 1
+            pieces += (text[pos:match.start()], match.expand(template) if regex else template)
+            pos = match.end()
+            last_line = line + 1
+            count += 1
+        if not count:
+            return 0, None, None, ''
+        end = text.find('\n', pos)
+        pieces.append(text[pos:] if end < 0 else text[pos:end])
+        return count, first_line, last_line, ''.join(pieces)
+
+    def search(self, key, pattern, text):
+        """Find every match of a compiled pattern in a snapshot of the whole buffer"""
+        self.key, self.pattern = key, pattern
+        self.lines = self._scan(text)
+        self.dirty = None
+        self._counts = None
+
+    def _mark(self, first, last):
+        if self.dirty:
+            first, last = min(first, self.dirty[0]), max(last, self.dirty[1])
+        self.dirty = (first, last)
+
+    def note_insert(self, line, text):
+        """Record that text was inserted on a line"""
+        if self.key is None:
+            return
+        added = text.count('\n')
+        if added:
+            self.lines[line:line] = [[] for _ in range(added)]
+            if self.dirty and self.dirty[1] > line:
+                self.dirty = (self.dirty[0], self.dirty[1] + added)
+        self._mark(line, line + added)
+        self._counts = None
+
+    def note_delete(self, first, last):
+        """Record that the text from line `first` through line `last` was joined into one line"""
+        if self.key is None:
+            return
+        if last > first:
+            del self.lines[first:last]
+            if self.dirty:
+                below = lambda line: line if line <= first else max(first, line - (last - first))
+                self.dirty = (below(self.dirty[0]), below(self.dirty[1]))
+        self._mark(first, first)
+        self._counts = None
+
+    def rescan(self, get_lines):
+        """Re-run the pattern over the edited lines; get_lines(first, last) returns their text"""
+        if not self.dirty:
+            return
+        first, last = self.dirty
+        last = min(last, len(self.lines))
+        self.dirty = None
+        if first > last:
+            return
+        found = self._scan(get_lines(first, last))
+        self.lines[first - 1:last] = found[:last - first + 1]
+        self._counts = None
+
+    def counts(self):
+        if self._counts is None:
+            self._counts = array('q', accumulate(map(len, self.lines), initial=0))
+        return self._counts
+
+    def total(self):
+        return self.counts()[-1] // 2
+
+    def match(self, number):
+        """(line, col, end) of the match with a 0-based number"""
+        counts = self.counts()
+        line = bisect_right(counts, 2 * number) - 1
+        at = 2 * number - counts[line]
+        return line + 1, self.lines[line][at], self.lines[line][at + 1]
+
+    def nearest(self, line, col, backwards=False):
+        """Number of the first match starting after line.col (or the last before it), wrapping around"""
+        total = self.total()
+        if not total:
+            return None
+        cols = self.lines[line - 1][0::2] if line <= len(self.lines) else []
+        if backwards:
+            number = self.counts()[line - 1] // 2 + bisect_left(cols, col) - 1
+        else:
+            number = self.counts()[line - 1] // 2 + bisect_right(cols, col)
+        return number % total
+
+    def in_lines(self, first, last):
+        """(line, col, end) of each match from line `first` through line `last`"""
+        for line in range(max(first, 1), min(last, len(self.lines)) + 1):
+            cols = self.lines[line - 1]
+            for at in range(0, len(cols), 2):
+                yield line, cols[at], cols[at + 1]
+
+
+# Find in Files over an opened folder (File > Open Folder)
+WORKSPACE_EXTENSIONS = ('.lua', '.meta', '.xml', '.json', '.txt')
+SEARCH_BATCH_FILES = 32  # files per process pool task
+SEARCH_LINE_CHARS = 200  # characters of a matching line shown in the results
+
+
+def workspace_files(folder):
+    """(path, mtime_ns, size) of each searchable file under a folder, skipping hidden folders"""
+    for top, folders, names in os.walk(folder):
+        folders[:] = [name for name in folders if not name.startswith('.')]
+        for name in names:
+            if not name.lower().endswith(WORKSPACE_EXTENSIONS):
+                continue
+            path = os.path.join(top, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield path, stat.st_mtime_ns, stat.st_size
+
+
+def _batches(items, size=SEARCH_BATCH_FILES):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def _read_for_search(path):
+    with open(path, 'rb') as file:
+        return file.read().decode('utf-8-sig', errors='replace')
+
+
+def trigram_code(gram):
+    """A 3-character string packed into 32 bits
+
+    Latin-1 trigrams are stored exactly; others are hashed above them. A clash only
+    makes a file a candidate it should not be, and search_files() weeds those out.
+    """
+    a, b, c = map(ord, gram)
+    if a | b | c < 256:
+        return a << 16 | b << 8 | c
+    return 0x1000000 + ((a * 0x110000 + b) * 0x110000 + c) % 0xFF000000
+
+
+def trigram_codes(text):
+    """Sorted array('I') of the codes of the distinct lower-cased trigrams in text"""
+    text = text.lower()
+    return array('I', sorted(map(trigram_code, {text[at:at + 3] for at in range(len(text) - 2)})))
+
+
+def file_trigrams(paths):
+    """Process pool task: (path, trigram_codes() as bytes) for each readable file"""
+    found = []
+    for path in paths:
+        try:
+            text = _read_for_search(path)
+        except OSError:
+            continue
+        found.append((path, trigram_codes(text).tobytes()))
+    return found
+
+
+def search_files(paths, source, flags):
+    """Process pool task: (path, [(line number, line text)]) for each file with a match"""
+    pattern = re.compile(source, flags)
+    found = []
+    for path in paths:
+        try:
+            text = _read_for_search(path)
+        except OSError:
+            continue
+        if not pattern.search(text):
+            continue
+        hits = [(number, line.strip()[:SEARCH_LINE_CHARS])
+                for number, line in enumerate(text.splitlines(), 1) if pattern.search(line)]
+        if hits:
+            found.append((path, hits))
+    return found
+
+
+class TrigramIndex:
+    """Lower-cased trigrams of each file under a folder, kept on disk between sessions
+
+    Each file's trigrams are a sorted array('I') of trigram_code()s, 4 bytes apiece.
+    Entries are keyed by path and reused while the file's mtime and size stay the same,
+    so refreshing only reads new and changed files. candidates() narrows a plain-text
+    search down to the files holding every trigram of the search text.
+    """
+
+    VERSION = 2
+
+    def __init__(self, folder, filename=None):
+        self.folder = os.path.abspath(folder)
+        self.filename = filename or self.default_filename(self.folder)
+        self.files = {}  # path -> (mtime_ns, size, sorted array('I') of trigram codes)
+        self.lock = threading.Lock()  # held by the search thread while it refreshes
+
+    @staticmethod
+    def default_filename(folder):
+        cache = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+        digest = hashlib.sha1(os.path.normcase(folder).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(cache, 'FDFE', f"trigrams-{digest}.json")
+
+    def load(self):
+        """Read the saved index; a missing, unreadable or outdated one is simply rebuilt"""
+        try:
+            with open(self.filename, encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != self.VERSION or data.get('folder') != self.folder:
+            return
+        self.files = {path: (mtime, size, self.codes(base64.b64decode(codes), stored=True))
+                      for path, (mtime, size, codes) in data['files'].items()}
+
+    @staticmethod
+    def codes(raw, stored=False):
+        """The array file_trigrams() sent as bytes (or, `stored`, save() wrote little-endian)"""
+        codes = array('I')
+        codes.frombytes(raw)
+        if stored and sys.byteorder == 'big':
+            codes.byteswap()
+        return codes
+
+    def save(self):
+        def little_endian(codes):
+            if sys.byteorder == 'big':
+                codes = array('I', codes)
+                codes.byteswap()
+            return base64.b64encode(codes.tobytes()).decode('ascii')
+
+        data = {
+            'version': self.VERSION,
+            'folder': self.folder,
+            'files': {path: [mtime, size, little_endian(codes)]
+                      for path, (mtime, size, codes) in self.files.items()},
+        }
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        write_file_atomically(self.filename, json.dumps(data), encoding='utf-8')
+
+    def stale(self, listing):
+        """Forget files missing from `listing` ((path, mtime_ns, size)); return those to (re)index"""
+        current = {path: (mtime, size) for path, mtime, size in listing}
+        for path in [path for path in self.files if path not in current]:
+            del self.files[path]
+        return [path for path, stamp in current.items() if self.files.get(path, (None, None))[:2] != stamp]
+
+    def candidates(self, needle):
+        """Files that may contain `needle` (case-insensitively)"""
+        wanted = trigram_codes(needle)
+
+        def holds_all(codes):
+            end = len(codes)
+            for code in wanted:
+                at = bisect_left(codes, code)
+                if at == end or codes[at] != code:
+                    return False
+            return True
+        return [path for path, (_, _, codes) in self.files.items() if holds_all(codes)]
+
+
+class WorkspaceSearch:
+    """One Find in Files run on a background thread
+
+    Brings the trigram index up to date, then searches the candidate files in a
+    process pool. Messages are put on `results` as they are ready: ('hits', [(path,
+    [(line, text)])]) for each finished batch, then ('done', stats), where stats
+    holds an 'error' message if the search failed.
+    """
+
+    def __init__(self, pool, index, needle, regex=False, match_case=False):
+        self.pool = pool
+        self.index = index
+        self.needle = needle
+        self.regex = regex
+        self.flags = 0 if match_case else re.IGNORECASE
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _run(self):
+        started = perf_counter()
+        stats = {'indexed': 0, 'searched': 0, 'files': 0, 'matches': 0}
+        try:
+            source = self.needle if self.regex else re.escape(self.needle)
+            with self.index.lock:
+                listing = list(workspace_files(self.index.folder))
+                stamps = {path: (mtime, size) for path, mtime, size in listing}
+                stale = self.index.stale(listing)
+                if stale:
+                    with perf.span('index files'):
+                        for found in self.pool.map(file_trigrams, _batches(stale)):
+                            for path, codes in found:
+                                self.index.files[path] = stamps[path] + (self.index.codes(codes),)
+                            if self.cancelled.is_set():
+                                return
+                    self.index.save()
+                stats['indexed'] = len(stale)
+                # A regex has no fixed text to look up, so every file is a candidate
+                candidates = list(self.index.files) if self.regex else self.index.candidates(self.needle)
+            stats['searched'] = len(candidates)
+            if Trace.search:
+                search_log.debug("%r: %d files re-indexed, %d candidates", self.needle, len(stale), len(candidates))
+
+            futures = [self.pool.submit(search_files, batch, source, self.flags) for batch in _batches(candidates)]
+            for future in concurrent.futures.as_completed(futures):
+                if self.cancelled.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    return
+                found = future.result()
+                stats['files'] += len(found)
+                stats['matches'] += sum(len(hits) for _, hits in found)
+                if found:
+                    self.results.put(('hits', found))
+        except Exception as e:
+            search_log.error("Find in Files failed: %s", e)
+            stats['error'] = str(e)
+        finally:
+            stats['ms'] = round((perf_counter() - started) * 1000)
+            self.results.put(('done', stats))
+
+
+# fxmanifest.lua / __resource.lua analysis (View > Resource Graph)
+MANIFEST_NAMES = ('fxmanifest.lua', '__resource.lua')  # in order of preference
+MANIFEST_FILE_DIRECTIVES = frozenset((
+    'client_script', 'client_scripts', 'server_script', 'server_scripts',
+    'shared_script', 'shared_scripts', 'file', 'files', 'ui_page', 'loadscreen'))
+MANIFEST_DEPENDENCY_DIRECTIVES = frozenset(('dependency', 'dependencies'))
+MANIFEST_SOURCE_EXTENSIONS = ('.lua', '.js', '.meta', '.xml', '.json')  # reported if nothing loads them
+MANIFEST_TOKEN = re.compile(r"""
+    (?P<comment>--\[(?P<ceq>=*)\[.*?\](?P=ceq)\] | --[^\n]*)
+  | (?P<string>'(?P<sq>(?:\\.|[^'\\\n])*)' | "(?P<dq>(?:\\.|[^"\\\n])*)"
+               | \[(?P<leq>=*)\[(?P<long>.*?)\](?P=leq)\])
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<open>\{) | (?P<close>\})
+""", re.S | re.X)
+_MANIFEST_GLOBS = {}
+
+
+def parse_manifest(text):
+    """Directives of an fxmanifest.lua / __resource.lua as (name, [string values], line) tuples
+
+    Handles the forms manifests are written in: `key 'value'`, `key 'a' 'b'`,
+    `key { 'a', 'b' }` and `key({ ... })`. Names inside tables are not directives.
+    """
+    directives = []
+    current = None
+    depth = 0
+    line, pos = 1, 0
+    for match in MANIFEST_TOKEN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'name':
+            if depth == 0:
+                line += text.count('\n', pos, match.start())
+                pos = match.start()
+                current = (match.group('name'), [], line)
+                directives.append(current)
+        elif kind == 'string':
+            if current is not None:
+                sq, dq, long = match.group('sq', 'dq', 'long')
+                current[1].append(sq if sq is not None else dq if dq is not None else long)
+        elif kind == 'open':
+            depth += 1
+        elif kind == 'close':
+            depth = max(0, depth - 1)
+    return [directive for directive in directives if directive[1]]
+
+
+def manifest_glob(pattern):
+    """Regex for a manifest file pattern: '*' stays inside a folder, '**' crosses folders"""
+    regex = _MANIFEST_GLOBS.get(pattern)
+    if regex is None:
+        source = ''.join('(?:.*/)?' if part == '**/' else '.*' if part == '**' else
+                         '[^/]*' if part == '*' else '[^/]' if part == '?' else re.escape(part)
+                         for part in re.split(r'(\*\*/?|\*|\?)', pattern))
+        regex = _MANIFEST_GLOBS[pattern] = re.compile(source)
+    return regex
+
+
+class ResourceManifest:
+    """What one resource's manifest declares: dependencies, data files and file patterns"""
+
+    def __init__(self, path, text):
+        self.path = path
+        self.name = os.path.basename(os.path.dirname(path))
+        self.dependencies = []
+        self.provides = []
+        self.data_files = []  # (data file type, pattern, line)
+        self.file_patterns = []  # (directive, pattern, line)
+        for directive, values, line in parse_manifest(text):
+            if directive in MANIFEST_DEPENDENCY_DIRECTIVES:
+                # '/server:5181', '/onesync' and the like are server features, not resources
+                self.dependencies += [value for value in values if not value.startswith('/')]
+            elif directive == 'provide':
+                self.provides += values
+            elif directive == 'data_file' and len(values) > 1:
+                self.data_files += [(values[0], value, line) for value in values[1:]]
+            elif directive in MANIFEST_FILE_DIRECTIVES:
+                self.file_patterns += [(directive, value, line) for value in values]
+
+
+def _resource_files(folder):
+    """Paths of a resource's files relative to its folder, with '/' separators"""
+    found = []
+    for top, folders, names in os.walk(folder):
+        folders[:] = [name for name in folders if not name.startswith('.') and name != 'node_modules']
+        prefix = os.path.relpath(top, folder).replace(os.sep, '/')
+        prefix = '' if prefix == '.' else prefix + '/'
+        found += [prefix + name for name in names]
+    return tuple(sorted(found))
+
+
+def _pattern_matches(pattern, files, file_set):
+    pattern = pattern.replace('\\', '/').lstrip('/')
+    if pattern.startswith('./'):
+        pattern = pattern[2:]
+    if not any(char in pattern for char in '*?'):
+        return [pattern] if pattern in file_set else []
+    regex = manifest_glob(pattern)
+    return [name for name in files if regex.fullmatch(name)]
+
+
+class ResourceGraph:
+    """The resources under a folder, with their dependencies and file references
+
+    Parsed manifests are cached by path and mtime, and the file matches of a resource
+    by its manifest's mtime and file list, so a rescan only re-reads what changed.
+    Resource folders are listed on every scan to notice added and removed files.
+    """
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        self.resources = {}  # resource name -> report (see scan())
+        self.parsed = 0  # manifests read by the last scan
+        self._cache = {}  # manifest path -> (mtime_ns, ResourceManifest, files, matches)
+
+    def _match(self, manifest, files):
+        """Own files the manifest loads, patterns matching nothing and data files missing from files{}"""
+        file_set = set(files)
+        referenced, missing, unlisted = set(), [], []
+        listed = set()
+        for directive, pattern, line in manifest.file_patterns:
+            if pattern.startswith('@'):
+                continue  # another resource's file, checked once every resource is known
+            hits = _pattern_matches(pattern, files, file_set)
+            if hits:
+                referenced.update(hits)
+                if directive in ('file', 'files'):
+                    listed.update(hits)
+            else:
+                missing.append((directive, pattern, line))
+        for kind, pattern, line in manifest.data_files:
+            hits = _pattern_matches(pattern, files, file_set)
+            if not hits:
+                missing.append((f"data_file {kind}", pattern, line))
+            elif not listed.issuperset(hits):
+                # The game only sees data files that are also shipped with files {}
+                unlisted.append((kind, pattern, line))
+            referenced.update(hits)
+        return referenced, missing, unlisted
+
+    def scan(self):
+        """Re-read changed manifests and rebuild self.resources
+
+        Each report holds 'manifest', 'folder', 'dependencies', 'missing_dependencies',
+        'required_by', 'data_files', 'missing_files', 'unlisted_data_files' and
+        'unreferenced' (source files nothing loads). Lines are manifest line numbers.
+        """
+        cache, self._cache = self._cache, {}
+        self.parsed = 0
+        manifests = []
+        for top, folders, names in os.walk(self.folder):
+            folders[:] = [name for name in folders if not name.startswith('.')]
+            name = next((name for name in MANIFEST_NAMES if name in names), None)
+            if name is None:
+                continue
+            folders[:] = []  # resources do not nest
+            path = os.path.join(top, name)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            files = _resource_files(top)
+            cached = cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                manifest = cached[1]
+                matches = cached[3] if cached[2] == files else self._match(manifest, files)
+            else:
+                try:
+                    with open(path, 'rb') as file:
+                        text = file.read().decode('utf-8-sig', errors='replace')
+                except OSError as e:
+                    io_log.warning("Could not read %s: %s", path, e)
+                    continue
+                manifest = ResourceManifest(path, text)
+                matches = self._match(manifest, files)
+                self.parsed += 1
+            self._cache[path] = (mtime, manifest, files, matches)
+            manifests.append((manifest, files, matches))
+
+        resources = {}
+        provided = {}
+        for manifest, files, (referenced, missing, unlisted) in manifests:
+            if manifest.name in resources:
+                io_log.warning("Resource %s found twice; using %s", manifest.name, resources[manifest.name]['manifest'])
+                continue
+            resources[manifest.name] = {
+                'manifest': manifest.path,
+                'folder': os.path.dirname(manifest.path),
+                'dependencies': list(dict.fromkeys(manifest.dependencies)),
+                'missing_dependencies': [],
+                'required_by': [],
+                'data_files': [(kind, pattern, line) for kind, pattern, line in manifest.data_files],
+                'missing_files': list(missing),
+                'unlisted_data_files': unlisted,
+                '_files': files,
+                '_referenced': set(referenced),
+            }
+            for name in manifest.provides:
+                provided.setdefault(name, manifest.name)
+
+        # '@resource/path' entries load another resource's files (and depend on it)
+        for manifest, _, _ in manifests:
+            report = resources.get(manifest.name)
+            if report is None or report['manifest'] != manifest.path:
+                continue
+            for directive, pattern, line in manifest.file_patterns:
+                if not pattern.startswith('@'):
+                    continue
+                target, _, pattern = pattern[1:].partition('/')
+                if target not in report['dependencies']:
+                    report['dependencies'].append(target)
+                other = resources.get(target)
+                if other is None:
+                    continue
+                hits = _pattern_matches(pattern, other['_files'], set(other['_files']))
+                if hits:
+                    other['_referenced'].update(hits)
+                else:
+                    report['missing_files'].append((directive, f"@{target}/{pattern}", line))
+
+        for name, report in resources.items():
+            for dependency in report['dependencies']:
+                target = dependency if dependency in resources else provided.get(dependency)
+                if target is None:
+                    report['missing_dependencies'].append(dependency)
+                elif name not in resources[target]['required_by']:
+                    resources[target]['required_by'].append(name)
+        for report in resources.values():
+            manifest_name = os.path.basename(report['manifest'])
+            referenced = report.pop('_referenced')
+            report['unreferenced'] = [path for path in report.pop('_files')
+                                      if path not in referenced and path != manifest_name
+                                      and path.endswith(MANIFEST_SOURCE_EXTENSIONS)
+                                      and not path.startswith('stream/')]
+        self.resources = resources
+        return resources
+
+
+# Background validation of .meta / .xml buffers
+META_VALIDATE_DELAY_MS = 400  # quiet time after an edit before validating again
+META_VALIDATE_LINES = 5000  # lines fed to the parser per idle slice of a full pass
+META_MAX_MARKERS = 1000  # errors marked in the editor at most
+META_SCHEMAS = {
+    # root element: fields every top-level <Item> must have
+    'CHandlingDataMgr': ('handlingName', 'fMass', 'fInitialDragCoeff', 'fDriveBiasFront',
+                         'nInitialDriveGears', 'fInitialDriveForce', 'fInitialDriveMaxFlatVel',
+                         'fBrakeForce', 'fSteeringLock', 'fTractionCurveMax', 'fSuspensionForce'),
+    'CVehicleModelInfo__InitDataList': ('modelName', 'txdName', 'handlingId', 'gameName'),
+    'CVehicleModelInfoVariation': ('modelName',),
+}
+META_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|0[xX][0-9A-Fa-f]+|true|false')
+
+
+class _MetaChecker:
+    """expat callbacks for one parse, collecting top-level <Item> spans and rule violations
+
+    Items are (first line, first column, last line, [(line offset, column, message)]).
+    A checker for a single item is started `depth` elements deep, with line_base and
+    col_base placing the fragment in the document.
+    """
+
+    def __init__(self, check_values, schema=None, depth=0, line_base=1, col_base=0):
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.check_values = check_values
+        self.schema = schema
+        self.root = None
+        self.depth = depth
+        self.line_base = line_base
+        self.col_base = col_base
+        self.items = []
+        self.errors = []  # (line, column, message) outside any item
+        self._item = None  # [first line, column, errors, child names] of the open item
+
+    def position(self, line=None, col=None):
+        if line is None:
+            line, col = self.parser.CurrentLineNumber, self.parser.CurrentColumnNumber
+        return self.line_base + line - 1, col + (self.col_base if line == 1 else 0)
+
+    def start(self, name, attrs):
+        line, col = self.position()
+        depth = self.depth
+        if depth == 0:
+            self.root = name
+            self.schema = META_SCHEMAS.get(name)
+            self.check_values = self.check_values or self.schema is not None
+        elif depth == 2 and name == 'Item':
+            self._item = [line, col, [], set()]
+        elif depth == 3 and self._item is not None:
+            self._item[3].add(name)
+        if self.check_values:
+            for attr in ('value', 'x', 'y', 'z'):
+                value = attrs.get(attr)
+                if value is not None and not META_NUMBER.fullmatch(value.strip()):
+                    self.error(line, col, f'<{name} {attr}="{value}"> is not a number')
+        self.depth = depth + 1
+
+    def end(self, name):
+        self.depth -= 1
+        if self.depth == 2 and self._item is not None:
+            first, col, errors, children = self._item
+            self._item = None
+            if self.schema:
+                missing = [field for field in self.schema if field not in children]
+                if missing:
+                    errors.insert(0, (0, col, "<Item> has no " + ", ".join(f"<{field}>" for field in missing)))
+            self.items.append((first, col, self.position()[0], errors))
+
+    def error(self, line, col, message):
+        if self._item is not None:
+            self._item[2].append((line - self._item[0], col, message))
+        else:
+            self.errors.append((line, col, message))
+
+    def fail(self, e):
+        """Record the parse error that stopped expat"""
+        self.error(*self.position(e.lineno, e.offset), xml.parsers.expat.ErrorString(e.code))
+        if self._item is not None:
+            first, col, errors, _ = self._item
+            self._item = None
+            self.items.append((first, col, first + max(offset for offset, _, _ in errors), errors))
+
+
+class MetaValidator:
+    """Well-formedness and FiveM meta rules for an XML buffer, re-checked item by item
+
+    A full pass streams the buffer through expat a slice at a time (begin()/feed()),
+    so memory stays flat however big the file is. It checks `value=` and x/y/z
+    attributes are numbers and, for the types in META_SCHEMAS, that each top-level
+    <Item> has its required fields. The items' line spans are kept in step with
+    edits, and an edit inside a single item only re-parses that item (recheck()).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, check_values=False):
+        """Forget everything; `check_values` applies the number rule whatever the root element"""
+        self.check_values = check_values
+        self.items = []  # [first line, column, last line, errors] per top-level <Item>
+        self.errors = []
+        self.root = self.schema = None
+        self.complete = False  # a full pass has finished since the last reset/begin()
+        self.fatal = False  # expat gave up, so nothing after the error was checked
+        self.dirty = None  # (first, last) lines edited since
+        self._checker = None
+
+    def invalidate(self):
+        """Make the next validation a full pass"""
+        self.complete = False
+
+    def begin(self):
+        """Start a full pass"""
+        self._checker = _MetaChecker(self.check_values)
+        self.complete = self.fatal = False
+        self.dirty = None
+
+    def feed(self, text, final=False):
+        """Parse the next slice of a full pass; returns False once the pass is over"""
+        checker = self._checker
+        try:
+            checker.parser.Parse(text, final)
+        except xml.parsers.expat.ExpatError as e:
+            checker.fail(e)
+            self.fatal = final = True
+        if final:
+            self.items = [list(item) for item in checker.items]
+            self.errors = checker.errors
+            self.root, self.schema = checker.root, checker.schema
+            self.complete = True
+            self._checker = None
+        return not final
+
+    def _mark(self, first, last):
+        if self.dirty:
+            first, last = min(first, self.dirty[0]), max(last, self.dirty[1])
+        self.dirty = (first, last)
+
+    def note_insert(self, line, text):
+        """Record that text was inserted on a line"""
+        if not self.complete:
+            return
+        added = text.count('\n')
+        if added:
+            for item in self.items:
+                if item[0] > line:
+                    item[0] += added
+                if item[2] >= line:
+                    item[2] += added
+            self.errors = [(at + added if at > line else at, col, message) for at, col, message in self.errors]
+            if self.dirty and self.dirty[1] > line:
+                self.dirty = (self.dirty[0], self.dirty[1] + added)
+        self._mark(line, line + added)
+
+    def note_delete(self, first, last):
+        """Record that the text from line `first` through line `last` was joined into one line"""
+        if not self.complete:
+            return
+        removed = last - first
+        if removed:
+            below = lambda line: line if line <= first else max(first, line - removed)
+            for item in self.items:
+                item[0], item[2] = below(item[0]), below(item[2])
+            self.errors = [(below(at), col, message) for at, col, message in self.errors]
+            if self.dirty:
+                self.dirty = (below(self.dirty[0]), below(self.dirty[1]))
+        self._mark(first, first)
+
+    def edited_item(self):
+        """Number of the one item every edit since the last pass falls inside, else None"""
+        if not self.dirty or self.fatal:
+            return None
+        first, last = self.dirty
+        found = None
+        for number, item in enumerate(self.items):
+            if item[0] > last:
+                break
+            if item[2] >= first:
+                # Its first line may have changed before the <Item> column, so that one is out
+                if found is not None or not (item[0] < first and last <= item[2]):
+                    return None
+                found = number
+        return found
+
+    def recheck(self, number, text):
+        """Re-parse one item from its text; False if it no longer stands alone (run a full pass)"""
+        first, col = self.items[number][:2]
+        checker = _MetaChecker(self.check_values, self.schema, depth=2, line_base=first, col_base=col)
+        try:
+            checker.parser.Parse(text, True)
+        except xml.parsers.expat.ExpatError:
+            return False
+        if len(checker.items) != 1 or checker.errors:
+            return False
+        self.items[number] = list(checker.items[0])
+        self.dirty = None
+        return True
+
+    def all_errors(self):
+        """(line, column, message) of every problem, in line order"""
+        found = list(self.errors)
+        for first, _, _, errors in self.items:
+            found += [(first + offset, col, message) for offset, col, message in errors]
+        return sorted(found)
+
+
+# Run > Run Python File / Run Selection: output streamed from a warm worker process
+RUN_QUEUE_LINES = 10000  # lines buffered between the pipe readers and the output window
+RUN_LINES_PER_TICK = 500  # lines inserted into the output window per after() tick
+RUN_TICK_MS = 30
+RUN_SCROLLBACK_LINES = 5000  # older output is dropped from the window past this
+PYTHON_WORKER_MARKER = '\x00fdfe-done '  # written to both pipes after each run, with the exit code
+PYTHON_WORKER_SOURCE = r"""
+import json, os, sys, traceback
+requests = sys.stdin
+sys.stdin = open(os.devnull)
+home = os.getcwd()
+while True:
+    try:
+        line = requests.readline()
+    except KeyboardInterrupt:
+        continue
+    if not line:
+        break
+    request = json.loads(line)
+    code = 0
+    try:
+        os.chdir(request['cwd'] or home)
+        sys.argv = [request['filename']]
+        namespace = {'__name__': '__main__', '__file__': request['filename'], '__builtins__': __builtins__}
+        exec(compile(request['code'], request['filename'], 'exec'), namespace)
+    except SystemExit as e:
+        if isinstance(e.code, int) or e.code is None:
+            code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException as e:
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        code = 1
+    finally:
+        os.chdir(home)
+    marker = %r + '%%d\n' %% code
+    for stream in (sys.stdout, sys.stderr):
+        stream.flush()
+        stream.write(marker)
+        stream.flush()
+""" % PYTHON_WORKER_MARKER
+
+
+class PythonWorker:
+    """A Python process, started ahead of time, that runs code sent to it as JSON lines
+
+    Each request is compiled and run in a fresh __main__ namespace. Output comes back on
+    the process's stdout and stderr, and PYTHON_WORKER_MARKER plus the exit code ends
+    each run on both pipes. PythonWorkerPool gives a worker a single run: imported
+    modules, sys.path and monkeypatches would otherwise carry over to the next one.
+    """
+
+    def __init__(self):
+        env = dict(os.environ, PYTHONUNBUFFERED='1', PYTHONIOENCODING='utf-8')
+        self.process = subprocess.Popen([sys.executable, '-c', PYTHON_WORKER_SOURCE], env=env,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, encoding='utf-8', errors='replace',
+                                        creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        self.run = None  # WorkerRun being served
+        for pipe, kind in ((self.process.stdout, 'out'), (self.process.stderr, 'err')):
+            threading.Thread(target=self._read, args=(pipe, kind), daemon=True).start()
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def _read(self, pipe, kind):
+        for line in pipe:
+            run = self.run
+            # The marker follows the run's output directly, so it can end a line the
+            # code left unfinished (print(..., end=''), sys.stdout.write('x'))
+            at = line.find(PYTHON_WORKER_MARKER)
+            if at == -1:
+                if run is not None:
+                    run.put((kind, line))
+            elif run is not None:
+                if at:
+                    run.put((kind, line[:at]))
+                run.pipe_done(kind, int(line[at + len(PYTHON_WORKER_MARKER):]))
+        pipe.close()
+        if self.run is not None:
+            self.run.pipe_done(kind, None)
+
+    def submit(self, run, code, filename, cwd):
+        """Send a run's code; raises OSError if the worker has died"""
+        self.run = run
+        self.process.stdin.write(json.dumps({'code': code, 'filename': filename, 'cwd': cwd}) + '\n')
+        self.process.stdin.flush()
+
+    def interrupt(self):
+        """Raise KeyboardInterrupt in the running code, keeping the worker (POSIX only)"""
+        if os.name == 'posix':
+            os.kill(self.process.pid, signal.SIGINT)
+        else:
+            self.kill()
+
+    def kill(self):
+        if self.alive:
+            self.process.kill()
+
+    def shutdown(self):
+        """Let an idle worker exit"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+
+class PythonWorkerPool:
+    """Keeps a warm PythonWorker ready for the next run
+
+    acquire() hands out the idle worker (starting one if there is none) and starts its
+    replacement straight away; release() lets the worker exit once its run is over, so
+    every run starts from a clean interpreter.
+    """
+
+    def __init__(self):
+        self.idle = None
+        self.lock = threading.Lock()
+
+    def warm(self):
+        """Start a worker in the background if none is waiting"""
+        with self.lock:
+            if self.idle is None or not self.idle.alive:
+                self.idle = PythonWorker()
+
+    def acquire(self):
+        with self.lock:
+            worker, self.idle = self.idle, None
+        if worker is None or not worker.alive:
+            worker = PythonWorker()
+        self.warm()
+        return worker
+
+    def release(self, worker):
+        worker.shutdown()
+
+    def shutdown(self):
+        with self.lock:
+            worker, self.idle = self.idle, None
+        if worker is not None:
+            worker.shutdown()
+
+
+class WorkerRun:
+    """One run of Python code on a PythonWorker from the pool, as seen by the output window
+
+    The worker's stdout and stderr lines are queued as ('out' | 'err', text) in a bounded
+    queue, so code that prints faster than the window drains it blocks on its pipe
+    instead of growing memory; ('exit', returncode) follows once the run is over. stop()
+    interrupts the code and kill() ends the worker; close() also stops the queueing.
+    """
+
+    def __init__(self, pool, code, filename, cwd=None):
+        self.pool = pool
+        self.code = code
+        self.filename = filename
+        self.cwd = cwd
+        self.queue = queue.Queue(maxsize=RUN_QUEUE_LINES)
+        self.worker = None
+        self.started = self.finished = None
+        self.returncode = None
+        self.closed = threading.Event()
+        self._pending = {'out', 'err'}  # pipes still to report the end of the run
+        self._died = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        for attempt in range(2):
+            self.worker = self.pool.acquire()
+            self.started = perf_counter()
+            try:
+                self.worker.submit(self, self.code, self.filename, self.cwd)
+                break
+            except OSError:
+                if attempt:
+                    raise  # a fresh worker that cannot take input: give up
+        run_log.info("Running %s on worker %d", self.filename, self.worker.process.pid)
+
+    def _put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def put(self, item):
+        self._put(item)
+
+    def pipe_done(self, kind, code):
+        """A pipe reached the end-of-run marker (with the exit code) or closed (code None)"""
+        with self._lock:
+            if kind not in self._pending:
+                return
+            self._pending.discard(kind)
+            if code is None:
+                self._died = True
+            else:
+                self.returncode = code
+            if self._pending:
+                return
+        worker = self.worker
+        worker.run = None
+        if self._died:
+            self.returncode = worker.process.wait()
+            self.pool.warm()
+        else:
+            self.pool.release(worker)
+        self.finished = perf_counter()
+        run_log.info("%s exited with code %s after %.2f s", self.filename, self.returncode, self.elapsed())
+        self._put(('exit', self.returncode))
+
+    @property
+    def running(self):
+        return self.started is not None and self.finished is None
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or perf_counter()) - self.started
+
+    def stop(self):
+        if self.running:
+            self.worker.interrupt()
+
+    def kill(self):
+        if self.running:
+            self.worker.kill()
+
+    def close(self):
+        """Kill the worker if the code is still running and stop queueing its output"""
+        self.kill()
+        self.closed.set()
+
+
+# Terminal windows: a shell on a pseudo-terminal, drawn at most once per frame
+TERMINAL_SCROLLBACK_LINES = 5000
+TERMINAL_SCROLLBACK_CHARS = 2000000
+TERMINAL_READ_BYTES = 65536
+TERMINAL_FRAME_MS = 33
+ANSI_SEQUENCE = re.compile(r'\x1b(?:\[([0-?]*)[ -/]*([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])')
+ANSI_PARTIAL = re.compile(r'\x1b(?:\[[0-?]*[ -/]*|\][^\x07\x1b]{0,256}\x1b?)?\Z')  # split by a read
+ANSI_CONTROL = dict.fromkeys(code for code in range(32) if code not in (7, 9, 10, 27))  # \a, ESC: sequences
+ANSI_COLORS = ['#3b3b3b', '#f14c4c', '#23d18b', '#f5f543', '#3b8eea', '#d670d6', '#29b8db', '#e5e5e5']
+ANSI_BRIGHT_COLORS = ['#808080', '#ff6b6b', '#5af78e', '#ffff80', '#6cb6ff', '#ff92df', '#5de4f5', '#ffffff']
+# Puts the shell's pty in charge as its controlling terminal, so ^C and job control work
+TERMINAL_TTY_HELPER = ("import fcntl, os, sys, termios; fcntl.ioctl(0, termios.TIOCSCTTY, 0); "
+                       "os.execvp(sys.argv[1], sys.argv[1:])")
+
+
+def ansi_tag_styles():
+    """Tag name -> Text.tag_configure options for every SGR code AnsiDecoder emits"""
+    styles = {'ansi_1': {'font': ('Consolas', 10, 'bold')}}
+    for number, (color, bright) in enumerate(zip(ANSI_COLORS, ANSI_BRIGHT_COLORS)):
+        styles[f'ansi_{30 + number}'] = {'foreground': color}
+        styles[f'ansi_{90 + number}'] = {'foreground': bright}
+        styles[f'ansi_{40 + number}'] = {'background': color}
+        styles[f'ansi_{100 + number}'] = {'background': bright}
+    return styles
+
+
+class AnsiDecoder:
+    """Turns terminal output into (text, tags) runs, keeping colour state across reads
+
+    SGR colours and bold become 'ansi_<code>' tag names (see ansi_tag_styles); other
+    escape sequences and control characters are dropped, since the window is a plain
+    log view rather than a cursor-addressed screen.
+    """
+
+    _transitions = {}  # (fg, bg, bold, SGR parameters) -> the state after them, shared by all decoders
+
+    def __init__(self):
+        self.fg = self.bg = None
+        self.bold = False
+        self.tags = ()
+        self._rest = ''  # an escape sequence cut in half by the last read
+
+    def feed(self, text):
+        text = (self._rest + text).translate(ANSI_CONTROL)
+        self._rest = ''
+        escape = text.rfind('\x1b')
+        if escape < 0:
+            runs = []
+            if text:
+                self._emit(runs, text)
+            return runs
+        if ANSI_PARTIAL.match(text, escape):
+            text, self._rest = text[:escape], text[escape:]
+        runs = []
+        # split() gives text, then (parameters, final byte, text) for every sequence
+        parts = ANSI_SEQUENCE.split(text)
+        if parts[0]:
+            self._emit(runs, parts[0])
+        for index in range(1, len(parts), 3):
+            if parts[index + 1] == 'm':
+                key = (self.fg, self.bg, self.bold, parts[index])
+                state = self._transitions.get(key)
+                if state is None:
+                    self._select(parts[index])
+                    state = self._transitions[key] = (self.fg, self.bg, self.bold, self.tags)
+                self.fg, self.bg, self.bold, self.tags = state
+            if parts[index + 2]:
+                self._emit(runs, parts[index + 2])
+        return runs
+
+    def _emit(self, runs, text):
+        if '\x07' in text or '\x1b' in text:
+            text = text.replace('\x07', '').replace('\x1b', '')  # a bell, or a stray ESC
+            if not text:
+                return
+        if runs and runs[-1][1] == self.tags:
+            runs[-1] = (runs[-1][0] + text, self.tags)
+        else:
+            runs.append((text, self.tags))
+
+    def _select(self, params):
+        codes = iter(params.split(';') if params else ['0'])
+        for code in codes:
+            number = int(code) if code.isdigit() else 0
+            if number == 0:
+                self.fg = self.bg = None
+                self.bold = False
+            elif number == 1:
+                self.bold = True
+            elif number == 22:
+                self.bold = False
+            elif 30 <= number <= 37 or 90 <= number <= 97:
+                self.fg = number
+            elif number == 39:
+                self.fg = None
+            elif 40 <= number <= 47 or 100 <= number <= 107:
+                self.bg = number
+            elif number == 49:
+                self.bg = None
+            elif number in (38, 48):
+                # 256-colour / true-colour forms: skip their arguments
+                for _ in range(1 if next(codes, '') == '5' else 3):
+                    next(codes, None)
+        self.tags = tuple(f'ansi_{code}' for code in (self.fg, self.bg, 1 if self.bold else None) if code)
+
+
+class TerminalScrollback:
+    """Terminal output waiting to be drawn, as (text, tags) runs capped by lines and chars
+
+    The reader thread appends and the window takes everything once per frame. When the
+    window falls behind, the oldest output is dropped; it would have scrolled out of the
+    scrollback anyway, so a flood costs at most one scrollback's worth of drawing.
+    """
+
+    def __init__(self, max_lines=TERMINAL_SCROLLBACK_LINES, max_chars=TERMINAL_SCROLLBACK_CHARS):
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.chunks = deque()  # (runs, lines, chars) per append, so dropping one is O(1)
+        self.lines = self.chars = 0
+        self.dropped = 0  # characters thrown away unseen
+        self.lock = threading.Lock()
+
+    def append(self, runs):
+        lines = chars = 0
+        for text, tags in runs:
+            lines += text.count('\n')
+            chars += len(text)
+        with self.lock:
+            self.chunks.append((runs, lines, chars))
+            self.lines += lines
+            self.chars += chars
+            while self.lines > self.max_lines or self.chars > self.max_chars:
+                runs, lines, chars = self.chunks.popleft()
+                self.lines -= lines
+                self.chars -= chars
+                if self.lines <= self.max_lines and self.chars <= self.max_chars:
+                    # This chunk straddles the cap: keep the end of it that still fits
+                    runs = self._tail(runs, self.max_lines - self.lines, self.max_chars - self.chars)
+                    if runs:
+                        kept_lines = sum(text.count('\n') for text, tags in runs)
+                        kept_chars = sum(len(text) for text, tags in runs)
+                        self.chunks.appendleft((runs, kept_lines, kept_chars))
+                        self.lines += kept_lines
+                        self.chars += kept_chars
+                        chars -= kept_chars
+                self.dropped += chars
+
+    @staticmethod
+    def _tail(runs, room_lines, room_chars):
+        """The end of `runs` holding at most room_lines newlines and room_chars characters"""
+        kept = []
+        for text, tags in reversed(runs):
+            newlines = text.count('\n')
+            if newlines <= room_lines and len(text) <= room_chars:
+                kept.append((text, tags))
+                room_lines -= newlines
+                room_chars -= len(text)
+                continue
+            start = len(text)
+            for _ in range(room_lines + 1):
+                start = text.rfind('\n', 0, start)
+                if start < 0:
+                    break
+            start = max(start + 1, len(text) - room_chars)
+            if start < len(text):
+                kept.append((text[start:], tags))
+            break
+        kept.reverse()
+        return kept
+
+    def take(self):
+        with self.lock:
+            chunks = self.chunks
+            self.chunks = deque()
+            self.lines = self.chars = 0
+        return [run for runs, lines, chars in chunks for run in runs]
+
+
+class TerminalSession:
+    """A shell on a pseudo-terminal (plain pipes where there is no pty), read on a thread
+
+    The reader blocks in os.read on its own thread and only hands decoded runs to the
+    scrollback, so the Tk mainloop never waits on the shell.
+    """
+
+    def __init__(self, args=None, cwd=None):
+        if args is None:
+            if os.name == 'posix':
+                args = [os.environ.get('SHELL') or '/bin/sh']
+            else:
+                args = [os.environ.get('COMSPEC') or 'cmd.exe']
+        self.args = args
+        self.cwd = cwd
+        self.scrollback = TerminalScrollback()
+        self.process = None
+        self.pty = os.name == 'posix'
+        self._read_fd = self._write_fd = None
+        self._fd_lock = threading.Lock()  # the reader closes the pty while write() may be using it
+        self.returncode = None
+        self.exited = threading.Event()
+
+    def start(self):
+        env = dict(os.environ, PYTHONUNBUFFERED='1')
+        if self.pty:
+            import pty
+            master, slave = pty.openpty()
+            env['TERM'] = 'xterm'
+            try:
+                self.process = subprocess.Popen([sys.executable, '-c', TERMINAL_TTY_HELPER] + self.args,
+                                                stdin=slave, stdout=slave, stderr=slave, cwd=self.cwd,
+                                                env=env, start_new_session=True)
+            except OSError:
+                os.close(master)
+                raise
+            finally:
+                os.close(slave)
+            self._read_fd = self._write_fd = master
+        else:
+            self.process = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT, cwd=self.cwd, env=env,
+                                            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+                                            | getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0))
+            self._read_fd = self.process.stdout.fileno()
+            self._write_fd = self.process.stdin.fileno()
+        threading.Thread(target=self._read, daemon=True).start()
+        run_log.info("Terminal started %s (pid %d, %s)", self.args[0], self.process.pid,
+                     "pty" if self.pty else "pipes")
+
+    def _read(self):
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        ansi = AnsiDecoder()
+        try:
+            while True:
+                try:
+                    data = os.read(self._read_fd, TERMINAL_READ_BYTES)
+                except OSError:
+                    break  # EIO once the last process on the pty has gone
+                if not data:
+                    break
+                self.scrollback.append(ansi.feed(decoder.decode(data)))
+        finally:
+            if self.pty:
+                # Let go of the fd before closing it, so write() and resize() cannot use
+                # it closed, or after the OS has handed the number to another file
+                with self._fd_lock:
+                    fd, self._read_fd, self._write_fd = self._read_fd, None, None
+                os.close(fd)
+            self.returncode = self.process.wait()
+            self.exited.set()
+            run_log.info("Terminal %d exited with code %s", self.process.pid, self.returncode)
+
+    @property
+    def running(self):
+        return self.process is not None and not self.exited.is_set()
+
+    def write(self, text):
+        with self._fd_lock:
+            if self._write_fd is None:
+                return
+            try:
+                os.write(self._write_fd, text.encode('utf-8'))
+            except OSError as e:
+                run_log.warning("Terminal %d: write failed: %s", self.process.pid, e)
+
+    def interrupt(self):
+        """^C: through the pty's line discipline, or a signal when running on pipes"""
+        if self.pty:
+            self.write('\x03')
+        elif self.running:
+            try:
+                self.process.send_signal(getattr(signal, 'CTRL_BREAK_EVENT', signal.SIGINT))
+            except OSError:
+                pass
+
+    def resize(self, columns, rows):
+        if not self.pty:
+            return
+        import fcntl
+        import struct
+        import termios
+        with self._fd_lock:
+            if self._write_fd is None:
+                return
+            try:
+                fcntl.ioctl(self._write_fd, termios.TIOCSWINSZ, struct.pack('HHHH', rows, columns, 0, 0))
+            except OSError:
+                pass
+
+    def close(self):
+        """Hang up the shell and everything started from it"""
+        if not self.running:
+            return
+        try:
+            if self.pty:
+                os.killpg(self.process.pid, signal.SIGHUP)
+            else:
+                self.process.kill()
+        except OSError:
+            pass
+
+
+def apply_tag_ranges(text_widget, line_index, start, end, ranges, tags=HIGHLIGHT_TAGS):
+    """Re-tag a region of a text widget in a few bulk Tcl calls
+
+    Clears `tags` from line `start` to index `end`, then adds `ranges` (tag -> [first, last,
+    ...] character offsets from the start of line `start`, as TkRangeFormatter collects
+    them) with one "tag add" per tag and TAG_BATCH_PAIRS ranges.
+    """
+    with perf.span('offset map'):
+        index = line_index.index
+        origin = line_index.offset(start)
+        spans = {tag: [index(origin + offset) for offset in offsets]
+                 for tag, offsets in ranges.items()}
+
+    call = text_widget.tk.call
+    widget = text_widget._w
+    with perf.span('tag remove'):
+        for tag in tags:
+            call(widget, 'tag', 'remove', tag, f"{start}.0", end)
+    step = 2 * TAG_BATCH_PAIRS
+    with perf.span('tag add'):
+        for tag, indices in spans.items():
+            for batch in range(0, len(indices), step):
+                call(widget, 'tag', 'add', tag, *indices[batch:batch + step])
+
+
+class IncrementalHighlighter:
+    """Tracks edited lines and re-lexes only from the last safe restart point until the lexer state converges"""
+
+    UNLEXED = 0     # state id of a line added by an edit and not lexed yet
+    MID_TOKEN = -1  # state id of a line that starts inside a token (not a restart point)
+
+    # Per-line flags for text below a line changing how that line lexes
+    UNCLOSED = 1     # a block opener (`<!--`, `--[[`) on the line is not closed yet
+    PEEKS = 2        # the line's last real token came from a rule that looks ahead past the line
+    TRANSPARENT = 4  # only whitespace and comments, which lookaheads read straight through
+    UNCLOSED_FLAGS = re.compile(b'[\x01\x03\x05\x07]')
+
+    WINDOW_MARGIN = 50  # lines at the end of a partial window that are not trusted
+
+    def __init__(self):
+        self.generation = 0  # bumped by every edit and every committed pass
+        self.reset()
+
+    def reset(self, filename=None, lexer=None):
+        """Forget all cached lexer state, e.g. when another file is loaded"""
+        self.filename = filename
+        self.lexer = lexer
+        # Per-line checkpoints (index 0 is line 1): the id of the lexer state stack at the
+        # start of the line, a hash of the line's text and the flags above. Stacks are
+        # interned so each line costs a few machine words however deep the state is.
+        self.stacks = [None]
+        self.stack_ids = {}
+        self.stack_lock = threading.Lock()  # stacks are interned from the lexing thread too
+        self.invalidate()
+        # Only plain RegexLexers (and Lua, whose override just splits dotted builtins)
+        # can be resumed mid-file; anything else is re-lexed in full
+        if lexer is not None:
+            RegexLexer, LuaLexer = _regex_lexer_types()
+        self.resumable = lexer is not None and (
+            type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+            or isinstance(lexer, LuaLexer))
+        self.rule_info = {}
+        if self.resumable:
+            try:
+                self.rule_info = lexer_rule_info(lexer)
+            except Exception:
+                self.resumable = False
+
+    def invalidate(self):
+        """Force the next pass to re-lex the whole buffer"""
+        self.generation += 1
+        self.line_states = array('i')
+        self.line_hashes = array('q')
+        self.line_flags = array('B')
+        self.dirty = None     # (first_line, last_line) touched since the last pass
+        self.frontier = None  # (line, last_line) still to lex after a pass was cut short
+
+    def _state_id(self, stack):
+        state = tuple(stack)
+        state_id = self.stack_ids.get(state)
+        if state_id is None:
+            with self.stack_lock:
+                state_id = self.stack_ids.get(state)
+                if state_id is None:
+                    state_id = self.stack_ids[state] = len(self.stacks)
+                    self.stacks.append(state)
+        return state_id
+
+    def _mark_dirty(self, first, last):
+        if self.dirty:
+            first, last = min(first, self.dirty[0]), max(last, self.dirty[1])
+        self.dirty = (first, last)
+
+    def _shift_ranges(self, shift):
+        if self.dirty:
+            self.dirty = (shift(self.dirty[0]), shift(self.dirty[1]))
+        if self.frontier:
+            self.frontier = (shift(self.frontier[0]), shift(self.frontier[1]))
+
+    @property
+    def pending(self):
+        """Whether some lines still need lexing"""
+        return bool(self.dirty or self.frontier) or not self.line_states
+
+    def note_insert(self, line, text):
+        """Record that text was inserted on the given line"""
+        self.generation += 1
+        added = text.count('\n')
+        if self.line_states:
+            self.line_hashes[line - 1] = 0
+            if added:
+                self.line_states[line:line] = array('i', [self.UNLEXED]) * added
+                self.line_hashes[line:line] = array('q', [0]) * added
+                self.line_flags[line:line] = array('B', [0]) * added
+        if added:
+            self._shift_ranges(lambda other: other + added if other > line else other)
+        self._mark_dirty(line, line + added)
+
+    def note_delete(self, first, last):
+        """Record that the text between the given lines was deleted (joining them)"""
+        self.generation += 1
+        removed = last - first
+        if self.line_states:
+            self.line_hashes[first - 1] = 0
+            if removed > 0:
+                del self.line_states[first:last]
+                del self.line_hashes[first:last]
+                del self.line_flags[first:last]
+        if removed > 0:
+            def shift(line):
+                if line > last:
+                    return line - removed
+                return first if line > first else line
+            self._shift_ranges(shift)
+        self._mark_dirty(first, first)
+
+    def prepare(self, line_count):
+        """Size the per-line tables for a buffer that has not been lexed yet
+
+        With the tables in place a pass can stop part-way through the file and the
+        rest is left dirty for the next one.
+        """
+        if self.line_states or not self.resumable:
+            return
+        self.line_states = array('i', [self.UNLEXED]) * line_count
+        self.line_states[0] = self._state_id(['root'])
+        self.line_hashes = array('q', [0]) * line_count
+        self.line_flags = array('B', [0]) * line_count
+        self.frontier = (1, line_count)
+
+    def restart_line(self):
+        """Return the line the next pass must start lexing from, or None if nothing changed"""
+        if not self.line_states:
+            return 1
+        if not self.dirty and not self.frontier:
+            return None
+        if not self.resumable:
+            return 1
+        line = len(self.line_states)
+        if self.dirty:
+            flags = self.line_flags
+            line = min(self.dirty[0], line)
+            # A lookahead on an earlier line may read through blank and comment lines into the edit
+            above = line - 1
+            while above > 1 and flags[above - 1] & self.TRANSPARENT:
+                above -= 1
+            if above >= 1 and flags[above - 1] & self.PEEKS:
+                line = above
+            # An unclosed block opener anywhere above may now be closed by the edit
+            unclosed = self.UNCLOSED_FLAGS.search(flags[:line - 1].tobytes())
+            if unclosed:
+                line = unclosed.start() + 1
+        if self.frontier:
+            # Carry on from where the last pass was cut short
+            line = min(line, self.frontier[0])
+        while line > 1 and self.line_states[line - 1] <= 0:
+            line -= 1
+        return line
+
+    def relex(self, text, start, deadline=None, partial=False):
+        """Lex text beginning at the start of line `start`
+
+        Returns (stop_line, ranges): lexing stops at stop_line (None means the end of
+        the buffer) and ranges maps tags to [start, end, ...] offsets relative to text.
+        Lexing also stops at the first safe line after `deadline` (a perf_counter
+        time), leaving the rest dirty. With `partial`, text is a window that does not
+        reach the end of the buffer; None is returned if a block opened in it may
+        close beyond it, and the caller should retry with more of the buffer.
+        """
+        if self.resumable and not self.line_states:
+            self.prepare(text.count('\n'))
+        result = self.lex(self.snapshot(), text, start, deadline, partial)
+        return None if result is None else self.commit(result)
+
+    def snapshot(self, copy=False):
+        """Capture what a pass reads, for lex() to run on another thread
+
+        With `copy` the per-line tables are copied, so edits made on the main
+        thread meanwhile cannot change them under the pass.
+        """
+        states, hashes = self.line_states, self.line_hashes
+        if copy:
+            states, hashes = array('i', states), array('q', hashes)
+        return (self.generation, self.lexer, self.resumable, self.rule_info,
+                states, hashes, self.dirty, self.frontier)
+
+    def lex(self, snapshot, text, start, deadline=None, partial=False):
+        """The lexing half of relex(); reads only the snapshot and the interned stacks
+
+        Returns a result for commit(), or None when relex() would.
+        """
+        started = perf_counter()
+        result = self._lex(snapshot, text, start, deadline, partial)
+        perf.record('lex', perf_counter() - started,
+                    sum(map(len, result[4].values())) // 2 if result else 0)
+        return result
+
+    def _lex(self, snapshot, text, start, deadline, partial):
+        generation, lexer, resumable, rule_info, old_states, old_hashes, dirty, frontier = snapshot
+        formatter = TkRangeFormatter()
+        if not resumable:
+            ranges = formatter.format_unprocessed(lexer.get_tokens_unprocessed(text))
+            return generation, start, None, False, ranges, None, None, None, text.count('\n'), None
+
+        old_count = len(old_states)
+        dirty_last = max(dirty[1] if dirty else start, frontier[1] if frontier else start)
+        # Lookaheads can read a little past the window, so stop well short of its end
+        window_limit = start + text.count('\n') - self.WINDOW_MARGIN if partial else None
+        split_builtins = isinstance(lexer, _regex_lexer_types()[1])
+        tokendefs = lexer._tokens
+        no_info = ((), None)
+        stack = list(self.stacks[old_states[start - 1]])
+        statetokens = tokendefs[stack[-1]]
+        state_openers, first_peek = rule_info.get(stack[-1], no_info)
+
+        new_states = array('i')  # checkpoints for lines start+1 onwards
+        new_hashes = array('q')  # hashes for lines start onwards
+        new_flags = array('B')
+        line_flags = self.TRANSPARENT
+        add_token = formatter.add_token
+        text_len = len(text)
+        pos = 0
+        line = start
+        line_start = 0
+        newline = text.find('\n')
+        stop = None
+        limited = False
+
+        while pos < text_len:
+            for rule_index, (rexmatch, action, new_state) in enumerate(statetokens):
+                m = rexmatch(text, pos)
+                if m:
+                    break
+            else:
+                m = None
+                rule_index = len(statetokens)
+            # A block rule tried before the one that matched failed; if its opener is
+            # here the block is unclosed rather than absent
+            for opener_index, opener in state_openers:
+                if opener_index >= rule_index:
+                    break
+                if opener(text, pos):
+                    if partial:
+                        return None
+                    line_flags |= self.UNCLOSED
+                    break
+            peeked = first_peek is not None and rule_index >= first_peek
+
+            if m is not None:
+                end = m.end()
+                transparent = True
+                if action is not None:
+                    if type(action) is _TokenType:
+                        tokens = ((pos, action, m.group()),)
+                    else:
+                        tokens = action(lexer, m)
+                    if split_builtins:
+                        tokens = split_lua_builtins(lexer, tokens)
+                    for index, ttype, value in tokens:
+                        tag = add_token(index, ttype, value)
+                        if transparent and tag != 'token_comment' and not value.isspace():
+                            transparent = False
+                # A whitespace-only token that keeps the state can be restarted anywhere inside
+                splittable = (type(action) is _TokenType and new_state is None
+                              and m.group().isspace())
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(stack) > 1:
+                                    stack.pop()
+                            elif state == '#push':
+                                stack.append(stack[-1])
+                            else:
+                                stack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(stack):
+                            del stack[1:]
+                        else:
+                            del stack[new_state:]
+                    elif new_state == '#push':
+                        stack.append(stack[-1])
+                    statetokens = tokendefs[stack[-1]]
+                    state_openers, first_peek = rule_info.get(stack[-1], no_info)
+            else:
+                # No rule matched: Pygments resets to root at end of line, otherwise emits an error char
+                end = pos + 1
+                splittable = False
+                transparent = text[pos] == '\n'
+                if transparent:
+                    stack = ['root']
+                    statetokens = tokendefs['root']
+                    state_openers, first_peek = rule_info.get('root', no_info)
+
+            match_flags = 0 if transparent else (self.PEEKS if peeked else 0)
+            if not transparent:
+                line_flags = (line_flags & self.UNCLOSED) | match_flags
+
+            # Checkpoint every line start this token crossed
+            while newline != -1 and newline < end:
+                new_hashes.append(hash(text[line_start:newline]))
+                new_flags.append(line_flags)
+                line_start = newline + 1
+                newline = text.find('\n', line_start)
+                if line_start >= text_len:
+                    newline = -1
+                    break
+                line += 1
+                # A line that starts inside this token inherits it as its first token
+                line_flags = self.TRANSPARENT if (line_start == end or transparent) else match_flags
+                if line_start == end or splittable:
+                    state_id = self._state_id(stack)
+                    # Converged: same state at the start of an untouched line, so the rest is unchanged
+                    if (line > dirty_last and line <= old_count
+                            and old_states[line - 1] == state_id
+                            and old_hashes[line - 1] == hash(text[line_start:newline])):
+                        stop = line
+                    # Out of time or window: checkpoint this line and leave the rest dirty
+                    elif ((deadline is not None and perf_counter() > deadline)
+                            or (window_limit is not None and line > window_limit)):
+                        stop = line
+                        limited = True
+                        new_states.append(state_id)
+                    if stop:
+                        formatter.truncate(line_start)
+                        break
+                else:
+                    state_id = self.MID_TOKEN
+                new_states.append(state_id)
+            if stop:
+                break
+            pos = end
+
+        if partial and not stop:
+            return None
+        last = stop - 1 if stop else old_count
+        frontier = (stop, max(stop, dirty_last)) if limited else None
+        return (generation, start, stop, limited, formatter.ranges,
+                new_states, new_hashes, new_flags, last, frontier)
+
+    def commit(self, result):
+        """Store a lex() result in the per-line tables
+
+        Returns (stop_line, ranges) as relex() does, or None if the buffer was edited
+        (or another pass committed) after the snapshot was taken.
+        """
+        (generation, start, stop, limited, ranges,
+         new_states, new_hashes, new_flags, last, frontier) = result
+        if generation != self.generation:
+            return None
+        self.generation += 1
+        if new_states is None:
+            # A full pass of a lexer that cannot be resumed; `last` is the line count
+            self.line_states = array('i', [self.MID_TOKEN]) * last
+            self.line_hashes = array('q', [0]) * last
+            self.line_flags = array('B', [0]) * last
+            self.dirty = self.frontier = None
+            return None, ranges
+        self.line_states[start:last + limited] = new_states
+        self.line_hashes[start - 1:last] = new_hashes
+        self.line_flags[start - 1:last] = new_flags
+        self.dirty = None
+        self.frontier = frontier
+        return stop, ranges
+
+    def preview(self, text, start):
+        """Provisionally highlight lines the full pass has not reached yet (e.g. after a scroll)
+
+        Lexes from the line's checkpoint when there is one and from the root state
+        otherwise, without touching the cached state; the full pass repaints later.
+        """
+        if not self.resumable:
+            return {}
+        state_id = self.line_states[start - 1] if start <= len(self.line_states) else 0
+        stack = self.stacks[state_id] if state_id > 0 else ('root',)
+        RegexLexer, LuaLexer = _regex_lexer_types()
+        tokens = RegexLexer.get_tokens_unprocessed(self.lexer, text, stack)
+        if isinstance(self.lexer, LuaLexer):
+            tokens = split_lua_builtins(self.lexer, tokens)
+        return TkRangeFormatter().format_unprocessed(tokens)
+
+
+class ChangeScheduler:
+    """Collapse bursts of change notifications into one deferred refresh
+
+    Event handlers call request(); the callback runs once, CHANGE_DEBOUNCE_MS after
+    the last request, with whether the document and/or the viewport changed. A new
+    request restarts the wait instead of queueing more work, but no further than
+    CHANGE_MAX_WAIT_MS after the first pending one, so key auto-repeat cannot hold
+    the refresh off. `requests` and `runs` count both sides so the saving
+    (`collapsed`) can be measured.
+    """
+
+    def __init__(self, widget, callback, delay_ms=CHANGE_DEBOUNCE_MS, max_wait_ms=CHANGE_MAX_WAIT_MS):
+        self.widget = widget
+        self.callback = callback
+        self.delay_ms = delay_ms
+        self.max_wait_ms = max_wait_ms
+        self.job = None
+        self.first = None  # perf_counter() of the first request since the last run
+        self.document = False
+        self.viewport = False
+        self.requests = 0
+        self.runs = 0
+
+    @property
+    def collapsed(self):
+        """Handler runs saved by coalescing"""
+        return self.requests - self.runs - (self.job is not None)
+
+    def request(self, document=False, viewport=False):
+        self.requests += 1
+        self.document |= document
+        self.viewport |= viewport
+        delay = self.delay_ms
+        if self.job is None:
+            self.first = perf_counter()
+        else:
+            self.widget.after_cancel(self.job)
+            waited = (perf_counter() - self.first) * 1000
+            delay = max(0, min(delay, int(self.max_wait_ms - waited)))
+        self.job = self.widget.after(delay, self._run)
+
+    def flush(self):
+        """Run a pending refresh now"""
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self._run()
+
+    def _run(self):
+        self.job = self.first = None
+        document, viewport = self.document, self.viewport
+        self.document = self.viewport = False
+        self.runs += 1
+        self.callback(document, viewport)
+
 
 class CodeEditor:
     def __init__(self, root):
@@ -25,7 +2626,47 @@ class CodeEditor:
         self.current_file = None
         self.marked_lines = set()
         self.lb_path = None # stores the Liberty BASIC installation path
-        root.iconbitmap(r'C:\Users\peter\Desktop\FiveM_Data_File_Editor\Example_Files\Editor\FDFE.ico')  # FiveM Data File Editor icon
+        self.highlighter = IncrementalHighlighter()  # caches lexer state between highlight passes
+        self._highlight_job = None  # pending after_idle() slice of background highlighting
+        self._lex_running = False  # a pass is running on the lexing thread
+        self._painted_viewport = None  # (first, last) lines provisionally highlighted on screen
+        self.line_index = LineIndex()  # maps character offsets to "line.col" without Tk calls
+        self.changes = ChangeScheduler(root, self.refresh_after_change)  # debounces event handlers
+        self._gutter_view = None  # (yview, line count) the line number gutter was last drawn for
+        self.perf_overlay = None  # label showing timing stats (View > Performance Overlay)
+        self.file_encoding = None  # encoding the current file was read with (None: locale default)
+        self.file_newline = None  # line ending the current file uses (None: the platform's)
+        self._saving = False  # a save is running on a worker thread
+        self._save_again = None  # file name to save once it finishes (repeated Ctrl+S)
+        self._loader = None  # ChunkedTextReader of a file still being streamed in
+        self._load_job = None
+        self.load_bar = None  # progress bar and Cancel button shown while a file loads
+        self.find_index = FindIndex()  # matches of the Find/Replace dialog's search text
+        self.find_regex = tk.BooleanVar(value=False)
+        self.find_case = tk.BooleanVar(value=False)
+        self.find_status = None  # "n of N" label of the open Find/Replace dialog
+        self.workspace = None  # TrigramIndex of the folder opened with File > Open Folder
+        self._search_pool = None  # process pool for Find in Files, started on first use
+        self._search = None  # WorkspaceSearch still delivering results
+        self._search_hits = []  # (path, line) behind each row of the Find in Files results
+        self._pending_goto = None  # line to jump to once a streaming load has reached it
+        self.find_files_window = None
+        self.resource_graph = None  # ResourceGraph of the workspace, kept for warm rescans
+        self.graph_window = None
+        self.validator = MetaValidator()  # checks .meta / .xml buffers in the background
+        self._validate_job = None
+        self._validate_line = 1  # next line a full validation pass feeds to the parser
+        self._validation_messages = {}  # line -> first error on it, for the hover tip
+        self.validation_tip = None
+        self.python_workers = PythonWorkerPool()  # warm interpreter for Run Selection / Run Python File
+        self.terminals = []  # TerminalSession of every open terminal window
+        self.startup_ready = threading.Event()  # set once the deferred start-up work is done
+        icon = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FDFE.ico')
+        if sys.platform == 'win32' and os.path.exists(icon):
+            try:
+                root.iconbitmap(icon)  # FiveM Data File Editor icon, shipped next to the script
+            except tk.TclError:
+                pass
 
 
         # Set dark theme colors
@@ -46,11 +2687,34 @@ class CodeEditor:
         self.setup_menus()
         self.setup_shortcuts()
         self.setup_tags()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        # Anything optional waits until the window has been drawn
+        self.root.after(STARTUP_DEFER_MS, self._finish_startup)
+
+    def _finish_startup(self):
+        """Start-up work that can wait for the window: warming up Pygments off the main thread"""
+        def warm_up():
+            try:
+                with perf.span('preload lexers'):
+                    preload_lexers()
+            except Exception:
+                highlight_log.exception("Preloading lexers failed")
+            finally:
+                self.startup_ready.set()
+
+        threading.Thread(target=warm_up, daemon=True).start()
+
+    def on_closing(self):
+        """Let the helper processes go, then close the window"""
+        for session in self.terminals:
+            session.close()
+        self.terminals.clear()
+        self.python_workers.shutdown()
+        if self._search_pool is not None:
+            self.cancel_search()
+            self._search_pool.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
 
-        # Configure syntax highlighting
-        self.blue_keywords = r'\b(import|for|print|as|fx_version|game|from)\b'
-        self.green_keywords = r'\b(client_script|server_script|files)\b|\'.*?\'|\".*?\"|\#.*?(?:\#|$)'
-        
     def setup_theme(self):
         """Configure the dark theme for all UI elements"""
         style = ttk.Style()
@@ -64,259 +2728,411 @@ class CodeEditor:
         background=self.colors['bg'],
         foreground=self.colors['fg']
     )
+        style.configure('Dark.TCheckbutton', background=self.colors['bg'], foreground=self.colors['fg'])
+        style.configure('Dark.Treeview', background=self.colors['bg'], fieldbackground=self.colors['bg'],
+                        foreground=self.colors['fg'])
         self.root.configure(bg=self.colors['bg'])
-        try:
-            DWMWA_USE_IMMERSIVE_DARK_MODE = 20
-            set_window_attribute = windll.dwmapi.DwmSetWindowAttribute
-            get_parent = windll.user32.GetParent
-            hwnd = get_parent(self.root.winfo_id())
-            rendering_policy = c_int(2)
-            value = c_int(1)
-            set_window_attribute(hwnd, DWMWA_USE_IMMERSIVE_DARK_MODE, byref(value), sizeof(value))
-        except:
-            pass  # Fallback for non-Windows systems
+        if sys.platform == 'win32':
+            # Dark title bar (Windows 10 1809+); done before the window is shown to avoid a flash
+            from ctypes import windll, byref, sizeof, c_int
+            try:
+                DWMWA_USE_IMMERSIVE_DARK_MODE = 20
+                hwnd = windll.user32.GetParent(self.root.winfo_id())
+                value = c_int(1)
+                windll.dwmapi.DwmSetWindowAttribute(hwnd, DWMWA_USE_IMMERSIVE_DARK_MODE,
+                                                    byref(value), sizeof(value))
+            except (OSError, AttributeError):
+                pass  # older Windows without the attribute
 
     def setup_tags(self):
-        # Configure basic tags
-        self.text_area.tag_configure("keyword", foreground="#569CD6")    # Blue
-        self.text_area.tag_configure("string", foreground="#CE9178")     # Orange-red
-        self.text_area.tag_configure("comment", foreground="#6A9955")    # Green
-        self.text_area.tag_configure("function", foreground="#DCDCAA")   # Yellow
-        self.text_area.tag_configure("function2", foreground="#FFDD0D")   # Bright Yellow
-        self.text_area.tag_configure("number", foreground="#B5CEA8")     # Light green
-    
-        # Configure Pygments tags
-        pygments_tags = {
-            'token_keyword_namespace': '#569CD6',  # Blue
-            'token_name_namespace': '#4EC9B0',     # Teal
-            'token_string': '#CE9178',             # Orange
-            'token_comment': '#6A9955',            # Green
-            'token_name': '#D4D4D4'                # Light gray
-        }
-    
-        for tag, color in pygments_tags.items():
-            print(f"Configuring tag: {tag} with color: {color}")
-            self.text_area.tag_configure(tag, foreground=color)
+        # Syntax highlighting tags
+        for tag, style in HIGHLIGHT_TAG_STYLES.items():
+            highlight_log.debug("Configuring tag %s with %s", tag, style)
+            self.text_area.tag_configure(tag, **style)
+        self.text_area.tag_configure("find_match", background="#613214")  # Find/Replace matches
+        self.text_area.tag_lower("find_match", tk.SEL)
+        self.text_area.tag_configure("xml_error", underline=True)  # .meta / .xml validation errors
+        try:
+            self.text_area.tag_configure("xml_error", underlinefg="#F44747")  # Tk 8.6.6+
+        except tk.TclError:
+            pass
+        self.text_area.tag_bind("xml_error", "<Enter>", self._show_validation_tip)
+        self.text_area.tag_bind("xml_error", "<Motion>", self._show_validation_tip)
+        self.text_area.tag_bind("xml_error", "<Leave>", self._hide_validation_tip)
 
 
     def toggle_line_mark(self, event):
         """Toggle line marking when clicking line numbers"""
-        # Get clicked line number
-        index = self.line_numbers.index(f"@{event.x},{event.y}")
+        # Get clicked line number (the gutter lines up with the text area)
+        index = self.text_area.index(f"@0,{event.y}")
         line = int(float(index))
     
         # Configure marked line appearance if not already done
         self.text_area.tag_configure("marked_line", background="#2d4b6d")
     
-        # Toggle the mark
-        if line in self.marked_lines:
-            self.marked_lines.remove(line)
+        # Toggle the mark; the tag moves with the text, so it decides whether the line is marked
+        if "marked_line" in self.text_area.tag_names(f"{line}.0"):
+            self.marked_lines.discard(line)
             self.text_area.tag_remove("marked_line", f"{line}.0", f"{line+1}.0")
         else:
             self.marked_lines.add(line)
             self.text_area.tag_add("marked_line", f"{line}.0", f"{line+1}.0")
+        self.redraw_line_numbers()
 
     # Add this method to the CodeEditor class
     def on_text_modified(self, event=None):
         """Handle text modifications"""
         if self.text_area.edit_modified():
-            # Apply appropriate highlighting based on file type
-            if self.current_file and self.current_file.endswith('.bas'):
-                self.highlight_syntax()
-            else:
-                self.apply_pygments_highlighting()
-        
-            # Update line numbers
-            self.update_line_numbers()
-        
+            # Highlighting and line numbers catch up once typing pauses
+            self.changes.request(document=True)
+
             # Reset the modified flag
             self.text_area.edit_modified(False)
 
+    def on_focus_in(self, event=None):
+        self.changes.request(document=True)
+
+    def refresh_after_change(self, document, viewport):
+        """Run by the change scheduler once a burst of events has settled"""
+        if document:
+            # Apply appropriate highlighting based on file type
+            self.highlight_syntax()
+            if self.find_status is not None and self.find_index.dirty:
+                self._highlight_visible_matches()
+                self._show_find_status(f"{self.find_index.total()} matches")
+            self._schedule_validation()
+        self.update_line_numbers()
+
 
     def highlight_syntax(self, event=None):
-        """Apply syntax highlighting based on file type"""
-        # Remove existing tags
-        for tag in self.text_area.tag_names():
-            if tag != "sel":
-                self.text_area.tag_remove(tag, "1.0", tk.END)
-    
-        content = self.text_area.get("1.0", tk.END)
-    
-        if self.current_file and self.current_file.endswith('.bas'):
-            # Liberty BASIC handling remains unchanged
-            patterns = self.syntax_patterns['.bas']
-            for pattern_type, pattern in patterns.items():
-                tag_name = pattern_type.rstrip('s')
-                for match in re.finditer(pattern, content, re.MULTILINE):
-                    start = f"1.0+{match.start()}c"
-                    end = f"1.0+{match.end()}c"
-                    self.text_area.tag_add(tag_name, start, end)
-        else:
-            try:
-                if self.current_file:
-                    content = self.text_area.get("1.0", tk.END)
-                    lexer = get_lexer_for_filename(self.current_file)
-                    tokens = lexer.get_tokens(content)
-                
-                    pos = "1.0"
-                    for ttype, value in tokens:
-                        # Skip whitespace tokens
-                        if str(ttype) == 'Token.Text' and value.isspace():
-                            pos = self.text_area.index(f"{pos}+{len(value)}c")
-                            continue
-                        # Inside highlight_syntax method, before token mapping:
-                        print(f"Found token: {str(ttype)} = '{value}'")  # Debug print
-
-                        # Map token types
-                        if str(ttype).startswith('Token.Keyword'):
-                            tag = 'token_keyword_namespace'  # Blue
-                        elif str(ttype).startswith('Token.Name.Namespace'):
-                            tag = 'token_name_namespace'     # Cyan
-                        elif str(ttype).startswith('Token.Name.Function'):
-                            tag = 'function'                 # Yellow
-                        elif str(ttype).startswith('Token.Name.Builtin'):
-                            tag = 'token_keyword_namespace'  # Blue (for built-in functions)
-                        elif str(ttype).startswith('Token.Literal.String'):
-                            tag = 'token_string'             # Orange
-                        elif str(ttype).startswith('Token.Comment'):
-                            tag = 'token_comment'            # Green
-                        elif str(ttype).startswith('Token.Number'):
-                            tag = 'number'                   # Light green
-                        elif str(ttype) == 'Token.Punctuation':
-                            if value in '()':
-                                tag = 'function2'             # Yellow for parentheses
-                            else:
-                                tag = 'token_name'           # Gray for other punctuation like colon
-                        else:
-                            pos = self.text_area.index(f"{pos}+{len(value)}c")
-                            continue
-                    
-                        print(f"Token: {ttype}, Value: '{value}', Position: {pos}")  # Debug print
-                        end_pos = self.text_area.index(f"{pos}+{len(value)}c")
-                        self.text_area.tag_add(tag, pos, end_pos)
-                        pos = end_pos
-                    
-            except Exception as e:
-                print(f"Highlighting error: {e}")
+        """Apply syntax highlighting based on file type (Liberty BASIC included)"""
+        self.highlight_changed_lines()
+
+    def highlight_changed_lines(self):
+        """Re-highlight only the lines edited since the last pass
 
+        Visible lines the background pass has not reached are painted straight away
+        and the edit itself gets a short pass; the rest of the file, and any long tail
+        of the edit, is lexed on a background thread.
+        """
+        if not self._ensure_highlighter():
+            return
+        highlighter = self.highlighter
+        if highlighter.resumable:
+            highlighter.prepare(self._last_line())
+            self._painted_viewport = None
+            self._paint_viewport()
+            if not self._highlight_slice(HIGHLIGHT_SLICE_MS):
+                return
+        if highlighter.pending:
+            self._schedule_background_highlight()
 
+    def _ensure_highlighter(self):
+        """Point the highlighter at the current file's lexer; False if there is none"""
+        highlighter = self.highlighter
+        if self.current_file != highlighter.filename:
+            lexer = None
+            if self.current_file:
+                lexer = lexer_for_filename(self.current_file)
+                if lexer is None:
+                    highlight_log.info("No lexer for %s", self.current_file)
+            highlighter.reset(self.current_file, lexer)
+            self._painted_viewport = None
+        return highlighter.lexer is not None
 
+    def _last_line(self):
+        return int(self.text_area.index("end-1c").split('.')[0])
 
+    def _checked_line_index(self):
+        """The line index, rebuilt from the widget if it has lost step with it"""
+        if self.line_index.line_count() != self._last_line():
+            self.line_index.reset(self.text_area.get("1.0", tk.END))
+        return self.line_index
 
-    def apply_pygments_highlighting(self):
-        print("\n--- Starting Pygments Highlighting ---")
-        print(f"Current file: {self.current_file}")
-    
-        if not self.current_file or self.current_file.endswith('.bas'):
-            print("Skipping highlighting - no file or Liberty BASIC file")
+    def _apply_highlight_ranges(self, start, end, ranges):
+        """Clear the highlight tags from line start to end and apply ranges (offsets from start)"""
+        apply_tag_ranges(self.text_area, self._checked_line_index(), start, end, ranges)
+
+    def _highlight_slice(self, budget_ms):
+        """Lex from the first stale line for about budget_ms, then re-tag what was lexed
+
+        Only HIGHLIGHT_WINDOW_LINES lines are fetched from the widget. If a block opened
+        in them may run past the window, the pass is left to the lexing thread rather
+        than copying the rest of the buffer here. Returns False if lexing failed.
+        """
+        highlighter = self.highlighter
+        highlighter.prepare(self._last_line())
+        start = highlighter.restart_line()
+        if start is None:
+            return True
+        deadline = perf_counter() + budget_ms / 1000
+        base = f"{start}.0"
+        try:
+            window_end = start + HIGHLIGHT_WINDOW_LINES
+            if window_end <= self._last_line():
+                window = self.text_area.get(base, f"{window_end}.0")
+                result = highlighter.relex(window, start, deadline, partial=True)
+            else:
+                result = highlighter.relex(self.text_area.get(base, tk.END), start, deadline)
+            if result is None:
+                return True  # still pending: _background_highlight takes it from here
+            stop, ranges = result
+        except Exception:
+            highlighter.invalidate()
+            highlight_log.exception("Highlighting error")
+            return False
+
+        # Clear and re-apply tags only over the region that was re-lexed
+        self._apply_highlight_ranges(start, f"{stop}.0" if stop else tk.END, ranges)
+        return True
+
+    def _paint_viewport(self):
+        """Provisionally highlight visible lines the background pass has not reached yet"""
+        highlighter = self.highlighter
+        if not highlighter.frontier:
             return
-        
-        content = self.text_area.get("1.0", tk.END)
-        print(f"Content to highlight: '{content.strip()}'")
-    
+        first = int(self.text_area.index("@0,0").split('.')[0])
+        last = int(self.text_area.index(f"@0,{self.text_area.winfo_height()}").split('.')[0])
+        first = max(first, highlighter.frontier[0])
+        if last < first or (first, last) == self._painted_viewport:
+            return
+        self._painted_viewport = (first, last)
+        base, end = f"{first}.0", f"{last + 1}.0"
         try:
-            lexer = get_lexer_for_filename(self.current_file)
-            tokens = list(lexer.get_tokens(content))
-            print(f"Found {len(tokens)} tokens:")
-        
-            pos = "1.0"
-            for token_type, value in tokens:
-                end_pos = self.text_area.index(f"{pos}+{len(value)}c")
-                tag = str(token_type).lower().replace('.', '_')
-                print(f"Token: {token_type}, Value: '{value}', Position: {pos}-{end_pos}")
-                self.text_area.tag_add(tag, pos, end_pos)
-                pos = end_pos
-            
-        except Exception as e:
-            print(f"Pygments error: {e}")
-        print("--- End Highlighting ---\n")
+            ranges = highlighter.preview(self.text_area.get(base, end), first)
+        except Exception:
+            highlight_log.exception("Highlighting error")
+            return
+        self._apply_highlight_ranges(first, end, ranges)
 
+    def _schedule_background_highlight(self):
+        if self._highlight_job is None:
+            self._highlight_job = self.root.after_idle(self._background_highlight)
 
+    def _background_highlight(self):
+        """Paint the visible lines, then hand the next stretch of the file to the lexing thread"""
+        self._highlight_job = None
+        if not self.current_file or not self._ensure_highlighter():
+            return
+        self._paint_viewport()
+        if not self._lex_running:
+            self._start_lex_pass()
 
-        
+    def _start_lex_pass(self, window_lines=HIGHLIGHT_WINDOW_LINES):
+        """Lex a snapshot of the next stale lines on a worker thread
 
-        # Syntax Colors For Liberty BASIC
-        self.text_area.tag_configure("keyword", foreground="#569CD6")    # Blue
-        self.text_area.tag_configure("string", foreground="#CE9178")     # Orange-red
-        self.text_area.tag_configure("comment", foreground="#6A9955")    # Green
-        self.text_area.tag_configure("function", foreground="#DCDCAA")   # Yellow
-        self.text_area.tag_configure("number", foreground="#B5CEA8")     # Light green
-        self.text_area.tag_configure("category", foreground="#C586C0")  # Purple color
-        self.text_area.tag_configure("handle", foreground="#FF8C00")    # Orange color
-        self.text_area.tag_configure("variable", foreground="#00FFFF")  # Cyan color
-
-        # Pygments Syntax Highlighting
-        self.text_area.tag_configure("token_keyword_namespace", foreground="#569CD6")
-        self.text_area.tag_configure("token_name_namespace", foreground="#4EC9B0")
-        self.text_area.tag_configure("token_name", foreground="#D4D4D4")
-
-        # Defines Liberty BASIC Syntax Highlighting
-
-        self.syntax_patterns = {
-                '.bas': {
-                    'variables': r'[A-Za-z]+\$',                     
-                    'categories': r'\[.*?\]',
-                    'handles': r'#\w+', 
-                    'keywords': r'\b(bmpbutton|BMPBUTTON|MENU|menu|textbox|TEXTBOX|CallDLL|loadbmp|LOADBMP|WindowWidth|WindowHeight|UpperLeftX|UpperLeftY|timer|TIMER|WAIT|wait|Wait|PRINT|print|Print|INPUT|input|Input|IF|if|If|THEN|then|Then|ELSE|else|Else|END|end|End|FOR|for|For|TO|to|To|NEXT|next|Next|GOTO|goto|Goto|GOSUB|gosub|Gosub|RETURN|return|Return|DIM|dim|Dim|LET|let|Let|REM|rem|Rem|OPEN|open|Open|CLOSE|close|Close|READ|read|Read|DATA|data|Data|RESTORE|restore|Restore|CLS|cls|Cls|LOCATE|locate|Locate|COLOR|color|Color|AS|as|As)\b',
-                    'functions': r'[A-Za-z_][A-Za-z0-9_]*(?=\s*\()',
-                    'strings': r'\".*?\"',
-                    'comments': r'\'.*$',
-                    'numbers': r'\b\d+\.?\d*\b'
-                }
-            }
-        
-        # Colors for pygments
-        pygments_tags = {
-            'token_keyword_namespace': '#569CD6',  # Blue
-            'token_name_namespace': '#4EC9B0',     # Teal
-            'token_string': '#CE9178',             # Orange
-            'token_comment': '#6A9955',            # Green
-            'token_name': '#D4D4D4'                # Light gray
-        }
-    
-        for tag, color in pygments_tags.items():
-            print(f"Configuring tag: {tag} with color: {color}")  # Debug print
-            self.text_area.tag_configure(tag, foreground=color)
+        The thread only reads the text and a copy of the highlighter's tables; the
+        result comes back through root.after() and is dropped if an edit bumped the
+        highlighter's generation meanwhile. A window a block may run out of is
+        retried four times the size, until it reaches the end of the buffer.
+        """
+        highlighter = self.highlighter
+        highlighter.prepare(self._last_line())
+        start = highlighter.restart_line()
+        if start is None:
+            return
+        base = f"{start}.0"
+        window_end = start + window_lines
+        partial = highlighter.resumable and window_end <= self._last_line()
+        text = self.text_area.get(base, f"{window_end}.0" if partial else tk.END)
+        snapshot = highlighter.snapshot(copy=True)
+
+        def lex_text():
+            try:
+                deadline = perf_counter() + HIGHLIGHT_THREAD_MS / 1000
+                result, error = highlighter.lex(snapshot, text, start, deadline, partial), None
+            except Exception as e:
+                result, error = None, e
+            # Use after() to hand the result back to the UI thread
+            self.root.after(0, self._finish_lex_pass, snapshot[0], start, window_lines, result, error)
+
+        self._lex_running = True
+        threading.Thread(target=lex_text, daemon=True).start()
+
+    def _finish_lex_pass(self, generation, start, window_lines, result, error):
+        self._lex_running = False
+        highlighter = self.highlighter
+        if generation != highlighter.generation:
+            # Edited (or another file loaded) while lexing: the result is stale
+            if highlighter.pending:
+                self._schedule_background_highlight()
+            return
+        if error is not None:
+            highlighter.invalidate()
+            highlight_log.error("Highlighting error on the lexing thread: %s", error, exc_info=error)
+            return
+        if result is None:
+            # A block opened in the window may close past it; try a bigger one
+            self._start_lex_pass(window_lines * 4)
+            return
+        stop, ranges = highlighter.commit(result)
+        self._apply_highlight_ranges(start, f"{stop}.0" if stop else tk.END, ranges)
+        if highlighter.pending:
+            self._schedule_background_highlight()
+
+    def apply_pygments_highlighting(self):
+        if Trace.highlight:
+            highlight_log.debug("Pygments highlighting for %s", self.current_file)
+        if not self.current_file:
+            return
+        # Shares the incremental highlighter, so only lines edited since the last pass are re-lexed
+        self.highlight_changed_lines()
 
     def on_key_press(self, event=None):
         """Handle key press events"""
-        self.update_line_numbers()
+        self.changes.request(viewport=True)
 
     def update_line_numbers(self):
-        """Update the line numbers display"""
-        lines = self.text_area.get("1.0", tk.END).count("\n")
-        line_numbers_text = "\n".join(str(i) for i in range(1, lines + 1))
-        self.line_numbers.config(state="normal")
-        self.line_numbers.delete("1.0", tk.END)
-        self.line_numbers.insert("1.0", line_numbers_text)
-        self.line_numbers.config(state="disabled")
+        """Update the line numbers display if the view or the line count changed"""
+        view = (self.text_area.yview()[0], self._last_line())
+        if view != self._gutter_view:
+            self.redraw_line_numbers()
+
+    def redraw_line_numbers(self, event=None):
+        """Draw the numbers (and marks) of the visible lines only, placed with dlineinfo"""
+        started = perf_counter()
+        text = self.text_area
+        gutter = self.line_numbers
+        last_line = self._last_line()
+        self._gutter_view = (text.yview()[0], last_line)
+        gutter.delete("all")
+        width = int(gutter.cget('width'))
+        index = text.index("@0,0")
+        line = int(index.split('.')[0])
+        bottom = int(text.index(f"@0,{text.winfo_height()}").split('.')[0])
+
+        # Marked lines on screen, read from the tag so they follow edits
+        marked = set()
+        ranges = text.tag_ranges("marked_line")
+        for first, last in zip(ranges[0::2], ranges[1::2]):
+            first = int(str(first).split('.')[0])
+            last_line_of_mark, last_col = map(int, str(last).split('.'))
+            if last_col == 0:
+                last_line_of_mark -= 1  # the mark ends at the start of the next line
+            marked.update(range(max(first, line), min(last_line_of_mark, bottom) + 1))
+        # Lines with validation errors (.meta / .xml)
+        errors = {int(str(first).split('.')[0]) for first in text.tag_ranges("xml_error")[0::2]}
+
+        while line <= min(bottom, last_line):
+            info = text.dlineinfo(f"{line}.0")
+            if info is not None:
+                y, height = info[1], info[3]
+                if line in marked:
+                    gutter.create_rectangle(0, y, width, y + height, fill="#2d4b6d", outline="")
+                if line in errors:
+                    gutter.create_oval(3, y + height // 2 - 3, 9, y + height // 2 + 3, fill="#F44747", outline="")
+                gutter.create_text(width - 4, y, anchor="ne", text=str(line), font=self.gutter_font,
+                                   fill="#F44747" if line in errors else self.colors['line_fg'])
+            line += 1
+        perf.record('gutter', perf_counter() - started)
+
+    def _validates(self):
+        return bool(self.current_file) and self.current_file.lower().endswith(('.meta', '.xml'))
+
+    def _reset_validation(self):
+        """Drop the results for the previous file"""
+        if self._validate_job is not None:
+            self.root.after_cancel(self._validate_job)
+            self._validate_job = None
+        self.validator.reset(check_values=bool(self.current_file) and self.current_file.lower().endswith('.meta'))
+        self._validation_messages = {}
+        self.text_area.tag_remove("xml_error", "1.0", tk.END)
+        self._hide_validation_tip()
+
+    def _schedule_validation(self):
+        """Validate again once edits have paused for META_VALIDATE_DELAY_MS"""
+        if not self._validates():
+            return
+        if self._validate_job is not None:
+            self.root.after_cancel(self._validate_job)
+        self._validate_job = self.root.after(META_VALIDATE_DELAY_MS, self._validate)
+
+    def _validate(self):
+        self._validate_job = None
+        if self._loader is not None:
+            self._schedule_validation()  # wait for the rest of the file
+            return
+        validator = self.validator
+        if validator.complete:
+            number = validator.edited_item()
+            if number is not None:
+                first, col, last, _ = validator.items[number]
+                with perf.span('validate'):
+                    checked = validator.recheck(number, self.text_area.get(f"{first}.{col}", f"{last}.0 lineend"))
+                if checked:
+                    self._show_validation()
+                    return
+            elif not validator.dirty:
+                return
+        # Stream the whole buffer through the parser, a slice per idle callback
+        validator.begin()
+        self._validate_line = 1
+        self._validate_slice()
+
+    def _validate_slice(self):
+        self._validate_job = None
+        start = self._validate_line
+        end = start + META_VALIDATE_LINES
+        final = end > self._last_line()
+        with perf.span('validate'):
+            more = self.validator.feed(self.text_area.get(f"{start}.0", f"{end}.0"), final)
+        if more:
+            self._validate_line = end
+            self._validate_job = self.root.after_idle(self._validate_slice)
+        else:
+            self._show_validation()
+
+    def _show_validation(self):
+        """Underline the validator's errors and mark their lines in the gutter"""
+        widget = self.text_area
+        widget.tag_remove("xml_error", "1.0", tk.END)
+        errors = self.validator.all_errors()
+        if Trace.highlight:
+            highlight_log.debug("Validation of %s: %d problem(s)", self.current_file, len(errors))
+        self._validation_messages = {}
+        lengths = self._checked_line_index().lengths
+        indices = []
+        for line, col, message in errors[:META_MAX_MARKERS]:
+            if line > len(lengths):
+                continue
+            self._validation_messages.setdefault(line, message)
+            if col >= lengths[line - 1] - 1:
+                col = 0  # nothing after the error's column (e.g. "no element found"): mark the line
+            indices += (f"{line}.{col}", f"{line}.0 lineend")
+        if indices:
+            widget.tk.call(widget._w, 'tag', 'add', 'xml_error', *indices)
+        self.redraw_line_numbers()
+
+    def _show_validation_tip(self, event):
+        line = int(self.text_area.index(f"@{event.x},{event.y}").split('.')[0])
+        message = self._validation_messages.get(line)
+        if message is None:
+            return
+        if self.validation_tip is None:
+            self.validation_tip = tk.Label(self.text_area, justify=tk.LEFT, anchor='sw',
+                                           background=self.colors['menu_bg'], foreground="#F44747",
+                                           font=('Consolas', 9))
+            self.validation_tip.place(x=8, rely=1.0, y=-8, anchor='sw')
+        self.validation_tip.config(text=f"Line {line}: {message}")
+
+    def _hide_validation_tip(self, event=None):
+        if self.validation_tip is not None:
+            self.validation_tip.destroy()
+            self.validation_tip = None
 
     def on_click(self, event=None):
         """Handle mouse click events"""
-        print(f"Click event at: {event.x}, {event.y}")  # Debug print
-        self.update_line_numbers()
+        if Trace.scroll:
+            scroll_log.debug("Click at %s,%s", event.x, event.y)
         self.text_area.focus_set()
-        # Ensure scroll positions stay synced after click
-        first = self.text_area.yview()[0]
-        self.line_numbers.yview_moveto(first)
-        # Get visible lines range instead of resetting
-        first_visible = self.text_area.index("@0,0")
-        last_visible = self.text_area.index(f"@0,{self.text_area.winfo_height()}")
-    
-        # Update only visible line numbers
-        first_line = int(float(first_visible))
-        last_line = int(float(last_visible)) + 1
-    
-        line_numbers = '\n'.join(str(i) for i in range(first_line, last_line))
-        self.line_numbers.config(state="normal")
-        self.line_numbers.delete("1.0", tk.END)
-        self.line_numbers.insert("1.0", line_numbers)
-        self.line_numbers.config(state="disabled")
-        self.sync_line_numbers()
+        self.changes.request(viewport=True)
 
     def new_file(self):
         """Create a new empty file"""
+        self.cancel_load(clear=False)
         self.current_file = None
+        self.file_encoding = self.file_newline = None
+        self._reset_validation()
         self.text_area.delete("1.0", tk.END)
         self.show_language_dialog()
         self.update_line_numbers()
@@ -383,32 +3199,192 @@ class CodeEditor:
         ]
         filename = filedialog.askopenfilename(filetypes=file_types)
         if filename:
-            self.current_file = filename
-            with open(filename, 'r') as file:
+            self.load_file(filename)
+
+    def load_file(self, filename, line=None):
+        """Load a file into the editor, optionally jumping to a line
+
+        The first chunk is shown (and editable) straight away; the rest is streamed
+        in from idle callbacks while a progress bar with a Cancel button is shown.
+        """
+        try:
+            reader = ChunkedTextReader(filename)
+        except OSError as e:
+            # Find in Files and the Resource Graph can point at a file that has gone since
+            io_log.error("Error opening %s: %s", filename, e)
+            messagebox.showerror("Error", f"Could not open {filename}: {str(e)}")
+            return
+        self.cancel_load(clear=False)
+        self._pending_goto = line
+        self.current_file = filename
+        self._reset_validation()
+        if filename.endswith('.py'):
+            self.python_workers.warm()
+        self.file_encoding = reader.save_encoding
+        # Loading is not something to undo
+        self.text_area.config(undo=False)
+        self.text_area.delete("1.0", tk.END)
+        self._loader = reader
+        self._load_next_chunk()
+        self.update_line_numbers()
+        self.highlight_syntax()
+        TempName = filename
+        WindowName = "FiveM Deata Files Editor v2.8.2 - " + TempName
+        self.root.title(WindowName)
+        if self._loader is not None:
+            self._show_load_progress(os.path.basename(filename))
+
+    def _load_next_chunk(self):
+        self._load_job = None
+        reader = self._loader
+        try:
+            text = reader.read_chunk()
+            if reader.restarted:
+                # Bytes the first chunk's encoding cannot decode: the reader started
+                # over in its fallback, so drop what was shown in the old one
+                reader.restarted = False
                 self.text_area.delete("1.0", tk.END)
-                self.text_area.insert("1.0", file.read())
-            self.update_line_numbers()
-            self.highlight_syntax()
-            TempName = filename
-            WindowName = "FiveM Deata Files Editor v2.8.2 - " + TempName
+                self.file_encoding = reader.save_encoding
+            if text:
+                with perf.span('open insert'):
+                    self.text_area.insert("end-1c", text)
+        except Exception as e:
+            io_log.error("Error reading %s: %s", self.current_file, e)
+            messagebox.showerror("Error", f"Could not read the file: {str(e)}")
+            self.cancel_load()
+            return
+        if reader.done:
+            self._finish_load()
+        else:
+            if self.load_bar is not None:
+                self.load_progress['value'] = reader.progress * 100
+            self._load_job = self.root.after_idle(self._load_next_chunk)
+        self._goto_pending_line()
+
+    def _goto_pending_line(self):
+        """Jump to the line load_file() was asked for, once it has been read in"""
+        line = self._pending_goto
+        if line is None or (self._loader is not None and self._last_line() <= line):
+            return
+        self._pending_goto = None
+        pos = f"{line}.0"
+        self.text_area.mark_set(tk.INSERT, pos)
+        self.text_area.see(pos)
+        self.text_area.tag_remove(tk.SEL, "1.0", tk.END)
+        self.text_area.tag_add(tk.SEL, pos, f"{pos} lineend")
+        self.text_area.focus_set()
+
+    def _finish_load(self):
+        reader = self._loader
+        reader.close()
+        self._loader = None
+        self._hide_load_progress()
+        self.text_area.config(undo=True)
+        self.text_area.edit_reset()
+        self.file_newline = reader.newline
+        self._schedule_validation()
+        io_log.info("Opened %s (%d lines, %s, %s line endings)", self.current_file,
+                    self._last_line(), reader.encoding, repr(reader.newline or '\n'))
+
+    def cancel_load(self, clear=True):
+        """Stop streaming in a file; with `clear`, drop the partly loaded text too"""
+        if self._loader is None:
+            return
+        if self._load_job is not None:
+            self.root.after_cancel(self._load_job)
+            self._load_job = None
+        self._loader.close()
+        self._loader = None
+        self._hide_load_progress()
+        self.text_area.config(undo=True)
+        self.text_area.edit_reset()
+        if clear:
+            # A partial file must not be saved over the real one
+            io_log.info("Cancelled loading %s", self.current_file)
+            self.text_area.delete("1.0", tk.END)
+            self.current_file = None
+            self.file_encoding = self.file_newline = None
             self.root.title(WindowName)
 
+    def _show_load_progress(self, name):
+        self.load_bar = ttk.Frame(self.root, style='Dark.TFrame')
+        ttk.Label(self.load_bar, text=f"Loading {name}...", style='Dark.TLabel').pack(side=tk.LEFT, padx=5)
+        self.load_progress = ttk.Progressbar(self.load_bar, maximum=100, length=200)
+        self.load_progress.pack(side=tk.LEFT, padx=5, pady=2)
+        ttk.Button(self.load_bar, text="Cancel", command=self.cancel_load,
+                   style='Dark.TButton').pack(side=tk.LEFT, padx=5)
+        self.load_bar.pack(side=tk.BOTTOM, fill=tk.X, before=self.main_frame)
+
+    def _hide_load_progress(self):
+        if self.load_bar is not None:
+            self.load_bar.destroy()
+            self.load_bar = None
 
+    def _still_loading(self):
+        """Warn and return True while a file is being streamed in; saving now would truncate it"""
+        if self._loader is None:
+            return False
+        messagebox.showwarning("Warning", "Please wait until the file has finished loading")
+        return True
 
     def save_file(self):
         """Save the current file"""
+        if self._still_loading():
+            return
         if self.current_file:
-            with open(self.current_file, 'w') as file:
-                file.write(self.text_area.get("1.0", tk.END))
-                filename = self.current_file
+            self._save_to(self.current_file)
+        else:
+            self.save_as()
+
+    def _save_to(self, filename):
+        """Write a snapshot of the buffer to filename on a worker thread
+
+        A save requested while one is running is folded into one more save, of
+        the text as it is when the running one finishes.
+        """
+        if self._saving:
+            self._save_again = filename
+            return
+        self._saving = True
+        # "end-1c": leave out the newline Tk keeps after the last line
+        text = self.text_area.get("1.0", "end-1c")
+        encoding, newline = self.file_encoding, self.file_newline
+
+        def write():
+            try:
+                with perf.span('save write'):
+                    write_file_atomically(filename, text, encoding, newline)
+                error = None
+            except Exception as e:
+                error = e
+            try:
+                # Use after() to report back on the UI thread
+                self.root.after(0, self._save_finished, filename, error)
+            except (RuntimeError, tk.TclError):
+                pass  # the editor was closed while saving
+
+        # Not a daemon, so closing the editor waits for the write to finish
+        threading.Thread(target=write).start()
+
+    def _save_finished(self, filename, error):
+        self._saving = False
+        if error is not None:
+            io_log.error("Error saving %s: %s", filename, error)
+            messagebox.showerror("Error", f"Could not save {filename}: {str(error)}")
+        else:
+            io_log.info("Saved %s", filename)
+            if filename == self.current_file:
                 TempName = filename
                 WindowName = "FiveM Deata Files Editor v2.8.2 - " + TempName
                 self.root.title(WindowName)
-        else:
-            self.save_as()
+        if self._save_again is not None:
+            filename, self._save_again = self._save_again, None
+            self._save_to(filename)
 
     def save_as(self):
         """Save the current file with a new name"""
+        if self._still_loading():
+            return
         file_types = [
             ('All Supported Files', '*.lua;*.meta;*.xml;*.txt;*.json;*.py;*.bas'),
             ('Lua Files', '*.lua'),
@@ -422,8 +3398,7 @@ class CodeEditor:
         filename = filedialog.asksaveasfilename(filetypes=file_types)
         if filename:
             self.current_file = filename
-            with open(filename, 'w') as file:
-                file.write(self.text_area.get("1.0", tk.END))
+            self._save_to(filename)
             self.update_line_numbers()
             self.highlight_syntax()
             TempName = filename
@@ -441,22 +3416,105 @@ class CodeEditor:
         ttk.Label(self.find_window, text="Find:", style='Dark.TLabel').grid(row=0, column=0, padx=5, pady=5)
         self.find_entry = ttk.Entry(self.find_window, style='Dark.TEntry')
         self.find_entry.grid(row=0, column=1, padx=5, pady=5)
+        self._add_find_controls(self.find_window, row=1)
 
-    def find_next(self):
-        """Find the next occurrence of search text"""
-        search_text = self.find_entry.get()
-        current_pos = self.text_area.index(tk.INSERT)
-    
-        pos = self.text_area.search(search_text, current_pos, tk.END)
-        if not pos:
-            pos = self.text_area.search(search_text, "1.0", current_pos)
-    
-        if pos:
-            self.text_area.mark_set(tk.INSERT, pos)
-            self.text_area.see(pos)
-            self.text_area.tag_remove(tk.SEL, "1.0", tk.END)
-            self.text_area.tag_add(tk.SEL, pos, f"{pos}+{len(search_text)}c")
-            self.text_area.focus_set()
+        ttk.Button(self.find_window, text="Find Previous",
+                  command=self.find_previous, style='Dark.TButton').grid(row=3, column=0, pady=5)
+        ttk.Button(self.find_window, text="Find Next",
+                  command=self.find_next, style='Dark.TButton').grid(row=3, column=1, pady=5)
+        self.find_entry.focus_set()
+
+    def _add_find_controls(self, window, row):
+        """Regex / Match case options and the match count, shared by Find and Replace"""
+        ttk.Checkbutton(window, text="Regex", variable=self.find_regex,
+                        style='Dark.TCheckbutton').grid(row=row, column=0, padx=5, sticky='w')
+        ttk.Checkbutton(window, text="Match case", variable=self.find_case,
+                        style='Dark.TCheckbutton').grid(row=row, column=1, padx=5, sticky='w')
+        self.find_status = ttk.Label(window, text="", style='Dark.TLabel')
+        self.find_status.grid(row=row + 1, column=0, columnspan=2, padx=5, sticky='w')
+        self.find_entry.bind('<Return>', lambda e: self.find_next())
+        self.find_entry.bind('<Shift-Return>', lambda e: self.find_previous())
+        window.bind('<Destroy>', lambda e: self._close_find(window) if e.widget is window else None)
+
+    def _close_find(self, window):
+        """Drop the match index and its highlights once the dialog is closed"""
+        if self.find_status is None or self.find_status.winfo_toplevel() is not window:
+            return  # another Find/Replace dialog has taken over
+        self.find_status = None
+        self.find_index.clear()
+        self.text_area.tag_remove("find_match", "1.0", tk.END)
+
+    def _show_find_status(self, message):
+        if self.find_status is not None:
+            self.find_status.config(text=message)
+
+    def _update_find_index(self):
+        """Bring the match index up to date with the search text, its options and any edits"""
+        needle = self.find_entry.get()
+        index = self.find_index
+        if not needle:
+            index.clear()
+            self._show_find_status("")
+            return False
+        key = (needle, self.find_regex.get(), self.find_case.get())
+        if key != index.key:
+            try:
+                pattern = FindIndex.compile(*key)
+            except re.error as e:
+                index.clear()
+                self._show_find_status(f"Bad pattern: {e}")
+                return False
+            with perf.span('find scan'):
+                index.search(key, pattern, self.text_area.get("1.0", "end-1c"))
+        elif index.dirty:
+            with perf.span('find scan'):
+                index.rescan(self._find_lines_text)
+        return True
+
+    def _find_lines_text(self, first, last):
+        return self.text_area.get(f"{first}.0", f"{last}.0 lineend")
+
+    def _highlight_visible_matches(self):
+        """Tag the matches on screen; the rest are tagged as they scroll into view"""
+        widget = self.text_area
+        widget.tag_remove("find_match", "1.0", tk.END)
+        index = self.find_index
+        if index.key is None:
+            return
+        if index.dirty:
+            with perf.span('find scan'):
+                index.rescan(self._find_lines_text)
+        first = int(widget.index("@0,0").split('.')[0])
+        last = int(widget.index(f"@0,{widget.winfo_height()}").split('.')[0])
+        indices = []
+        for line, col, end in index.in_lines(first, last):
+            indices += (f"{line}.{col}", f"{line}.{end}")
+        if indices:
+            widget.tk.call(widget._w, 'tag', 'add', 'find_match', *indices)
+
+    def find_next(self, backwards=False):
+        """Select the next occurrence of the search text after the cursor (or the one before it), wrapping around"""
+        if not self._update_find_index():
+            return
+        line, col = map(int, self.text_area.index(tk.INSERT).split('.'))
+        number = self.find_index.nearest(line, col, backwards)
+        if number is None:
+            self._show_find_status("No matches")
+            self._highlight_visible_matches()
+            return
+        line, first, last = self.find_index.match(number)
+        pos = f"{line}.{first}"
+        self.text_area.mark_set(tk.INSERT, pos)
+        self.text_area.see(pos)
+        self.text_area.tag_remove(tk.SEL, "1.0", tk.END)
+        self.text_area.tag_add(tk.SEL, pos, f"{line}.{last}")
+        self.text_area.focus_set()
+        self._show_find_status(f"{number + 1} of {self.find_index.total()}")
+        self._highlight_visible_matches()
+
+    def find_previous(self):
+        """Select the previous occurrence of the search text"""
+        self.find_next(backwards=True)
 
     def show_replace_dialog(self):
         """Create and display the replace dialog"""
@@ -472,19 +3530,295 @@ class CodeEditor:
         ttk.Label(self.replace_window, text="Replace with:", style='Dark.TLabel').grid(row=1, column=0, padx=5, pady=5)
         self.replace_entry = ttk.Entry(self.replace_window, style='Dark.TEntry')
         self.replace_entry.grid(row=1, column=1, padx=5, pady=5)
+        self._add_find_controls(self.replace_window, row=2)
     
         ttk.Button(self.replace_window, text="Find Next",
-                  command=self.find_next, style='Dark.TButton').grid(row=2, column=0, pady=5)
+                  command=self.find_next, style='Dark.TButton').grid(row=4, column=0, pady=5)
         ttk.Button(self.replace_window, text="Replace",
-                  command=self.replace_next, style='Dark.TButton').grid(row=2, column=1, pady=5)
+                  command=self.replace_next, style='Dark.TButton').grid(row=4, column=1, pady=5)
+        ttk.Button(self.replace_window, text="Replace All",
+                  command=self.replace_all, style='Dark.TButton').grid(row=5, column=0, columnspan=2, pady=5)
 
     def replace_next(self):
         """Replace the current selection with replacement text"""
-        if tk.SEL in self.text_area.tag_names():
+        if self.text_area.tag_ranges(tk.SEL):
             self.text_area.delete(tk.SEL_FIRST, tk.SEL_LAST)
             self.text_area.insert(tk.INSERT, self.replace_entry.get())
         self.find_next()
 
+    def replace_all(self):
+        """Replace every match as a single edit (one undo step, one re-highlight)
+
+        The new text is built in Python and only the lines from the first match to
+        the last are swapped in the widget, with one "replace" call. Returns the
+        number of matches replaced.
+        """
+        started = perf_counter()
+        if not self._update_find_index():
+            return 0
+        widget = self.text_area
+        try:
+            count, first, last, block = self.find_index.replacement(
+                widget.get("1.0", "end-1c"), self.replace_entry.get(), self.find_regex.get())
+        except (re.error, IndexError) as e:
+            self._show_find_status(f"Bad replacement: {e}")
+            return 0
+        if not count:
+            self._show_find_status("No matches")
+            return 0
+
+        # Marked lines inside the block survive if the line count stays the same
+        marks = widget.tag_ranges("marked_line")
+        marked = [line for start, end in zip(marks[0::2], marks[1::2])
+                  for line in range(int(str(start).split('.')[0]), int(str(end).split('.')[0]))
+                  if first <= line <= last]
+        cursor = widget.index(tk.INSERT)
+        widget.edit_separator()
+        widget.replace(f"{first}.0", f"{last}.0 lineend", block)
+        widget.edit_separator()
+        if block.count('\n') == last - first:
+            for line in marked:
+                widget.tag_add("marked_line", f"{line}.0", f"{line + 1}.0")
+        widget.mark_set(tk.INSERT, cursor)
+        widget.tag_remove(tk.SEL, "1.0", tk.END)
+
+        elapsed = perf_counter() - started
+        perf.record('replace all', elapsed, count)
+        self._show_find_status(f"Replaced {count} in {elapsed * 1000:.0f} ms")
+        self._highlight_visible_matches()
+        return count
+
+    def open_folder(self):
+        """Open a folder (e.g. a server's resources) as the workspace for Find in Files"""
+        folder = filedialog.askdirectory(title="Open Folder", mustexist=True)
+        if not folder:
+            return
+        self.cancel_search()
+        for window in (self.find_files_window, self.graph_window):
+            if window is not None:
+                window.destroy()
+        self.workspace = TrigramIndex(folder)
+        self.workspace.load()
+        io_log.info("Opened folder %s (%d files indexed)", folder, len(self.workspace.files))
+        self.show_find_in_files()
+
+    def show_find_in_files(self):
+        """Create and display the Find in Files window for the open folder"""
+        if self.workspace is None:
+            self.open_folder()
+            return
+        if self.find_files_window is not None:
+            self.find_files_window.lift()
+            self.files_entry.focus_set()
+            return
+        window = self.find_files_window = tk.Toplevel(self.root)
+        window.title(f"Find in Files - {self.workspace.folder}")
+        window.transient(self.root)
+        window.configure(bg=self.colors['bg'])
+
+        ttk.Label(window, text="Find:", style='Dark.TLabel').grid(row=0, column=0, padx=5, pady=5)
+        self.files_entry = ttk.Entry(window, style='Dark.TEntry')
+        self.files_entry.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
+        ttk.Button(window, text="Search",
+                  command=self.find_in_files, style='Dark.TButton').grid(row=0, column=2, padx=5, pady=5)
+        options = ttk.Frame(window, style='Dark.TFrame')
+        options.grid(row=1, column=0, columnspan=3, sticky='w')
+        ttk.Checkbutton(options, text="Regex", variable=self.find_regex,
+                        style='Dark.TCheckbutton').pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(options, text="Match case", variable=self.find_case,
+                        style='Dark.TCheckbutton').pack(side=tk.LEFT, padx=5)
+        self.files_status = ttk.Label(window, text="", style='Dark.TLabel')
+        self.files_status.grid(row=2, column=0, columnspan=3, padx=5, sticky='w')
+
+        results = ttk.Frame(window, style='Dark.TFrame')
+        results.grid(row=3, column=0, columnspan=3, padx=5, pady=5, sticky='nsew')
+        self.files_results = tk.Listbox(results, width=100, height=20, activestyle='none',
+                                        background=self.colors['bg'], foreground=self.colors['fg'],
+                                        selectbackground=self.colors['select_bg'],
+                                        font=('Consolas', 10))
+        scrollbar = ttk.Scrollbar(results, command=self.files_results.yview)
+        self.files_results.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.files_results.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        window.columnconfigure(1, weight=1)
+        window.rowconfigure(3, weight=1)
+
+        self.files_entry.bind('<Return>', lambda e: self.find_in_files())
+        self.files_results.bind('<Double-Button-1>', self.open_search_result)
+        self.files_results.bind('<Return>', self.open_search_result)
+        window.bind('<Destroy>', lambda e: self._close_find_in_files() if e.widget is window else None)
+        self.files_entry.focus_set()
+
+    def _close_find_in_files(self):
+        self.cancel_search()
+        self.find_files_window = None
+
+    def find_in_files(self):
+        """Search every file in the workspace, listing matches as each batch of files is done"""
+        needle = self.files_entry.get()
+        if not needle:
+            return
+        try:
+            FindIndex.compile(needle, self.find_regex.get(), self.find_case.get())
+        except re.error as e:
+            self.files_status.config(text=f"Bad pattern: {e}")
+            return
+        self.cancel_search()
+        self.files_results.delete(0, tk.END)
+        self._search_hits = []
+        if self._search_pool is None:
+            import multiprocessing
+            # Not fork: the editor has Tk and several threads running, and a forked
+            # child could inherit a lock one of them holds
+            self._search_pool = concurrent.futures.ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context('spawn'))
+        self._search = WorkspaceSearch(self._search_pool, self.workspace, needle,
+                                       self.find_regex.get(), self.find_case.get())
+        self._search.start()
+        self.files_status.config(text="Searching...")
+        self.root.after(50, self._poll_search, self._search)
+
+    def cancel_search(self):
+        if self._search is not None:
+            self._search.cancel()
+            self._search = None
+
+    def _poll_search(self, search):
+        """Move results from the search thread into the list, a batch of files at a time"""
+        if search is not self._search:
+            return  # cancelled, or replaced by a newer search
+        rows = []
+        stats = None
+        try:
+            while stats is None:
+                kind, payload = search.results.get_nowait()
+                if kind == 'hits':
+                    for path, hits in payload:
+                        name = os.path.relpath(path, self.workspace.folder)
+                        for line, text in hits:
+                            self._search_hits.append((path, line))
+                            rows.append(f"{name}:{line}: {text}")
+                else:
+                    stats = payload
+        except queue.Empty:
+            pass
+        if rows:
+            self.files_results.insert(tk.END, *rows)
+        if stats is None:
+            self.root.after(50, self._poll_search, search)
+            return
+        self._search = None
+        if 'error' in stats:
+            self.files_status.config(text=f"Error: {stats['error']}")
+        else:
+            self.files_status.config(
+                text=f"{stats['matches']} matches in {stats['files']} files "
+                     f"({stats['searched']} searched, {stats['indexed']} re-indexed, {stats['ms']} ms)")
+
+    def open_search_result(self, event=None):
+        """Open the selected Find in Files result at its line"""
+        selection = self.files_results.curselection()
+        if not selection:
+            return
+        self.open_at_line(*self._search_hits[selection[0]])
+
+    def open_at_line(self, path, line):
+        """Show a file at a line, loading it unless it is the one already open"""
+        if self.current_file and os.path.normcase(os.path.abspath(self.current_file)) == os.path.normcase(path):
+            # Already open (perhaps with unsaved edits): just move there
+            self._pending_goto = line
+            self._goto_pending_line()
+        else:
+            self.load_file(path, line=line)
+
+    def show_resource_graph(self):
+        """List the workspace's resources with their dependencies and manifest problems"""
+        if self.workspace is None:
+            messagebox.showinfo("Resource Graph", "Open a resources folder first (File > Open Folder).")
+            return
+        if self.resource_graph is None or self.resource_graph.folder != self.workspace.folder:
+            self.resource_graph = ResourceGraph(self.workspace.folder)
+        if self.graph_window is not None:
+            self.graph_window.lift()
+            self._fill_resource_graph()
+            return
+        window = self.graph_window = tk.Toplevel(self.root)
+        window.title(f"Resource Graph - {self.workspace.folder}")
+        window.transient(self.root)
+        window.configure(bg=self.colors['bg'])
+
+        ttk.Button(window, text="Rescan", command=self._fill_resource_graph,
+                   style='Dark.TButton').grid(row=0, column=0, padx=5, pady=5, sticky='w')
+        self.graph_status = ttk.Label(window, text="", style='Dark.TLabel')
+        self.graph_status.grid(row=0, column=1, padx=5, sticky='w')
+        self.graph_tree = ttk.Treeview(window, columns=('detail',), height=25, style='Dark.Treeview')
+        self.graph_tree.heading('#0', text="Resource")
+        self.graph_tree.heading('detail', text="Details")
+        self.graph_tree.column('#0', width=380)
+        self.graph_tree.column('detail', width=300)
+        scrollbar = ttk.Scrollbar(window, command=self.graph_tree.yview)
+        self.graph_tree.config(yscrollcommand=scrollbar.set)
+        self.graph_tree.grid(row=1, column=0, columnspan=2, padx=(5, 0), pady=5, sticky='nsew')
+        scrollbar.grid(row=1, column=2, pady=5, sticky='ns')
+        window.columnconfigure(1, weight=1)
+        window.rowconfigure(1, weight=1)
+
+        self.graph_tree.bind('<Double-Button-1>', self._open_graph_item)
+        self.graph_tree.bind('<Return>', self._open_graph_item)
+        window.bind('<Destroy>', lambda e: setattr(self, 'graph_window', None) if e.widget is window else None)
+        self._fill_resource_graph()
+
+    def _fill_resource_graph(self):
+        started = perf_counter()
+        graph = self.resource_graph
+        resources = graph.scan()
+        elapsed = perf_counter() - started
+        perf.record('manifest scan', elapsed, len(resources))
+
+        tree = self.graph_tree
+        tree.delete(*tree.get_children())
+        self._graph_targets = {}  # tree item -> (path, line) opened by a double-click
+        problems = 0
+        for name in sorted(resources, key=str.lower):
+            report = resources[name]
+            manifest = report['manifest']
+            issues = (len(report['missing_dependencies']) + len(report['missing_files'])
+                      + len(report['unlisted_data_files']))
+            problems += issues
+            node = tree.insert('', tk.END, text=name, values=(f"{issues} problem(s)" if issues else "",))
+            self._graph_targets[node] = (manifest, 1)
+
+            def group(title, rows):
+                if not rows:
+                    return
+                parent = tree.insert(node, tk.END, text=f"{title} ({len(rows)})", values=("",))
+                for text, detail, target in rows:
+                    item = tree.insert(parent, tk.END, text=text, values=(detail,))
+                    if target is not None:
+                        self._graph_targets[item] = target
+
+            group("Depends on", [(dependency,
+                                  "missing" if dependency in report['missing_dependencies'] else "",
+                                  (resources[dependency]['manifest'], 1) if dependency in resources else None)
+                                 for dependency in report['dependencies']])
+            group("Required by", [(other, "", (resources[other]['manifest'], 1))
+                                  for other in sorted(report['required_by'], key=str.lower)])
+            group("Data files", [(pattern, kind, (manifest, line))
+                                 for kind, pattern, line in report['data_files']])
+            group("Missing files", [(pattern, directive, (manifest, line))
+                                    for directive, pattern, line in report['missing_files']])
+            group("Data files not in files {}", [(pattern, kind, (manifest, line))
+                                                for kind, pattern, line in report['unlisted_data_files']])
+            group("Unreferenced files", [(path, "", (os.path.join(report['folder'], *path.split('/')), 1))
+                                         for path in report['unreferenced']])
+        self.graph_status.config(text=f"{len(resources)} resources, {problems} problem(s) "
+                                      f"({graph.parsed} manifests read, {elapsed * 1000:.0f} ms)")
+
+    def _open_graph_item(self, event=None):
+        target = self._graph_targets.get(self.graph_tree.focus())
+        if target is not None:
+            self.open_at_line(*target)
+
     def configure_lb_path(self):
         """Configure Liberty BASIC installation path"""
         path = filedialog.askdirectory(
@@ -513,8 +3847,10 @@ class CodeEditor:
             return
     
         try:
+            run_log.info("Opening %s in Liberty BASIC (%s)", self.current_file, self.lb_path)
             subprocess.Popen([self.lb_path, self.current_file])
         except Exception as e:
+            run_log.error("Error running Liberty BASIC: %s", e)
             messagebox.showerror("Error", f"Error running Liberty BASIC: {str(e)}")
 
     def run_python_file(self):
@@ -522,86 +3858,182 @@ class CodeEditor:
         if not self.current_file or not self.current_file.endswith('.py'):
             messagebox.showwarning("Warning", "Only Python files can be executed")
             return
-        
-        # Create output window
+        code = self.text_area.get("1.0", "end-1c")
+        self.open_run_window("Python Output", WorkerRun(self.python_workers, code, self.current_file,
+                                                        os.path.dirname(self.current_file) or None))
+
+    def open_run_window(self, title, runner):
+        """Start a WorkerRun and stream its output into a window with Stop and Kill buttons"""
         output_window = tk.Toplevel(self.root)
-        output_window.title("Python Output")
+        output_window.title(title)
         output_window.geometry("600x400")
         output_window.configure(bg=self.colors['bg'])
 
+        toolbar = ttk.Frame(output_window, style='Dark.TFrame')
+        toolbar.pack(fill=tk.X)
+        stop_button = ttk.Button(toolbar, text="Stop", command=runner.stop, style='Dark.TButton')
+        stop_button.pack(side=tk.LEFT, padx=5, pady=5)
+        kill_button = ttk.Button(toolbar, text="Kill", command=runner.kill, style='Dark.TButton')
+        kill_button.pack(side=tk.LEFT, pady=5)
+        status = ttk.Label(toolbar, text="Starting...", style='Dark.TLabel')
+        status.pack(side=tk.LEFT, padx=10)
+
         output_text = ScrolledText(output_window, wrap=tk.WORD,
                                  background=self.colors['bg'],
                                  foreground=self.colors['fg'])
         output_text.pack(fill=tk.BOTH, expand=True)
+        output_text.tag_configure("error", foreground="red")
+        output_text.configure(state='disabled')
 
-        def update_output(text, tag=None):
-            """Thread-safe output update"""
+        def update_output(chunks):
+            """Append (text, tag) chunks, keeping the view pinned to the bottom if it was there"""
+            at_bottom = output_text.yview()[1] >= 1.0
             output_text.configure(state='normal')
-            if tag:
+            for text, tag in chunks:
                 output_text.insert(tk.END, text, tag)
-            else:
-                output_text.insert(tk.END, text)
-        output_text.configure(state='disabled')
-        output_text.see(tk.END)
-
-        
-
-        def run_code():
-            try:
-                code = self.text_area.get("1.0", tk.END)
-                process = subprocess.Popen([sys.executable, '-c', code],
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE,
-                                         universal_newlines=True)
-        
-                stdout, stderr = process.communicate()
-            
-                # Use after() to safely update UI from thread
-                if stdout:
-                    output_window.after(0, update_output, stdout)
-                if stderr:
-                    output_text.tag_configure("error", foreground="red")
-                    output_window.after(0, update_output, f"\nErrors:\n{stderr}", "error")
-            
-            except Exception as e:
-                output_text.tag_configure("error", foreground="red")
-                output_window.after(0, update_output, f"\nError executing code: {str(e)}", "error")
-        
-        threading.Thread(target=run_code, daemon=True).start()
+            excess = int(output_text.index("end-1c").split('.')[0]) - RUN_SCROLLBACK_LINES
+            if excess > 0:
+                output_text.delete("1.0", f"{excess + 1}.0")
+            output_text.configure(state='disabled')
+            if at_bottom:
+                output_text.see(tk.END)
 
+        def drain():
+            """Move up to RUN_LINES_PER_TICK queued lines into the window, then come back"""
+            if not output_window.winfo_exists():
+                return
+            chunks = []
+            returncode = None
+            for _ in range(RUN_LINES_PER_TICK):
+                try:
+                    kind, payload = runner.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == 'exit':
+                    returncode = payload
+                    break
+                tag = "error" if kind == 'err' else ()
+                if chunks and chunks[-1][1] == tag:
+                    chunks[-1][0].append(payload)
+                else:
+                    chunks.append(([payload], tag))
+            if chunks:
+                update_output([(''.join(lines), tag) for lines, tag in chunks])
+            if returncode is None:
+                status.config(text=f"Running... {runner.elapsed():.1f} s")
+                output_window.after(RUN_TICK_MS, drain)
+            else:
+                status.config(text=f"Exited with code {returncode} after {runner.elapsed():.2f} s")
+                stop_button.state(['disabled'])
+                kill_button.state(['disabled'])
 
+        output_window.bind('<Destroy>', lambda e: runner.close() if e.widget is output_window else None)
+        try:
+            runner.start()
+        except OSError as e:
+            update_output([(f"Error executing code: {str(e)}\n", "error")])
+            status.config(text="Could not start")
+            return
+        drain()
 
     def run_selection(self):
-        """Execute the selected Python code"""
-        if not tk.SEL in self.text_area.tag_names():
+        """Execute the selected Python code on the warm worker, leaving the open file alone"""
+        if not self.text_area.tag_ranges(tk.SEL):
             messagebox.showwarning("Warning", "No code selected")
             return
-        
-        selected_text = self.text_area.get(tk.SEL_FIRST, tk.SEL_LAST)
-    
-        # Create temp file and run selected code
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as tf:
-            tf.write(selected_text)
-            temp_file = tf.name
-        
-        self.current_file = temp_file
-        self.run_python_file()
+        code = self.text_area.get(tk.SEL_FIRST, tk.SEL_LAST)
+        cwd = os.path.dirname(self.current_file) if self.current_file else None
+        self.open_run_window("Python Output", WorkerRun(self.python_workers, code, "<selection>", cwd or None))
 
     def new_terminal(self):
-        """Create a new terminal tab"""
-        # Create output window for terminal
+        """Open a terminal window on a shell of its own; several can run side by side
+
+        Output is drawn once per TERMINAL_FRAME_MS with a single insert, whatever the
+        shell prints in between, and the window keeps TERMINAL_SCROLLBACK_LINES lines.
+        """
         terminal_window = tk.Toplevel(self.root)
         terminal_window.title("Terminal")
         terminal_window.geometry("600x400")
         terminal_window.configure(bg=self.colors['bg'])
-    
-        # Create terminal output area
-        terminal_output = ScrolledText(terminal_window, wrap=tk.WORD,
+        terminal_font = tkfont.Font(root=self.root, font=('Consolas', 10))
+        char_width, line_height = terminal_font.measure('0') or 1, terminal_font.metrics('linespace') or 1
+
+        command_entry = tk.Entry(terminal_window, background=self.colors['bg'],
+                                 foreground=self.colors['fg'], insertbackground=self.colors['fg'],
+                                 font=terminal_font)
+        command_entry.pack(side=tk.BOTTOM, fill=tk.X)
+        terminal_output = ScrolledText(terminal_window, wrap=tk.CHAR,
                                      background=self.colors['bg'],
                                      foreground=self.colors['fg'],
-                                     insertbackground=self.colors['fg'])
+                                     insertbackground=self.colors['fg'],
+                                     font=terminal_font)
         terminal_output.pack(fill=tk.BOTH, expand=True)
+        for tag, options in ansi_tag_styles().items():
+            terminal_output.tag_configure(tag, **options)
+        terminal_output.configure(state='disabled')
+
+        if self.workspace is not None:
+            cwd = self.workspace.folder
+        else:
+            cwd = os.path.dirname(self.current_file) if self.current_file else None
+        session = TerminalSession(cwd=cwd or None)
+        try:
+            session.start()
+        except OSError as e:
+            terminal_output.configure(state='normal')
+            terminal_output.insert(tk.END, f"Could not start {session.args[0]}: {e}\n", 'ansi_31')
+            terminal_output.configure(state='disabled')
+            return
+        self.terminals.append(session)
+        terminal_window.title(f"Terminal - {os.path.basename(session.args[0])}")
+
+        def send(event):
+            session.write(command_entry.get() + ('\n' if session.pty else os.linesep))
+            command_entry.delete(0, tk.END)
+            return "break"
+
+        def interrupt(event):
+            if command_entry.selection_present():
+                return None  # plain copy
+            session.interrupt()
+            return "break"
+
+        def resize(event):
+            session.resize(max(event.width // char_width, 20), max(event.height // line_height, 5))
+
+        def draw():
+            """Insert everything the shell printed since the last frame in one call"""
+            if not terminal_window.winfo_exists():
+                return
+            runs = session.scrollback.take()
+            if runs:
+                at_bottom = terminal_output.yview()[1] >= 1.0
+                terminal_output.configure(state='normal')
+                terminal_output.insert(tk.END, *[item for run in runs for item in run])
+                excess = int(terminal_output.index("end-1c").split('.')[0]) - TERMINAL_SCROLLBACK_LINES
+                if excess > 0:
+                    terminal_output.delete("1.0", f"{excess + 1}.0")
+                terminal_output.configure(state='disabled')
+                if at_bottom:
+                    terminal_output.see(tk.END)
+            if session.exited.is_set() and not session.scrollback.chunks:
+                terminal_window.title(f"Terminal - exited with code {session.returncode}")
+                command_entry.configure(state='disabled')
+                return
+            terminal_window.after(TERMINAL_FRAME_MS, draw)
+
+        def close(event):
+            if event.widget is terminal_window:
+                session.close()
+                if session in self.terminals:
+                    self.terminals.remove(session)
+
+        command_entry.bind('<Return>', send)
+        command_entry.bind('<Control-c>', interrupt)
+        terminal_output.bind('<Configure>', resize)
+        terminal_window.bind('<Destroy>', close)
+        command_entry.focus_set()
+        draw()
 
     def show_docs(self):
         """Display the documentation window"""
@@ -691,36 +4123,12 @@ class CodeEditor:
         self.text_area.bind('<Control-n>', lambda e: self.new_file())
         self.text_area.bind('<Control-f>', lambda e: self.show_find_dialog())
         self.text_area.bind('<Control-h>', lambda e: self.show_replace_dialog())
-
-    def sync_line_numbers(self, *args):
-        """Keep line numbers synchronized with text area"""
-        # Get visible range
-        first = self.text_area.yview()[0]
-        last = self.text_area.yview()[1]
-    
-        # Calculate visible lines
-        total_lines = int(float(self.text_area.index("end-1c")))
-        first_line = int(first * total_lines)
-        last_line = min(int(last * total_lines) + 1, total_lines)
-    
-        # Update line numbers
-        self.line_numbers.config(state='normal')
-        self.line_numbers.delete('1.0', tk.END)
-        line_numbers = '\n'.join(str(i+1) for i in range(first_line, last_line))
-        self.line_numbers.insert('1.0', line_numbers)
-        self.line_numbers.config(state='disabled')
-    
-        # Sync scroll position
-        self.line_numbers.yview_moveto(first)
-
+        self.text_area.bind('<Control-F>', lambda e: self.show_find_in_files())  # Ctrl+Shift+F
 
 
     def on_text_change(self, event=None):
         """Handle text changes"""
-        if self.current_file and self.current_file.endswith('.bas'):
-            self.highlight_syntax()
-        else:
-            self.apply_pygments_highlighting()
+        self.highlight_syntax()
 
 
     def setup_ui(self):
@@ -728,12 +4136,11 @@ class CodeEditor:
         self.main_frame = ttk.Frame(self.root, style='Dark.TFrame')
         self.main_frame.pack(fill=tk.BOTH, expand=True)
 
-        # 2. Create line numbers
-        self.line_numbers = tk.Text(self.main_frame, width=6, padx=3, takefocus=0,
-                                   border=0, background=self.colors['line_bg'],
-                                   foreground=self.colors['line_fg'],
-                                   state='disabled',
-                                   font=('Monaco', 11, 'bold'))
+        # 2. Create line numbers (a canvas that only draws the visible lines)
+        self.gutter_font = tkfont.Font(root=self.root, font=('Monaco', 11, 'bold'))
+        self.line_numbers = tk.Canvas(self.main_frame, width=self.gutter_font.measure("0" * 6) + 6,
+                                      takefocus=0, borderwidth=0, highlightthickness=0,
+                                      background=self.colors['line_bg'])
         self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
 
         # 3. Create text area
@@ -755,45 +4162,109 @@ class CodeEditor:
 
 
         # 6. Bind events
-        self.text_area.bind('<KeyRelease>', self.highlight_syntax)
-        self.text_area.bind('<FocusIn>', self.highlight_syntax)
+        self.text_area.bind('<FocusIn>', self.on_focus_in)
         self.text_area.bind('<Key>', self.on_key_press)
         self.text_area.bind('<Button-1>', self.on_click)
         self.line_numbers.bind('<Button-1>', self.toggle_line_mark)
         self.text_area.bind('<<Modified>>', self.on_text_modified)
         self.text_area.bind('<MouseWheel>', self._on_mousewheel)
         self.line_numbers.bind('<MouseWheel>', self._on_mousewheel)
+        self.text_area.bind('<Configure>', self.redraw_line_numbers, add='+')
+
+        # 7. Track which lines each edit touches
+        self.setup_edit_tracking()
+
+    def setup_edit_tracking(self):
+        """Route the text widget's Tcl command through Python so every edit (typing, paste, undo) is seen"""
+        widget = self.text_area
+        self._text_orig = widget._w + "_orig"
+        widget.tk.call("rename", widget._w, self._text_orig)
+        widget.tk.createcommand(widget._w, self._text_dispatch)
+
+    def _text_dispatch(self, *args):
+        """Forward a text widget command, telling the highlighter which lines an edit touched"""
+        call = self.text_area.tk.call
+        if not args or args[0] not in ('insert', 'delete', 'replace'):
+            return call((self._text_orig,) + args)
+
+        # Resolve positions before the edit moves them
+        def position(index):
+            line, col = str(call(self._text_orig, 'index', index)).split('.')
+            return int(line), int(col)
+
+        op = args[0]
+        end, last_char = position('end'), position('end-1c')
+        if op == 'insert':
+            # Tk never inserts after the final newline
+            first = min(position(args[1]), last_char)
+            result = call((self._text_orig,) + args)
+            self._note_insert(first, ''.join(args[2::2]))
+            return result
+        if op == 'delete' and len(args) > 3:
+            # Several ranges at once; simply re-lex everything
+            result = call((self._text_orig,) + args)
+            self.highlighter.invalidate()
+            self.line_index.reset(self.text_area.get("1.0", tk.END))
+            self.find_index.clear()
+            self.validator.invalidate()
+            return result
+
+        first = min(position(args[1]), end)
+        last = min(position(args[2] if len(args) > 2 else f"{args[1]}+1c"), end)
+        result = call((self._text_orig,) + args)
+        if first < last:
+            if last == end:
+                # Tk keeps the final newline, taking the one before the range instead
+                last = last_char
+                if first[1] == 0 and first[0] > 1:
+                    first = position(f"{first[0] - 1}.0 lineend")
+            if first < last:
+                self.highlighter.note_delete(first[0], last[0])
+                self.line_index.note_delete(first, last)
+                self.find_index.note_delete(first[0], last[0])
+                self.validator.note_delete(first[0], last[0])
+        if op == 'replace':
+            self._note_insert(min(first, position('end-1c')), ''.join(args[3::2]))
+        return result
+
+    def _note_insert(self, position, text):
+        self.highlighter.note_insert(position[0], text)
+        self.line_index.note_insert(position[0], position[1], text)
+        self.find_index.note_insert(position[0], text)
+        self.validator.note_insert(position[0], text)
 
     
     def _sync_scroll(self, *args):
         """Synchronize scrolling between text area and line numbers"""
-        print(f"Sync scroll called with args: {args}")  # Debug print
-        self.line_numbers.yview_moveto(args[0])
+        if Trace.scroll:
+            scroll_log.debug("Text view moved to %s", args)
         self.scrollbar.set(*args)
+        self.update_line_numbers()
+        if self.find_status is not None:
+            self._highlight_visible_matches()
+        # Scrolled into lines the background pass has not reached: paint them next
+        if self.highlighter.frontier:
+            self._schedule_background_highlight()
         return True
 
     
     def _on_scroll_all(self, *args):
         """Handle scrollbar movement"""
-        print(f"Scroll all called with args: {args}")  # Debug print
+        if Trace.scroll:
+            scroll_log.debug("Scrollbar command %s", args)
         self.text_area.yview(*args)
-        self.line_numbers.yview(*args)
 
     def _on_mousewheel(self, event):
         """Handle mousewheel scrolling"""
         delta = int(-1 * (event.delta / 120))
         self.text_area.yview_scroll(delta, "units")
-        self.line_numbers.yview_scroll(delta, "units")
         return "break"
 
     
     def handle_modified(self, event=None):
         """Handle text modifications"""
         if self.text_area.edit_modified():
-            if self.current_file and self.current_file.endswith('.bas'):
-                self.highlight_syntax()
-            else:
-                self.apply_pygments_highlighting()
+            self.highlight_syntax()
             self.text_area.edit_modified(False)
 
     def setup_menus(self):
@@ -813,10 +4284,11 @@ class CodeEditor:
         file_menu = tk.Menu(menubar, **menu_config)
         file_menu.add_command(label="New", command=self.new_file)
         file_menu.add_command(label="Open", command=self.open_file)
+        file_menu.add_command(label="Open Folder...", command=self.open_folder)
         file_menu.add_command(label="Save", command=self.save_file)
         file_menu.add_command(label="Save As", command=self.save_as)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.on_closing)
         menubar.add_cascade(label="File", menu=file_menu)
         
         # Edit Menu
@@ -826,12 +4298,62 @@ class CodeEditor:
         edit_menu.add_separator()
         edit_menu.add_command(label="Find", command=self.show_find_dialog)
         edit_menu.add_command(label="Replace", command=self.show_replace_dialog)
+        edit_menu.add_command(label="Find in Files", command=self.show_find_in_files)
         menubar.add_cascade(label="Edit", menu=edit_menu)
         
         # Setup advanced menus
         self.setup_advanced_menus(menubar, menu_config)
         
         self.root.config(menu=menubar)
+
+    def toggle_perf_overlay(self):
+        """Show or hide the performance numbers in the corner of the text area"""
+        if self.show_perf_overlay.get():
+            self.perf_overlay = tk.Label(self.text_area, justify=tk.LEFT, anchor='nw',
+                                         background=self.colors['menu_bg'],
+                                         foreground=self.colors['menu_fg'],
+                                         font=('Consolas', 9))
+            self.perf_overlay.place(relx=1.0, x=-8, y=8, anchor='ne')
+            self.update_perf_overlay()
+        elif self.perf_overlay is not None:
+            self.perf_overlay.destroy()
+            self.perf_overlay = None
+
+    def update_perf_overlay(self):
+        """Refresh the overlay twice a second while it is shown"""
+        if self.perf_overlay is None:
+            return
+        lines = [f"{'stage':<12}{'last':>8}{'p50':>8}{'p95':>8}{'max':>8}"]
+        summary = perf.summary()
+        for stage, stats in summary.items():
+            lines.append(f"{stage:<12}{stats['last_ms']:>8.2f}{stats['p50_ms']:>8.2f}"
+                         f"{stats['p95_ms']:>8.2f}{stats['max_ms']:>8.2f}")
+        rate = summary.get('lex', {}).get('items_per_s')
+        lines.append(f"lexing: {rate:,} tokens/s" if rate else "lexing: -")
+        self.perf_overlay.config(text="\n".join(lines))
+        self.root.after(500, self.update_perf_overlay)
+
+    def export_perf_data(self):
+        """Save the timing summary as JSON, e.g. to attach to a bug report"""
+        filename = filedialog.asksaveasfilename(defaultextension=".json",
+                                                filetypes=[('JSON Files', '*.json')])
+        if not filename:
+            return
+        report = {
+            'editor': WindowName,
+            'file': self.current_file,
+            'lines': self._last_line(),
+            'stages': perf.summary(),
+            'change_events': {'requests': self.changes.requests, 'runs': self.changes.runs,
+                              'collapsed': self.changes.collapsed},
+        }
+        try:
+            with open(filename, 'w') as file:
+                json.dump(report, file, indent=2)
+            io_log.info("Exported performance data to %s", filename)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not export performance data: {str(e)}")
+
     def setup_advanced_menus(self, menubar, menu_config):
         """Setup VSCode-like advanced menus"""
         # Selection Menu
@@ -842,6 +4364,12 @@ class CodeEditor:
         
         # View Menu
         view_menu = tk.Menu(menubar, **menu_config)
+        self.show_perf_overlay = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="Performance Overlay", variable=self.show_perf_overlay,
+                                  command=self.toggle_perf_overlay)
+        view_menu.add_command(label="Export Performance Data...", command=self.export_perf_data)
+        view_menu.add_separator()
+        view_menu.add_command(label="Resource Graph...", command=self.show_resource_graph)
         menubar.add_cascade(label="View", menu=view_menu)
         
         # Go Menu
@@ -867,33 +4395,35 @@ class CodeEditor:
         help_menu.add_command(label="About", command=self.show_about)
         menubar.add_cascade(label="Help", menu=help_menu)
 
-class HTMLtoTk(HTMLParser):
-    def __init__(self, text_widget):
-        super().__init__()
-        self.text = text_widget
-        self.current_pos = "1.0"
-        
-    def handle_starttag(self, tag, attrs):
-        if tag == "span":
-            for attr, value in attrs:
-                if attr == "class":
-                    # Convert Pygments class to tag name
-                    self.current_class = value
-                    
-    def handle_data(self, data):
-        # Insert text and apply tag
-        self.text.insert(self.current_pos, data)
-        if hasattr(self, 'current_class'):
-            end_pos = self.text.index(f"{self.current_pos}+{len(data)}c")
-            self.text.tag_add(self.current_class, self.current_pos, end_pos)
-        self.current_pos = self.text.index(f"{self.current_pos}+{len(data)}c")
+
+# Command line flags handed over to bench/ (see bench/__main__.py) instead of opening the editor
+BENCH_FLAGS = ('--startup-probe', '--benchmark-startup', '--verify-highlighting', '--benchmark-tags',
+               '--benchmark-tokens', '--benchmark-manifests', '--benchmark-terminal', '--benchmark')
+
+
+def _cli_option(name):
+    """Value following `name` on the command line, or None"""
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
 
 
 # Main Entry Point
 if __name__ == "__main__":
+    started = perf_counter()
+    # Logging: FDFE_LOG / --log take a level spec, FDFE_LOG_FILE / --log-file a path
+    configure_logging(_cli_option('--log') or os.environ.get('FDFE_LOG'),
+                      _cli_option('--log-file') or os.environ.get('FDFE_LOG_FILE'))
+
+    if any(flag in sys.argv for flag in BENCH_FLAGS):
+        # Benchmarks and self-checks live in bench/, next to this script
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from bench.__main__ import main
+        sys.exit(main(sys.argv[1:], started))
+
     root = tk.Tk()
-    editor = CodeEditor(root)
     root.geometry("1200x800")
+    editor = CodeEditor(root)
     root.mainloop()
 
 
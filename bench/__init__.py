@@ -0,0 +1,29 @@
+"""Benchmarks and self-checks for FiveM Data File Editor
+
+They drive the editor module itself: the running script when one of its --benchmark /
+--verify flags brought us here, else the editor script next to this folder, imported
+as `fdfe`. See bench/__main__.py for the command line.
+"""
+import glob
+import importlib.util
+import os
+import sys
+
+
+def load_editor():
+    """The editor module, imported once"""
+    main = sys.modules.get('__main__')
+    if getattr(main, 'CodeEditor', None) is not None:
+        return main
+    editor = sys.modules.get('fdfe')
+    if editor is None:
+        folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = sorted(glob.glob(os.path.join(folder, 'FiveM_Data_File_Editor_v*.py')))[-1]
+        spec = importlib.util.spec_from_file_location('fdfe', script)
+        editor = importlib.util.module_from_spec(spec)
+        sys.modules['fdfe'] = editor
+        spec.loader.exec_module(editor)
+    return editor
+
+
+fdfe = load_editor()
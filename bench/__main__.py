@@ -0,0 +1,94 @@
+"""Command line for the benchmarks and checks
+
+    python -m bench --verify-highlighting       incremental and Liberty BASIC highlighting
+    python -m bench --benchmark-tokens          token -> tag mapping and lexer lookup
+    python -m bench --benchmark-tags            tag application (needs a display)
+    python -m bench --benchmark-manifests       resource graph scans
+    python -m bench --benchmark-terminal        terminal reader CPU use
+    python -m bench --benchmark-startup [--budget-ms N]
+    python -m bench --benchmark [--sizes small,medium,large] [--out results.json]
+                                [--compare baseline.json]
+
+The editor script accepts the same flags and hands them over to main().
+"""
+import json
+import sys
+
+from bench.benchmarks import (
+    STARTUP_BUDGET_MS, benchmark_resource_graph, benchmark_startup, benchmark_tag_application,
+    benchmark_terminal, benchmark_token_tags, compare_benchmarks, run_benchmarks, startup_probe)
+from bench.corpus import BENCHMARK_SIZES
+from bench.verify import verify_incremental_highlighting, verify_liberty_basic
+
+
+def _option(argv, name):
+    """Value following `name` in argv, or None"""
+    if name in argv[:-1]:
+        return argv[argv.index(name) + 1]
+    return None
+
+
+def main(argv=None, started=None):
+    """Run what the flags in argv ask for and return the exit status
+
+    `started` is the editor script's perf_counter() mark for reaching __main__.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if '--startup-probe' in argv:
+        # Child side of --benchmark-startup
+        print(json.dumps(startup_probe(started)))
+        return 0
+    if '--benchmark-startup' in argv:
+        # Cold start timing: --budget-ms N (exits 1 if the window is slower than that)
+        results = benchmark_startup(budget_ms=float(_option(argv, '--budget-ms') or STARTUP_BUDGET_MS))
+        print(json.dumps(results, indent=2))
+        return 0 if results['within_budget'] else 1
+    if '--verify-highlighting' in argv:
+        # Headless check that incremental re-highlighting matches a full re-lex
+        failures = verify_incremental_highlighting()
+        for failure in failures:
+            print(failure)
+        print("Incremental highlighting: " + ("FAILED" if failures else "OK"))
+        basic_failures = verify_liberty_basic()
+        for failure in basic_failures:
+            print(failure)
+        print("Liberty BASIC highlighting: " + ("FAILED" if basic_failures else "OK"))
+        return 1 if failures or basic_failures else 0
+    if '--benchmark-tags' in argv:
+        print(json.dumps(benchmark_tag_application(), indent=2))
+        return 0
+    if '--benchmark-tokens' in argv:
+        results = benchmark_token_tags()
+        print(json.dumps(results, indent=2))
+        return 1 if results['mismatches'] else 0
+    if '--benchmark-manifests' in argv:
+        print(json.dumps(benchmark_resource_graph(), indent=2))
+        return 0
+    if '--benchmark-terminal' in argv:
+        print(json.dumps(benchmark_terminal(), indent=2))
+        return 0
+    if '--benchmark' in argv:
+        # Headless benchmark suite: --sizes small,medium,large --out results.json
+        # --compare baseline.json (exits 1 if anything got slower than the baseline)
+        sizes = (_option(argv, '--sizes') or 'small,medium').split(',')
+        results = run_benchmarks(sizes=[size for size in sizes if size in BENCHMARK_SIZES])
+        output = json.dumps(results, indent=2)
+        if _option(argv, '--out'):
+            with open(_option(argv, '--out'), 'w') as file:
+                file.write(output)
+        else:
+            print(output)
+        regressions = []
+        if _option(argv, '--compare'):
+            with open(_option(argv, '--compare')) as file:
+                regressions = compare_benchmarks(results, json.load(file))
+            for regression in regressions:
+                print("Regression: " + regression)
+            print(f"{len(regressions)} regression(s) against the baseline")
+        return 1 if regressions else 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
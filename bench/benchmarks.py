@@ -0,0 +1,434 @@
+"""Timings of the editor core: token tagging, tag application, the editor on synthetic
+files, start-up, the terminal and manifest scans"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import tkinter as tk
+from time import perf_counter
+
+from bench import fdfe
+from bench.corpus import BENCHMARK_CORPORA, BENCHMARK_SIZES, HIGHLIGHT_CORPUS
+
+# --benchmark-startup fails if the window takes longer than this to appear
+STARTUP_BUDGET_MS = 1000
+
+
+def _token_tag_by_name(ttype, value):
+    """The string-prefix mapping token_tag() used before TOKEN_TAGS
+
+    Kept as the baseline benchmark_token_tags() times and checks the table against.
+    """
+    tag = fdfe.LIBERTY_BASIC_TAGS.get(ttype)
+    if tag:
+        return tag
+    name = str(ttype)
+    if name == 'Token.Text' and value.isspace():
+        return None
+    if name.startswith('Token.Keyword'):
+        return 'token_keyword_namespace'
+    if name.startswith('Token.Name.Namespace'):
+        return 'token_name_namespace'
+    if name.startswith('Token.Name.Function'):
+        return 'function'
+    if name.startswith('Token.Name.Builtin'):
+        return 'token_keyword_namespace'
+    if name.startswith('Token.Literal.String'):
+        return 'token_string'
+    if name.startswith('Token.Comment'):
+        return 'token_comment'
+    if name.startswith('Token.Literal.Number'):  # was 'Token.Number', which never matched
+        return 'number'
+    if name == 'Token.Punctuation':
+        if value in '()':
+            return 'function2'
+        return 'token_name'
+    return None
+
+
+def benchmark_token_tags(copies=200, lookups=200):
+    """Tokens per second mapped to tags by string prefixes (the old way) and through TOKEN_TAGS
+
+    Tokens are the highlight corpus lexed once and repeated `copies` times. Also times
+    finding a lexer by file name through Pygments' registry against lexer_for_filename(),
+    and counts token types on which the two mappings disagree (there should be none).
+    """
+    from pygments.lexers import get_lexer_for_filename
+    from pygments.token import STANDARD_TYPES
+
+    tokens = []
+    for filename, text in HIGHLIGHT_CORPUS.items():
+        lexer = fdfe.lexer_for_filename(filename)
+        tokens.extend((ttype, value) for index, ttype, value in lexer.get_tokens_unprocessed(text))
+    checks = set(tokens) | {(ttype, value) for ttype in STANDARD_TYPES for value in ('x', '(', ' ', '.')}
+    results = {
+        'tokens': len(tokens) * copies,
+        'token_types': len({ttype for ttype, value in tokens}),
+        'mismatches': sum(fdfe.token_tag(ttype, value) != _token_tag_by_name(ttype, value)
+                          for ttype, value in checks),
+    }
+    tokens *= copies
+
+    def inline_lookup(ttype, value, tags=fdfe.TOKEN_TAGS):
+        tag = tags[ttype]
+        return fdfe.token_tag(ttype, value) if tag is fdfe.PARENTHESES else tag
+
+    for name, mapping in (('by_name', _token_tag_by_name), ('table', fdfe.token_tag)):
+        started = perf_counter()
+        for ttype, value in tokens:
+            mapping(ttype, value)
+        results[f'{name}_tokens_per_s'] = round(len(tokens) / (perf_counter() - started))
+    # What the lexing loop does: the lookup inline, no call unless it is punctuation
+    started = perf_counter()
+    tags = fdfe.TOKEN_TAGS
+    for ttype, value in tokens:
+        tag = tags[ttype]
+        if tag is fdfe.PARENTHESES:
+            tag = fdfe.token_tag(ttype, value)
+    results['inline_tokens_per_s'] = round(len(tokens) / (perf_counter() - started))
+
+    filenames = [filename for filename in HIGHLIGHT_CORPUS if not filename.endswith('.bas')]
+    for name, find in (('registry', get_lexer_for_filename), ('cached', fdfe.lexer_for_filename)):
+        started = perf_counter()
+        for number in range(lookups):
+            find(filenames[number % len(filenames)])
+        results[f'lexer_lookup_{name}_us'] = round((perf_counter() - started) / lookups * 1e6, 2)
+    return results
+
+
+def benchmark_tag_application(line_count=20000):
+    """Time tagging a large Lua buffer one token at a time against apply_tag_ranges()
+
+    Needs a display. Returns the Tcl commands sent to the text widget and the
+    seconds taken by each approach.
+    """
+    sample = HIGHLIGHT_CORPUS['client.lua']
+    text = sample * (line_count // sample.count('\n') + 1)
+    root = tk.Tk()
+    root.withdraw()
+    widget = tk.Text(root)
+    widget.insert("1.0", text)
+    content = widget.get("1.0", tk.END)
+    highlighter = fdfe.IncrementalHighlighter()
+    highlighter.reset('client.lua', fdfe.lexer_for_filename('client.lua'))
+    ranges = highlighter.relex(content, 1)[1]
+    line_index = fdfe.LineIndex(content)
+
+    # Count Tcl commands with the same proxy the editor uses for edit tracking
+    calls = [0]
+    orig = widget._w + "_orig"
+    widget.tk.call("rename", widget._w, orig)
+
+    def counting_dispatch(*args):
+        calls[0] += 1
+        return widget.tk.call((orig,) + args)
+    widget.tk.createcommand(widget._w, counting_dispatch)
+
+    def per_token():
+        for tag in fdfe.HIGHLIGHT_TAGS:
+            widget.tag_remove(tag, "1.0", tk.END)
+        for tag, offsets in ranges.items():
+            for first, last in zip(offsets[0::2], offsets[1::2]):
+                widget.tag_add(tag, f"1.0+{first}c", f"1.0+{last}c")
+
+    def batched():
+        fdfe.apply_tag_ranges(widget, line_index, 1, tk.END, ranges)
+
+    results = {'lines': content.count('\n'), 'ranges': sum(map(len, ranges.values())) // 2}
+    for name, run in (('per_token', per_token), ('batched', batched)):
+        for tag in fdfe.HIGHLIGHT_TAGS:
+            widget.tag_remove(tag, "1.0", tk.END)
+        calls[0] = 0
+        started = perf_counter()
+        run()
+        widget.update_idletasks()
+        results[name] = {'tcl_calls': calls[0], 'seconds': round(perf_counter() - started, 4)}
+    root.destroy()
+    return results
+
+
+def _highlighting_busy(editor):
+    highlighter = editor.highlighter
+    if (not editor.current_file or highlighter.filename != editor.current_file
+            or highlighter.lexer is None):
+        return False
+    return highlighter.pending or editor._lex_running or editor._highlight_job is not None
+
+
+def _settle(editor, timeout=120):
+    """Run the event loop until background highlighting has caught up"""
+    deadline = perf_counter() + timeout
+    editor.root.update()
+    while _highlighting_busy(editor) and perf_counter() < deadline:
+        editor.root.update()
+
+
+def _timings(samples):
+    samples = sorted(samples)
+    rank = lambda q: samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+    return round(rank(0.5) * 1000, 3), round(rank(0.95) * 1000, 3), round(samples[-1] * 1000, 3)
+
+
+def run_benchmarks(sizes=('small', 'medium'), edits=50, scrolls=30, finds=20, seed=1):
+    """Time the editor core on synthetic FiveM files with a withdrawn Tk root
+
+    For every corpus and size: loading the file, a full highlight, single-key edits,
+    page scrolls (with the gutter redraw), find-next and save. Returns a JSON-ready
+    dict; times are in milliseconds.
+    """
+    import platform
+    import random
+
+    root = tk.Tk()
+    root.withdraw()
+    editor = fdfe.CodeEditor(root)
+    root.update()
+    workdir = tempfile.mkdtemp(prefix='fdfe-bench-')
+    results = {}
+    try:
+        for size in sizes:
+            os.makedirs(os.path.join(workdir, size))
+            for name, generator, needle in BENCHMARK_CORPORA:
+                rng = random.Random(seed)
+                path = os.path.join(workdir, size, name)
+                with open(path, 'w', newline='') as file:
+                    file.write(generator(BENCHMARK_SIZES[size], rng))
+                case = results[f"{size}/{name}"] = {'bytes': os.path.getsize(path)}
+
+                started = perf_counter()
+                editor.load_file(path)
+                while editor._loader is not None:
+                    root.update()
+                case['load_ms'] = round((perf_counter() - started) * 1000, 3)
+                case['lines'] = editor._last_line()
+                _settle(editor)
+
+                started = perf_counter()
+                editor.highlighter.invalidate()
+                editor.highlight_syntax()
+                _settle(editor)
+                case['highlight_ms'] = round((perf_counter() - started) * 1000, 3)
+
+                samples = []
+                for _ in range(edits):
+                    line = rng.randint(1, case['lines'])
+                    started = perf_counter()
+                    editor.text_area.insert(f"{line}.0", "x")
+                    root.update()  # delivers <<Modified>> to the change scheduler
+                    editor.changes.flush()
+                    _settle(editor)
+                    samples.append(perf_counter() - started)
+                case['edit_p50_ms'], case['edit_p95_ms'], case['edit_max_ms'] = _timings(samples)
+
+                samples = []
+                editor.text_area.yview_moveto(0)
+                for _ in range(scrolls):
+                    started = perf_counter()
+                    editor.text_area.yview_scroll(1, "pages")
+                    root.update_idletasks()  # yscrollcommand redraws the gutter
+                    samples.append(perf_counter() - started)
+                case['scroll_p50_ms'], case['scroll_p95_ms'], case['scroll_max_ms'] = _timings(samples)
+
+                editor.show_find_dialog()
+                editor.find_window.withdraw()
+                editor.find_entry.insert(0, needle)
+                editor.text_area.mark_set(tk.INSERT, "1.0")
+                samples = []
+                for _ in range(finds):
+                    started = perf_counter()
+                    editor.find_next()
+                    samples.append(perf_counter() - started)
+                editor.find_window.destroy()
+                case['find_p50_ms'], case['find_p95_ms'], case['find_max_ms'] = _timings(samples)
+
+                editor.show_replace_dialog()
+                editor.replace_window.withdraw()
+                editor.find_entry.insert(0, needle)
+                editor.replace_entry.insert(0, needle.upper())
+                started = perf_counter()
+                case['replaced'] = editor.replace_all()
+                root.update()
+                editor.changes.flush()
+                _settle(editor)
+                case['replace_all_ms'] = round((perf_counter() - started) * 1000, 3)
+                editor.replace_window.destroy()
+
+                started = perf_counter()
+                editor.save_file()
+                while editor._saving:
+                    root.update()
+                case['save_ms'] = round((perf_counter() - started) * 1000, 3)
+    finally:
+        root.destroy()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'editor': fdfe.WindowName,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'tk': str(tk.TkVersion),
+            'sizes': list(sizes),
+        },
+        'results': results,
+    }
+
+
+def startup_probe(started=None):
+    """Child side of benchmark_startup(): perf_counter() marks for the start of __main__
+    (`started`, taken by the editor script), the window being drawn and the deferred
+    start-up work finishing
+
+    Without a display only the first mark is taken.
+    """
+    marks = {'main': started or perf_counter()}
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return marks
+    root.geometry("1200x800")
+    editor = fdfe.CodeEditor(root)
+    root.update()  # maps and draws the window
+    marks['shown'] = perf_counter()
+    deadline = perf_counter() + 30
+    while not editor.startup_ready.is_set() and perf_counter() < deadline:
+        root.update()
+        editor.startup_ready.wait(0.005)
+    marks['ready'] = perf_counter()
+    root.destroy()
+    return marks
+
+
+def benchmark_startup(runs=5, budget_ms=STARTUP_BUDGET_MS):
+    """Start the editor in fresh interpreters and time how long the window takes to appear
+
+    perf_counter() is a system-wide monotonic clock, so the child's marks can be
+    compared with the moment it was spawned. One more run under -X importtime lists
+    the slowest top-level imports. Without a display the budget applies to reaching
+    __main__ (interpreter start, compiling the script and its imports) instead.
+    """
+    script = os.path.abspath(fdfe.__file__)
+    samples = {'main': [], 'shown': [], 'ready': []}
+    for _ in range(runs):
+        started = perf_counter()
+        probe = subprocess.run([sys.executable, script, '--startup-probe'], capture_output=True,
+                               text=True, timeout=120, check=True)
+        marks = json.loads(probe.stdout.strip().splitlines()[-1])
+        for name, mark in marks.items():
+            samples[name].append(mark - started)
+
+    probe = subprocess.run([sys.executable, '-X', 'importtime', script, '--startup-probe'],
+                           capture_output=True, text=True, timeout=120)
+    imports = []
+    for line in probe.stderr.splitlines():
+        fields = line.split('|')
+        # "import time: self [us] | cumulative | name", nested imports indented under their parent
+        if len(fields) == 3 and fields[1].strip().isdigit() and not fields[2].startswith('  '):
+            imports.append((int(fields[1]), fields[2].strip()))
+    imports.sort(reverse=True)
+
+    results = {'runs': runs, 'budget_ms': budget_ms}
+    for name, key in (('main', 'to_main'), ('shown', 'to_window'), ('ready', 'to_ready')):
+        if samples[name]:
+            results[f'{key}_p50_ms'], results[f'{key}_p95_ms'], results[f'{key}_max_ms'] = _timings(samples[name])
+    measured = results.get('to_window_p50_ms', results['to_main_p50_ms'])
+    results['within_budget'] = measured <= budget_ms
+    results['import_ms'] = round(sum(cumulative for cumulative, name in imports) / 1000, 3)
+    results['slowest_imports'] = [{'module': name, 'cumulative_ms': round(cumulative / 1000, 3)}
+                                  for cumulative, name in imports[:10]]
+    return results
+
+
+def benchmark_terminal(lines_per_second=10000, seconds=3.0):
+    """Feed a TerminalSession coloured log lines at a fixed rate and measure our CPU use
+
+    The window side is simulated by taking the scrollback once per frame, so this runs
+    without a display; cpu_percent covers the reader thread and the frame loop.
+    """
+    flood = ("import sys, time\n"
+             "started, n = time.time(), 0\n"
+             f"while time.time() < started + {seconds}:\n"
+             f"    while n < (time.time() - started) * {lines_per_second}:\n"
+             "        n += 1\n"
+             "        print(f'\\x1b[32m[INFO]\\x1b[0m [resource{n % 50}] tick {n} \\x1b[1mok\\x1b[0m')\n"
+             "    sys.stdout.flush()\n"
+             "    time.sleep(0.005)\n")
+    session = fdfe.TerminalSession([sys.executable, '-c', flood])
+    cpu_started, started = sum(os.times()[:2]), perf_counter()
+    session.start()
+    frames = lines = 0
+    while not session.exited.is_set() or session.scrollback.chunks:
+        runs = session.scrollback.take()
+        lines += sum(text.count('\n') for text, tags in runs)
+        frames += 1
+        threading.Event().wait(fdfe.TERMINAL_FRAME_MS / 1000)
+    wall = perf_counter() - started
+    cpu = sum(os.times()[:2]) - cpu_started
+    return {
+        'lines': lines,
+        'dropped_chars': session.scrollback.dropped,
+        'frames': frames,
+        'wall_ms': round(wall * 1000, 3),
+        'lines_per_second': round(lines / wall),
+        'cpu_percent': round(cpu / wall * 100, 1),
+    }
+
+
+def benchmark_resource_graph(resource_count=500, seed=1):
+    """Time ResourceGraph scans of a synthetic resources tree, cold and then warm
+
+    Resources are spread over [category] folders and use globs, data_file entries,
+    '@resource/...' imports and dependencies the way real server trees do.
+    """
+    import random
+    rng = random.Random(seed)
+    workdir = tempfile.mkdtemp(prefix='fdfe-resources-')
+    try:
+        for number in range(resource_count):
+            folder = os.path.join(workdir, f"[category{number % 10}]", f"resource{number}")
+            for sub in ('client', 'server', 'data', 'stream'):
+                os.makedirs(os.path.join(folder, sub))
+            files = ['client/main.lua', 'client/menu.lua', 'server/main.lua', 'config.lua',
+                     'data/handling.meta', 'data/vehicles.meta', 'stream/car.yft', 'unused.lua']
+            for name in files:
+                with open(os.path.join(folder, name), 'w') as file:
+                    file.write("-- synthetic\n")
+            dependency = f"resource{rng.randrange(resource_count)}"
+            with open(os.path.join(folder, 'fxmanifest.lua'), 'w') as file:
+                file.write("fx_version 'cerulean'\ngame 'gta5'\nlua54 'yes'\n\n"
+                           "shared_scripts {\n    '@resource0/config.lua',\n    'config.lua'\n}\n"
+                           "client_scripts { 'client/*.lua' }\nserver_script 'server/**.lua'\n"
+                           "files { 'data/*.meta' }\n"
+                           "data_file 'HANDLING_FILE' 'data/handling.meta'\n"
+                           "data_file 'VEHICLE_METADATA_FILE' 'data/vehicles.meta'\n"
+                           f"dependencies {{ '/onesync', '{dependency}' }}\n")
+
+        graph = fdfe.ResourceGraph(workdir)
+        results = {'resources': resource_count}
+        for name in ('cold', 'warm'):
+            started = perf_counter()
+            graph.scan()
+            results[f"{name}_ms"] = round((perf_counter() - started) * 1000, 3)
+            results[f"{name}_parsed"] = graph.parsed
+        results['unreferenced'] = sum(len(report['unreferenced']) for report in graph.resources.values())
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare_benchmarks(results, baseline, threshold=0.2, floor_ms=1.0):
+    """List the timings that are more than `threshold` (and floor_ms) slower than the baseline"""
+    regressions = []
+    for case, metrics in results['results'].items():
+        previous = baseline.get('results', {}).get(case, {})
+        for metric, value in metrics.items():
+            old = previous.get(metric)
+            if not metric.endswith('_ms') or not isinstance(old, (int, float)):
+                continue
+            if value > old * (1 + threshold) and value - old > floor_ms:
+                regressions.append(f"{case} {metric}: {old:.2f} -> {value:.2f} ms "
+                                   f"(+{(value / old - 1) * 100 if old else 100:.0f}%)")
+    return regressions
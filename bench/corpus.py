@@ -0,0 +1,275 @@
+"""Text the checks and benchmarks run on: hand-written snippets and synthetic FiveM files"""
+
+
+# Snippets covering the multi-line constructs incremental highlighting has to get right
+HIGHLIGHT_CORPUS = {
+    'fxmanifest.lua': '''fx_version 'cerulean'
+game 'gta5'
+
+description [[
+    Multi-line description
+    for the resource
+]]
+
+client_scripts {
+    'client/*.lua'
+}
+server_script 'server.lua'
+files { 'data/handling.meta', 'data/vehicles.meta' }
+data_file 'HANDLING_FILE' 'data/handling.meta'
+''',
+    'client.lua': '''--[[
+    Block comment that spans
+    several lines
+]]
+local Config = {}
+Config.Text = [==[
+long string with ]] inside
+]==]
+
+RegisterNetEvent('garage:spawn')
+AddEventHandler('garage:spawn', function(model, coords)
+    -- single line comment
+    local hash = GetHashKey(model)
+    RequestModel(hash)
+    while not HasModelLoaded(hash) do
+        Citizen.Wait(0)
+    end
+    print(string.format("%s spawned", model))
+end)
+''',
+    'handling.xml': '''<?xml version="1.0" encoding="UTF-8"?>
+<CHandlingDataMgr>
+  <HandlingData>
+    <!-- tuned values,
+         do not edit by hand -->
+    <Item type="CHandlingData">
+      <handlingName>ADDER</handlingName>
+      <fMass value="1800.000000" />
+      <fInitialDragCoeff value="9.000000" />
+      <strModelFlags>440010</strModelFlags>
+    </Item>
+  </HandlingData>
+</CHandlingDataMgr>
+''',
+    'vehicles.xml': '''<CVehicleModelInfo__InitDataList>
+  <InitDatas>
+    <Item>
+      <modelName>adder</modelName>
+      <txdName>adder</txdName>
+      <![CDATA[ raw <data> that
+      spans lines ]]>
+    </Item>
+  </InitDatas>
+</CVehicleModelInfo__InitDataList>
+''',
+    'script.py': '''import os
+
+def build(path):
+    """Docstring spanning
+    two lines"""
+    return os.path.join(path, 'out')  # comment
+''',
+    'program.bas': '''nomainwin
+WindowWidth = 640
+open "Garage" for window as #main
+[spawn]
+    ' pick a model
+    name$ = "adder"
+    Print #main, name$; Len(name$)
+    IF total > 10.5 THEN GOSUB [spawn]
+    notice "Print 2 copies to #main [now]" ' then goto [spawn] at "10"
+    pRINT Total; gOTO
+    wait
+''',
+}
+
+
+# Fragments that open or close multi-line constructs, plus ordinary typing
+HIGHLIGHT_CORPUS_EDITS = (
+    '--[[', ']]', '[[', '[==[', ']==]', '<!--', '-->', '<![CDATA[', ']]>',
+    '"""', "'", '"', '\n', '\n    ', 'x', ' ', 'end\n', '#', '(',
+)
+
+
+def _repeat_blocks(line_count, rng, header, block, footer=''):
+    """Fill header + numbered copies of block + footer up to about line_count lines"""
+    parts = [header]
+    lines = header.count('\n') + footer.count('\n')
+    n = 0
+    while lines < line_count:
+        n += 1
+        text = block(n, rng)
+        parts.append(text)
+        lines += text.count('\n')
+    parts.append(footer)
+    return ''.join(parts)
+
+
+def synthetic_fxmanifest(line_count, rng):
+    header = ("fx_version 'cerulean'\ngame 'gta5'\n\nauthor 'Benchmark'\n"
+              "description 'Synthetic resource'\nversion '1.0.0'\n\n"
+              "shared_scripts {\n    '@ox_lib/init.lua',\n    'config.lua'\n}\n\n")
+    return _repeat_blocks(line_count, rng, header, lambda n, rng: (
+        f"client_script 'client/module_{n}.lua'\n"
+        f"server_script 'server/module_{n}.lua'\n"
+        f"files {{ 'data/handling_{n}.meta', 'data/vehicles_{n}.meta' }}\n"
+        f"data_file 'HANDLING_FILE' 'data/handling_{n}.meta'\n"
+        f"data_file 'VEHICLE_METADATA_FILE' 'data/vehicles_{n}.meta'\n"
+        f"-- vehicle pack {n}\n\n"))
+
+
+def synthetic_client_lua(line_count, rng):
+    return _repeat_blocks(line_count, rng, "local QBCore = exports['qb-core']:GetCoreObject()\n\n", lambda n, rng: (
+        f"local Config{n} = {{ enabled = true, distance = {rng.uniform(1, 50):.2f}, model = `adder` }}\n\n"
+        f"-- Handler {n}: react to the server\n"
+        f"RegisterNetEvent('bench:client:event{n}', function(data)\n"
+        f"    local ped = PlayerPedId()\n"
+        f"    local coords = GetEntityCoords(ped)\n"
+        f"    if #(coords - vector3({rng.uniform(-3000, 3000):.2f}, {rng.uniform(-3000, 3000):.2f}, "
+        f"{rng.uniform(0, 100):.2f})) < Config{n}.distance then\n"
+        f"        TriggerServerEvent('bench:server:reply{n}', data.id, \"reply {n}\")\n"
+        f"    end\n"
+        f"end)\n\n"
+        f"CreateThread(function()\n"
+        f"    while true do\n"
+        f"        Wait({rng.choice((0, 100, 500, 1000))})\n"
+        f"        --[[ vehicle check {n}\n"
+        f"             runs every tick ]]\n"
+        f"        local veh = GetVehiclePedIsIn(PlayerPedId(), false)\n"
+        f"        if veh ~= 0 and IsControlJustPressed(0, {rng.randint(1, 300)}) then\n"
+        f"            print(string.format(\"%s spawned\", veh))\n"
+        f"        end\n"
+        f"    end\n"
+        f"end)\n\n"))
+
+
+def synthetic_server_lua(line_count, rng):
+    return _repeat_blocks(line_count, rng, "local QBCore = exports['qb-core']:GetCoreObject()\n\n", lambda n, rng: (
+        f"RegisterCommand('bench{n}', function(source, args, raw)\n"
+        f"    local player = QBCore.Functions.GetPlayer(source)\n"
+        f"    if not player then return end\n"
+        f"    local amount = tonumber(args[1]) or {rng.randint(1, 5000)}\n"
+        f"    MySQL.insert('INSERT INTO bench_log (citizenid, amount) VALUES (?, ?)', "
+        f"{{ player.PlayerData.citizenid, amount }})\n"
+        f"    TriggerClientEvent('bench:client:event{n}', source, {{ id = {n}, amount = amount }})\n"
+        f"end, false)\n\n"
+        f"exports('GetBench{n}', function()\n"
+        f"    return {{ id = {n}, label = \"Bench {n}\", price = {rng.uniform(10, 1000):.2f} }}\n"
+        f"end)\n\n"))
+
+
+def synthetic_handling_meta(line_count, rng):
+    header = '<?xml version="1.0" encoding="UTF-8"?>\n<CHandlingDataMgr>\n  <HandlingData>\n'
+    footer = '  </HandlingData>\n</CHandlingDataMgr>\n'
+    return _repeat_blocks(line_count, rng, header, lambda n, rng: (
+        f'    <Item type="CHandlingData">\n'
+        f'      <handlingName>BENCH{n}</handlingName>\n'
+        f'      <fMass value="{rng.uniform(800, 3000):.6f}" />\n'
+        f'      <fInitialDragCoeff value="{rng.uniform(5, 12):.6f}" />\n'
+        f'      <vecCentreOfMassOffset x="0.000000" y="{rng.uniform(-0.2, 0.2):.6f}" z="0.000000" />\n'
+        f'      <vecInertiaMultiplier x="1.000000" y="1.000000" z="1.400000" />\n'
+        f'      <fDriveBiasFront value="{rng.choice((0.0, 0.2, 0.5, 1.0)):.6f}" />\n'
+        f'      <nInitialDriveGears value="{rng.randint(4, 7)}" />\n'
+        f'      <fInitialDriveForce value="{rng.uniform(0.2, 0.4):.6f}" />\n'
+        f'      <fInitialDriveMaxFlatVel value="{rng.uniform(140, 200):.6f}" />\n'
+        f'      <fBrakeForce value="{rng.uniform(0.5, 1.5):.6f}" />\n'
+        f'      <fSteeringLock value="{rng.uniform(30, 45):.6f}" />\n'
+        f'      <fTractionCurveMax value="{rng.uniform(2, 3):.6f}" />\n'
+        f'      <fSuspensionForce value="{rng.uniform(1.5, 3):.6f}" />\n'
+        f'      <fCollisionDamageMult value="1.000000" />\n'
+        f'      <strModelFlags>440010</strModelFlags>\n'
+        f'      <strHandlingFlags>20000</strHandlingFlags>\n'
+        f'      <SubHandlingData>\n'
+        f'        <Item type="NULL" />\n'
+        f'      </SubHandlingData>\n'
+        f'    </Item>\n'), footer)
+
+
+def synthetic_vehicles_meta(line_count, rng):
+    header = ('<?xml version="1.0" encoding="UTF-8"?>\n<CVehicleModelInfo__InitDataList>\n'
+              '  <residentTxd>vehshare</residentTxd>\n  <InitDatas>\n')
+    footer = '  </InitDatas>\n</CVehicleModelInfo__InitDataList>\n'
+    return _repeat_blocks(line_count, rng, header, lambda n, rng: (
+        f'    <Item>\n'
+        f'      <!-- vehicle {n} -->\n'
+        f'      <modelName>bench{n}</modelName>\n'
+        f'      <txdName>bench{n}</txdName>\n'
+        f'      <handlingId>BENCH{n}</handlingId>\n'
+        f'      <gameName>BENCH{n}</gameName>\n'
+        f'      <vehicleMakeName>BENCHMARK</vehicleMakeName>\n'
+        f'      <type>VEHICLE_TYPE_CAR</type>\n'
+        f'      <plateType>VPT_FRONT_AND_BACK_PLATES</plateType>\n'
+        f'      <vehicleClass>VC_{rng.choice(("SPORT", "SUPER", "SEDAN", "SUV"))}</vehicleClass>\n'
+        f'      <wheelScale value="{rng.uniform(0.2, 0.3):.6f}" />\n'
+        f'      <lodDistances content="float_array">\n'
+        f'        15.000000 30.000000 60.000000 120.000000 500.000000 500.000000\n'
+        f'      </lodDistances>\n'
+        f'      <flags>FLAG_SPORTS FLAG_RICH_CAR FLAG_HAS_LIVERY</flags>\n'
+        f'    </Item>\n'), footer)
+
+
+def synthetic_carvariations_meta(line_count, rng):
+    header = ('<?xml version="1.0" encoding="UTF-8"?>\n<CVehicleModelInfoVariation>\n'
+              '  <variationData>\n')
+    footer = '  </variationData>\n</CVehicleModelInfoVariation>\n'
+    return _repeat_blocks(line_count, rng, header, lambda n, rng: (
+        f'    <Item>\n'
+        f'      <modelName>bench{n}</modelName>\n'
+        f'      <colors>\n'
+        f'        <Item>\n'
+        f'          <indices content="char_array">\n'
+        f'            {rng.randint(0, 159)}\n'
+        f'            {rng.randint(0, 159)}\n'
+        f'          </indices>\n'
+        f'          <liveries>\n'
+        f'            <Item value="false" />\n'
+        f'          </liveries>\n'
+        f'        </Item>\n'
+        f'      </colors>\n'
+        f'      <kits>\n'
+        f'        <Item>{rng.randint(0, 999)}_bench{n}_modkit</Item>\n'
+        f'      </kits>\n'
+        f'      <lightSettings value="{rng.randint(0, 100)}" />\n'
+        f'      <sirenSettings value="0" />\n'
+        f'    </Item>\n'), footer)
+
+
+def synthetic_config_json(line_count, rng):
+    def item(n, rng):
+        return (f'  {{\n    "id": {n},\n    "name": "bench_{n}",\n    "label": "Bench item {n}",\n'
+                f'    "price": {rng.uniform(1, 10000):.2f},\n    "enabled": {rng.choice(("true", "false"))},\n'
+                f'    "coords": {{ "x": {rng.uniform(-3000, 3000):.2f}, "y": {rng.uniform(-3000, 3000):.2f}, '
+                f'"z": {rng.uniform(0, 100):.2f} }},\n    "jobs": ["police", "ambulance", "mechanic"]\n  }},\n')
+    text = _repeat_blocks(line_count, rng, '[\n', item)
+    return text[:-2] + '\n]\n'
+
+
+def synthetic_program_bas(line_count, rng):
+    header = "nomainwin\nWindowWidth = 640\nWindowHeight = 480\nopen \"Benchmark\" for window as #main\n\n"
+    return _repeat_blocks(line_count, rng, header, lambda n, rng: (
+        f"[routine{n}]\n"
+        f"    ' routine {n}\n"
+        f"    name$ = \"Bench {n}\"\n"
+        f"    for i = 1 to {rng.randint(2, 50)}\n"
+        f"        total = total + i * {rng.randint(1, 9)}\n"
+        f"    next i\n"
+        f"    print #main, name$; total\n"
+        f"    if total > {rng.randint(100, 1000)} then gosub [routine{max(1, n - 1)}]\n"
+        f"    return\n\n"))
+
+
+# Benchmark corpora: file name, generator and a word for find-next to look for
+BENCHMARK_CORPORA = (
+    ('fxmanifest.lua', synthetic_fxmanifest, 'data_file'),
+    ('client.lua', synthetic_client_lua, 'TriggerServerEvent'),
+    ('server.lua', synthetic_server_lua, 'MySQL'),
+    ('handling.meta', synthetic_handling_meta, 'fSteeringLock'),
+    ('vehicles.meta', synthetic_vehicles_meta, 'handlingId'),
+    ('carvariations.meta', synthetic_carvariations_meta, 'modkit'),
+    ('config.json', synthetic_config_json, '"price"'),
+    ('program.bas', synthetic_program_bas, 'gosub'),
+)
+
+
+BENCHMARK_SIZES = {'small': 1000, 'medium': 20000, 'large': 100000}  # lines per file
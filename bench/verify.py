@@ -0,0 +1,170 @@
+"""Headless checks of the highlighters against straightforward re-implementations"""
+import re
+
+from bench import fdfe
+from bench.corpus import HIGHLIGHT_CORPUS, HIGHLIGHT_CORPUS_EDITS, synthetic_program_bas
+
+
+def verify_incremental_highlighting(rounds=150, seed=1):
+    """Apply random edits to the corpus and compare incremental highlighting with a full re-lex
+
+    Also checks that TkRangeFormatter run through Pygments' highlight() collects the
+    same ranges. Returns a list of failure descriptions (empty when every pass matched).
+    """
+    import random
+    from pygments import highlight
+    rng = random.Random(seed)
+    failures = []
+
+    def full_relex(text, filename):
+        highlighter = fdfe.IncrementalHighlighter()
+        highlighter.reset(filename, fdfe.lexer_for_filename(filename))
+        return highlighter.relex(text, 1)[1], highlighter
+
+    def tag_map(text, ranges, base=0, tags=None):
+        tags = tags if tags is not None else [None] * len(text)
+        for tag, offsets in ranges.items():
+            for first, last in zip(offsets[0::2], offsets[1::2]):
+                tags[base + first:base + last] = [tag] * (last - first)
+        return tags
+
+    for filename, text in HIGHLIGHT_CORPUS.items():
+        # Mirror what the text widget does: tags move with the text and a pass
+        # only rewrites the region it re-lexed
+        ranges, highlighter = full_relex(text, filename)
+        formatter = fdfe.TkRangeFormatter()
+        highlight(text, highlighter.lexer, formatter)
+        if formatter.ranges != ranges:
+            failures.append(f"{filename}: highlight() with TkRangeFormatter differs from the highlighter")
+        highlighter.WINDOW_MARGIN = 2
+        tags = tag_map(text, ranges)
+        for step in range(rounds):
+            line_of = lambda offset: text.count('\n', 0, offset) + 1
+            # A pass lexed off the main thread before an edit must not be committed after it
+            stale = highlighter.lex(highlighter.snapshot(copy=True), text, 1) if step % 10 == 0 else None
+            if rng.random() < 0.6:
+                offset = rng.randrange(len(text))
+                fragment = rng.choice(HIGHLIGHT_CORPUS_EDITS)
+                highlighter.note_insert(line_of(offset), fragment)
+                text = text[:offset] + fragment + text[offset:]
+                tags[offset:offset] = [None] * len(fragment)
+            else:
+                first = rng.randrange(len(text) - 1)
+                last = min(first + rng.randint(1, 8), len(text) - 1)
+                highlighter.note_delete(line_of(first), line_of(last))
+                text = text[:first] + text[last:]
+                del tags[first:last]
+            if stale is not None and highlighter.commit(stale) is not None:
+                failures.append(f"{filename}: a stale pass was committed after edit {step}")
+                break
+
+            # Alternate between single passes, passes cut short by their deadline
+            # and passes over small windows, as the editor's idle-time slices do;
+            # now and then the next edit lands before the slices have caught up
+            line_starts = [0] + [i + 1 for i, c in enumerate(text) if c == '\n']
+            slices = 1 if step % 7 == 4 else None
+            while slices != 0:
+                start = highlighter.restart_line()
+                if start is None:
+                    break
+                if slices:
+                    slices -= 1
+                base = line_starts[start - 1]
+                result = None
+                if step % 3 == 2 and start + 6 < len(line_starts):
+                    result = highlighter.relex(text[base:line_starts[start + 5]], start, partial=True)
+                if result is None:
+                    result = highlighter.relex(text[base:], start, 0.0 if step % 3 == 1 else None)
+                stop, ranges = result
+                end = line_starts[stop - 1] if stop else len(text)
+                tags[base:end] = [None] * (end - base)
+                tag_map(text, ranges, base, tags)
+            if highlighter.pending:
+                continue
+
+            expected_ranges, expected = full_relex(text, filename)
+            if tags != tag_map(text, expected_ranges):
+                failures.append(f"{filename}: tags differ from a full re-lex after edit {step}")
+                break
+            # Checkpoints may legitimately differ (a block can be one regex match or a
+            # pushed state), but every line must be accounted for
+            if (len(highlighter.line_states) != len(expected.line_states)
+                    or highlighter.line_hashes != expected.line_hashes):
+                failures.append(f"{filename}: line checkpoints out of step after edit {step}")
+                break
+    return failures
+
+
+# The Liberty BASIC table the editor shipped with (CodeEditor.syntax_patterns['.bas']),
+# frozen here as the reference the single-pass lexer is checked against. Every rule was
+# run case-sensitively over the whole text and tagged pattern_type.rstrip('s').
+BASELINE_LIBERTY_BASIC_PATTERNS = {
+    'variables': r'[A-Za-z]+\$',
+    'categories': r'\[.*?\]',
+    'handles': r'#\w+',
+    'keywords': r'\b(bmpbutton|BMPBUTTON|MENU|menu|textbox|TEXTBOX|CallDLL|loadbmp|LOADBMP|WindowWidth|WindowHeight|UpperLeftX|UpperLeftY|timer|TIMER|WAIT|wait|Wait|PRINT|print|Print|INPUT|input|Input|IF|if|If|THEN|then|Then|ELSE|else|Else|END|end|End|FOR|for|For|TO|to|To|NEXT|next|Next|GOTO|goto|Goto|GOSUB|gosub|Gosub|RETURN|return|Return|DIM|dim|Dim|LET|let|Let|REM|rem|Rem|OPEN|open|Open|CLOSE|close|Close|READ|read|Read|DATA|data|Data|RESTORE|restore|Restore|CLS|cls|Cls|LOCATE|locate|Locate|COLOR|color|Color|AS|as|As)\b',
+    'functions': r'[A-Za-z_][A-Za-z0-9_]*(?=\s*\()',
+    'strings': r'\".*?\"',
+    'comments': r'\'.*$',
+    'numbers': r'\b\d+\.?\d*\b'
+}
+
+# Where the single-pass lexer is meant to differ from that table
+LIBERTY_BASIC_DIFFERENCES = (
+    'labels are tagged category, not categorie',
+    'keywords match in any letter case',
+    'nothing is tagged on top of a string or comment',
+)
+
+
+def baseline_liberty_basic_tags(text):
+    """The set of tag names the old finditer-per-rule highlighting gave each character"""
+    tags = [set() for _ in text]
+    for pattern_type, pattern in BASELINE_LIBERTY_BASIC_PATTERNS.items():
+        for match in re.finditer(pattern, text, re.MULTILINE):
+            for offset in range(match.start(), match.end()):
+                tags[offset].add(pattern_type.rstrip('s'))
+    return tags
+
+
+def verify_liberty_basic(samples=None):
+    """Check the single-pass Liberty BASIC lexer against the baseline's per-rule tagging
+
+    Each character's old tags are adjusted for LIBERTY_BASIC_DIFFERENCES, in order. Where
+    that leaves no tag the new lexer must give none; otherwise it must give one of them
+    (the old rules could overlap). Every listed difference must also show up in the
+    samples, so none of them goes unchecked. Returns failure descriptions.
+    """
+    import random
+    samples = samples or [HIGHLIGHT_CORPUS['program.bas'], synthetic_program_bas(300, random.Random(1))]
+    keywords = BASELINE_LIBERTY_BASIC_PATTERNS['keywords']
+    seen = set()
+    failures = []
+    for number, text in enumerate(samples, 1):
+        old = baseline_liberty_basic_tags(text)
+        for match in re.finditer(keywords, text, re.IGNORECASE):
+            for offset in range(match.start(), match.end()):
+                if 'keyword' not in old[offset]:
+                    seen.add(LIBERTY_BASIC_DIFFERENCES[1])
+                    old[offset].add('keyword')
+        for tags in old:
+            if 'categorie' in tags:
+                seen.add(LIBERTY_BASIC_DIFFERENCES[0])
+                tags.discard('categorie')
+                tags.add('category')
+            inside = tags & {'string', 'comment'}
+            if inside and inside != tags:
+                seen.add(LIBERTY_BASIC_DIFFERENCES[2])
+                tags &= inside
+        new = [None] * len(text)
+        for index, ttype, value in fdfe.liberty_basic_lexer().get_tokens_unprocessed(text):
+            new[index:index + len(value)] = [fdfe.token_tag(ttype, value)] * len(value)
+        for offset, (tags, tag) in enumerate(zip(old, new)):
+            if (tag not in tags) if tags else tag is not None:
+                line = text.count('\n', 0, offset) + 1
+                failures.append(f"sample {number}, line {line}: {tag} where the old tagging had {sorted(tags)}")
+                break
+    for difference in LIBERTY_BASIC_DIFFERENCES:
+        if difference not in seen:
+            failures.append(f"no sample exercises the change: {difference}")
+    return failures